@@ -0,0 +1,189 @@
+import io
+import queue
+import threading
+import time
+from sqlalchemy import text
+
+action_columns = ["policy_id", "employee_id", "data_id", "operation", "time", "new_data", "modified_column"]
+
+
+class AuditLogWriter:
+    """
+    Buffers action_history rows in a bounded queue and writes them in batches from a background thread.
+
+    Rows are the same dictionaries init.log_action() builds. A batch is written when it reaches
+    flush_size rows, when flush_interval seconds have passed since the last write, or when flush()
+    or close() is called. log() blocks while the queue is full, so a slow database slows the callers
+    down instead of growing memory.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - flush_size (int): Maximum number of rows written per batch. Default is 500.
+    - flush_interval (float): Maximum number of seconds a row waits in the buffer. Default is 1.0.
+    - max_queue (int): Maximum number of rows waiting in the queue before log() blocks. Default is 10000.
+    - method (str): 'values' for a multi-row INSERT ... VALUES or 'copy' for COPY FROM STDIN. Default is 'values'.
+    """
+    _stop = object()
+
+    def __init__(self, engine, flush_size=500, flush_interval=1.0, max_queue=10000, method='values'):
+        if method not in ('values', 'copy'):
+            raise ValueError(f"Unknown flush method '{method}', expected 'values' or 'copy'")
+        self.engine = engine
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.rows_written = 0
+        self.batches_written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def log(self, action_data, timeout=None):
+        """
+        Queue one action_history row. Blocks while the queue is full.
+
+        Parameters:
+        - action_data (dict): Row with the keys in action_columns.
+        - timeout (float, optional): Seconds to wait for room in the queue before raising queue.Full. Waits forever if None.
+
+        Returns:
+        None
+        """
+        self._check()
+        if self._closed:
+            raise RuntimeError('AuditLogWriter is closed')
+        self._queue.put(action_data, timeout=timeout)
+
+    def log_many(self, actions, timeout=None):
+        """
+        Queue several action_history rows.
+
+        Parameters:
+        - actions (list of dict): Rows with the keys in action_columns.
+        - timeout (float, optional): Seconds to wait for room in the queue for each row.
+
+        Returns:
+        None
+        """
+        for action_data in actions:
+            self.log(action_data, timeout=timeout)
+
+    def flush(self):
+        """
+        Block until every row queued before this call has been committed.
+
+        Returns:
+        None
+        """
+        self._check()
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                break
+        self._check()
+
+    def close(self):
+        """
+        Write any buffered rows and stop the background thread. Safe to call more than once.
+
+        Returns:
+        None
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(self._stop)
+            self._thread.join()
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('AuditLogWriter failed to write a batch') from error
+
+    def _run(self):
+        batch = []
+        waiters = []
+        last_write = time.monotonic()
+        while True:
+            timeout = max(0, self.flush_interval - (time.monotonic() - last_write))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stop = item is self._stop
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None and not stop:
+                batch.append(item)
+
+            due = time.monotonic() - last_write >= self.flush_interval
+            if batch and (len(batch) >= self.flush_size or due or waiters or stop):
+                try:
+                    self._write(batch)
+                except Exception as error:
+                    self._error = error
+                batch = []
+                last_write = time.monotonic()
+            elif due:
+                last_write = time.monotonic()
+
+            for done in waiters:
+                done.set()
+            waiters = []
+            if stop:
+                return
+
+    def _write(self, batch):
+        with self.engine.begin() as connection:
+            if self.method == 'copy':
+                buffer = io.StringIO()
+                for action_data in batch:
+                    buffer.write('\t'.join(copy_value(action_data[key]) for key in action_columns) + '\n')
+                buffer.seek(0)
+                cursor = connection.connection.cursor()
+                cursor.copy_expert('COPY action_history (policy_id, employee_id, data_id, operation, time, new_data, column_modified) FROM STDIN', buffer)
+            else:
+                params = {}
+                rows = []
+                for i, action_data in enumerate(batch):
+                    rows.append('(' + ', '.join(f':{key}_{i}' for key in action_columns) + ')')
+                    params.update({f'{key}_{i}': action_data[key] for key in action_columns})
+                connection.execute(text(f"""
+                    INSERT INTO "action_history" (policy_id, employee_id, data_id, operation, time, new_data, column_modified)
+                    VALUES {', '.join(rows)}
+                """), params)
+        self.rows_written += len(batch)
+        self.batches_written += 1
+
+
+def copy_value(value):
+    """
+    Format a value for COPY's text format, matching how psycopg2 would send it in an INSERT.
+
+    Parameters:
+    - value (any): The value to format.
+
+    Returns:
+    str: The escaped value, or \\N for NULL.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, bytes):
+        # bytea hex input, with the backslash escaped for COPY
+        return '\\\\x' + value.hex()
+    value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
@@ -0,0 +1,371 @@
+"""
+Headless benchmark runner.
+
+    python bench.py list
+    python bench.py run data_size --seed 344323422 --iter 10 --warmup 2 --out results/data_size.json
+    python bench.py run batch --param total_app=20000 --param num_deletes=5000
+    python bench.py run history --fixtures template
+    python bench.py run set_batch --isolate
+    python bench.py run history --param partitioning=hash --param partitions=16 --param indexed=true
+    python bench.py compare results/old.json results/new.json --threshold 0.1
+
+Every run writes a JSON file with the scenario, its parameters, the seed and, for every point of
+the sweep, the raw samples and their statistics, plus a PNG plot next to it. compare exits with
+status 1 when a point got slower than the threshold allows, so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+import matplotlib
+matplotlib.use('Agg')           # no display needed, plots are saved as PNG
+import matplotlib.pyplot as plt
+import numpy as np
+import init as db
+import test
+from fixtures import FixtureCache
+from instrument import SQLInstrument
+from snapshot import TableSnapshot
+from storage import StorageProbe
+
+
+class Points:
+    """
+    Collects the samples of every point of a sweep, the per-phase SQL breakdown if an instrument is
+    attached, the storage footprint if a probe is attached and the restore times if a snapshot is attached.
+
+    Parameters:
+    - instrument (SQLInstrument, optional): Instrument whose iterations are summarized per point.
+    - probe (StorageProbe, optional): Probe whose measurements are summarized per point.
+    - fixtures (FixtureCache, optional): Cache the scenarios restore their databases from.
+    - snapshot (TableSnapshot, optional): Snapshot restored before every timed iteration.
+    """
+
+    def __init__(self, instrument=None, probe=None, fixtures=None, snapshot=None):
+        self.instrument = instrument
+        self.probe = probe
+        self.fixtures = fixtures
+        self.snapshot = snapshot
+        self.points = {}
+
+    def samples(self, x):
+        if self.instrument is not None:
+            self.instrument.reset()
+        if self.probe is not None:
+            self.probe.reset()
+        if self.snapshot is not None:
+            self.snapshot.reset()
+        return self.points.setdefault(x, {"x": x, "samples": []})['samples']
+
+    def done(self, x, per=1):
+        if self.probe is not None:
+            self.points[x]['storage'] = self.probe.summary(per=per)
+        if self.snapshot is not None:
+            self.points[x]['restore'] = self.snapshot.summary()
+        if self.instrument is not None:
+            self.points[x]['phases'] = self.instrument.summary()
+            self.points[x]['plans'] = [{"phase": p['phase'], "plan": p['plan']} for p in self.instrument.plans[:5]]
+
+
+def history_options(params):
+    # action_history set up shared by the column erasure scenarios
+    return {"partitioning": db.HistoryPartitioning(params['partitioning']),
+            "partitions": params['partitions'],
+            "indexes": db.default_indexes if params['indexed'] else None}
+
+
+def data_size(engine, params, seed, num_iter, warmup, points):
+    step_size = params['total_app'] // params['num_steps']
+    for size in range(step_size, params['total_app'] + 1, step_size):
+        test.timed_test(size, params['hist_size'], num_iter, params['vacuum'], engine, seed=seed, warmup=warmup, **history_options(params),
+                        samples=points.samples(size), instrument=points.instrument, probe=points.probe, fixtures=points.fixtures,
+                        snapshot=points.snapshot)
+        points.done(size)
+
+
+def history(engine, params, seed, num_iter, warmup, points):
+    step = int(params['total_app'] * params['hist_inc'])
+    for n in range(1, params['num_steps'] + 1):
+        x = params['total_app'] + step * n
+        test.timed_test(params['total_app'], params['hist_inc'] * n, num_iter, params['vacuum'], engine, seed=seed, warmup=warmup, **history_options(params),
+                        samples=points.samples(x), instrument=points.instrument, probe=points.probe, fixtures=points.fixtures,
+                        snapshot=points.snapshot)
+        points.done(x)
+
+
+def batch_sweep(mode):
+    def run(engine, params, seed, num_iter, warmup, points):
+        step_size = params['num_deletes'] // params['num_steps']
+        selected_ids = test.batch_setup(params['total_app'], params['hist_size'], params['num_deletes'], engine, num_iter=num_iter, seed=seed,
+                                       fixtures=points.fixtures)
+        for size in range(step_size, params['num_deletes'] + 1, step_size):
+            test.batch_timed_test(num_iter, mode, selected_ids[:size], engine, warmup=warmup,
+                                  samples=points.samples(size), instrument=points.instrument, probe=points.probe,
+                                  snapshot=points.snapshot)
+            points.done(size, per=size)
+    return run
+
+
+def row_batch(engine, params, seed, num_iter, warmup, points):
+    step_size = params['num_deletes'] // params['num_steps']
+    selected_ids = test.batch_setup(params['total_app'], params['hist_size'], params['num_deletes'], engine, num_iter=num_iter, seed=seed,
+                                    indexes=db.default_indexes if params['indexed'] else None, fixtures=points.fixtures)
+    snapshot = points.snapshot if points.snapshot is not None else TableSnapshot(engine)
+    for size in range(step_size, params['num_deletes'] + 1, step_size):
+        test.row_batch_timed_test(num_iter, params['bulk'], selected_ids[:size], engine, chunk_size=params['chunk_size'], warmup=warmup,
+                                  samples=points.samples(size), instrument=points.instrument, probe=points.probe, snapshot=snapshot)
+        points.done(size, per=size)
+
+
+# name -> (function, default parameters, x axis label, unit the samples are plotted in)
+scenarios = {
+    "data_size": (data_size, {"total_app": 20000, "hist_size": .5, "num_steps": 4, "vacuum": True, "partitioning": 'none', "partitions": 8, "indexed": False},
+                  'Number of Applicants', 'ms'),
+    "history": (history, {"total_app": 2000, "hist_inc": 1, "num_steps": 4, "vacuum": True, "partitioning": 'none', "partitions": 8, "indexed": False},
+                'History Size', 'ms'),
+    "batch": (batch_sweep(db.BatchMode.single_query), {"total_app": 20000, "hist_size": 1, "num_deletes": 5000, "num_steps": 5}, 'Number of Deletions', 's'),
+    "sequential_batch": (batch_sweep(db.BatchMode.sequential), {"total_app": 5000, "hist_size": 1, "num_deletes": 500, "num_steps": 5}, 'Number of Deletions', 's'),
+    "set_batch": (batch_sweep(db.BatchMode.set_based), {"total_app": 20000, "hist_size": 1, "num_deletes": 5000, "num_steps": 5}, 'Number of Deletions', 's'),
+    "row_batch": (row_batch, {"total_app": 20000, "hist_size": 1, "num_deletes": 5000, "num_steps": 5, "bulk": True, "chunk_size": 1000, "indexed": True},
+                  'Number of Deletions', 's'),
+}
+
+
+def stats(samples):
+    """
+    Summary statistics of a list of timings.
+
+    Parameters:
+    - samples (list): Times in seconds.
+
+    Returns:
+    dict: n, mean, stddev (sample), min, p50, p95, p99 and max, in seconds.
+    """
+    x = np.array(samples, dtype=float)
+    if len(x) == 0:
+        return {"n": 0}
+    return {"n": len(x),
+            "mean": float(x.mean()),
+            "stddev": float(x.std(ddof=1)) if len(x) > 1 else 0.0,
+            "min": float(x.min()),
+            "p50": float(np.percentile(x, 50)),
+            "p95": float(np.percentile(x, 95)),
+            "p99": float(np.percentile(x, 99)),
+            "max": float(x.max())}
+
+
+def run(name, engine, params=None, seed=344323422, num_iter=5, warmup=1, out=None, png=None, instrument=None, probe=None, fixtures=None, snapshot=None):
+    """
+    Run a scenario and write its results.
+
+    Parameters:
+    - name (str): A key of scenarios.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - params (dict, optional): Overrides for the scenario's default parameters.
+    - seed (int): Seed for random number generation. Default is 344323422.
+    - num_iter (int): Timed iterations per point. Default is 5.
+    - warmup (int): Untimed iterations per point. Default is 1.
+    - out (str, optional): JSON file to write. Defaults to results/<name>-<timestamp>.json.
+    - png (str, optional): Plot to write. Defaults to the JSON path with a .png extension.
+    - instrument (SQLInstrument, optional): Attach the per-phase SQL breakdown (and plans) of every point.
+    - probe (StorageProbe, optional): Attach bytes and WAL per erasure of every point.
+    - fixtures (FixtureCache, optional): Restore the databases of the scenario from this cache when they were built before.
+    - snapshot (TableSnapshot, optional): Restore the erasure tables before every timed iteration and attach the restore times of every point.
+
+    Returns:
+    dict: The results that were written.
+    """
+    if name not in scenarios:
+        raise ValueError(f"Unknown scenario '{name}', expected one of {list(scenarios)}")
+    function, defaults, x_label, unit = scenarios[name]
+    params = {**defaults, **(params or {})}
+    points = Points(instrument, probe, fixtures, snapshot)
+
+    started = datetime.now()
+    s_time = time.perf_counter()
+    if instrument is not None:
+        instrument.attach()
+    try:
+        function(engine, params, seed, num_iter, warmup, points)
+    finally:
+        if instrument is not None:
+            instrument.detach()
+    elapsed = time.perf_counter() - s_time
+
+    results = {"scenario": name,
+               "params": params,
+               "seed": seed,
+               "num_iter": num_iter,
+               "warmup": warmup,
+               "x_label": x_label,
+               "unit": unit,
+               "started": started.isoformat(),
+               "elapsed": elapsed,
+               "python": platform.python_version(),
+               # timing settings; compare() refuses results whose settings differ
+               "instrument": instrument is not None,
+               "explain": [pattern.pattern for pattern in instrument.explain] if instrument is not None else [],
+               "fixtures": {"method": fixtures.method, "hits": fixtures.hits, "misses": fixtures.misses} if fixtures is not None else None,
+               "points": [{**point, "stats": stats(point['samples'])} for point in points.points.values()]}
+
+    out = out or os.path.join('results', f'{name}-{started.strftime("%Y%m%d-%H%M%S")}.json')
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w') as file:
+        json.dump(results, file, indent=2)
+    plot(results, png or os.path.splitext(out)[0] + '.png')
+    print(f'Wrote {out}')
+    return results
+
+
+def plot(results, path):
+    """
+    Save the mean of every point with stddev error bars and the p95 as a PNG. If storage was
+    recorded, bytes and WAL per erasure are plotted in a second panel next to it.
+
+    Parameters:
+    - results (dict): Results from run().
+    - path (str): PNG file to write.
+
+    Returns:
+    None
+    """
+    scale = 1000 if results['unit'] == 'ms' else 1
+    points = [p for p in results['points'] if p['stats']['n']]
+    x = [p['x'] for p in points]
+    storage = [p for p in points if p.get('storage')]
+    figure, axes = plt.subplots(1, 2 if storage else 1, figsize=(12 if storage else 6.4, 4.8), squeeze=False)
+    latency = axes[0][0]
+    latency.errorbar(x, [p['stats']['mean'] * scale for p in points], yerr=[p['stats']['stddev'] * scale for p in points],
+                     marker='o', capsize=3, label='mean')
+    latency.plot(x, [p['stats']['p95'] * scale for p in points], marker='x', linestyle='--', label='p95')
+    latency.set_title(f'{results["scenario"]} (seed {results["seed"]}, {results["num_iter"]} iterations)')
+    latency.set_xlabel(results['x_label'])
+    latency.set_ylabel(f'Time ({results["unit"]})')
+    latency.legend()
+    latency.grid(True)
+    if storage:
+        footprint = axes[0][1]
+        footprint.plot([p['x'] for p in storage], [p['storage']['wal_bytes'] / 1024 for p in storage], marker='o', label='WAL')
+        footprint.plot([p['x'] for p in storage], [p['storage']['total_bytes'] / 1024 for p in storage], marker='o', label='table size change')
+        footprint.set_title('Storage per erasure')
+        footprint.set_xlabel(results['x_label'])
+        footprint.set_ylabel('KiB per erasure')
+        footprint.legend()
+        footprint.grid(True)
+    figure.tight_layout()
+    figure.savefig(path)
+    plt.close(figure)
+
+
+def compare(old_path, new_path, threshold=0.1, metric='mean'):
+    """
+    Compare two result files point by point and flag regressions.
+
+    A point regressed when the new value of metric is more than threshold (relative) above the old
+    one and the difference is larger than the old and new stddev combined, so noise alone does not
+    fail a comparison. Results recorded with different instrument or explain settings are not
+    compared: capturing plans re-runs statements and warms the cache, so their times differ.
+
+    Parameters:
+    - old_path (str): The baseline results.
+    - new_path (str): The results to check.
+    - threshold (float): Allowed relative slowdown. Default is 0.1 (10%).
+    - metric (str): Statistic to compare, e.g. 'mean', 'p50' or 'p95'. Default is 'mean'.
+
+    Returns:
+    list: A dict per point present in both files with x, old, new, ratio and regressed.
+    """
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    for key, default in (('instrument', False), ('explain', [])):
+        if old.get(key, default) != new.get(key, default):
+            raise ValueError(f"Cannot compare results with different {key} settings ({old.get(key, default)} vs {new.get(key, default)})")
+    if old['scenario'] != new['scenario']:
+        print(f"Warning: comparing scenario {old['scenario']} with {new['scenario']}")
+    for key in sorted(set(old['params']) | set(new['params'])):
+        if old['params'].get(key) != new['params'].get(key):
+            print(f"Warning: {key} differs ({old['params'].get(key)} vs {new['params'].get(key)})")
+    if old['seed'] != new['seed']:
+        print(f"Warning: seed differs ({old['seed']} vs {new['seed']})")
+
+    old_points = {p['x']: p['stats'] for p in old['points']}
+    rows = []
+    for point in new['points']:
+        before = old_points.get(point['x'])
+        after = point['stats']
+        if not before or not before.get('n') or not after.get('n'):
+            continue
+        ratio = after[metric] / before[metric] if before[metric] else float('inf')
+        noise = before['stddev'] + after['stddev']
+        regressed = ratio > 1 + threshold and after[metric] - before[metric] > noise
+        rows.append({"x": point['x'], "old": before[metric], "new": after[metric], "ratio": ratio, "regressed": regressed})
+        print(f"{old['x_label']} {point['x']:>10}: {before[metric]:.6f}s -> {after[metric]:.6f}s ({(ratio - 1) * 100:+.1f}%)"
+              f"{'  REGRESSION' if regressed else ''}")
+    return rows
+
+
+def parse_value(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    return value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run benchmark scenarios headless and compare their results.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list the scenarios and their default parameters')
+    run_parser = commands.add_parser('run', help='run a scenario')
+    run_parser.add_argument('scenario', choices=list(scenarios))
+    run_parser.add_argument('--seed', type=int, default=344323422)
+    run_parser.add_argument('--iter', type=int, default=5, help='timed iterations per point')
+    run_parser.add_argument('--warmup', type=int, default=1, help='untimed iterations per point')
+    run_parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE', help='override a scenario parameter')
+    run_parser.add_argument('--out', help='JSON file to write')
+    run_parser.add_argument('--png', help='PNG file to write')
+    run_parser.add_argument('--instrument', action='store_true', help='record the per-phase SQL breakdown of every iteration')
+    run_parser.add_argument('--storage', action='store_true', help='record table sizes, dead tuples and WAL around every iteration (not with --explain)')
+    run_parser.add_argument('--isolate', action='store_true', help='restore the erasure tables before every timed iteration')
+    run_parser.add_argument('--fixtures', choices=['template', 'dump'], help='restore the populated databases from cached fixtures')
+    run_parser.add_argument('--fixture-dir', default='.fixtures', help='directory of the fixture index and dumps')
+    run_parser.add_argument('--pg-bin', help='directory with pg_dump and pg_restore, for --fixtures dump')
+    run_parser.add_argument('--explain', action='append', default=[], metavar='REGEX', help='capture EXPLAIN (ANALYZE, BUFFERS) for matching statements')
+    compare_parser = commands.add_parser('compare', help='flag regressions between two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+    compare_parser.add_argument('--metric', default='mean')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name, (_, defaults, _, _) in scenarios.items():
+            print(f'{name}: {defaults}')
+    elif args.command == 'run':
+        if args.storage and args.explain:
+            # the rolled back EXPLAIN ANALYZE of an UPDATE writes WAL and leaves dead tuples of its own
+            run_parser.error('--storage cannot be combined with --explain, the plan capture would be counted in the storage footprint')
+        params = dict(item.split('=', 1) for item in args.param)
+        engine = db.engine()
+        instrument = SQLInstrument(engine, explain=args.explain) if args.instrument or args.explain else None
+        run(args.scenario, engine, params={key: parse_value(value) for key, value in params.items()},
+            seed=args.seed, num_iter=args.iter, warmup=args.warmup, out=args.out, png=args.png, instrument=instrument,
+            probe=StorageProbe(engine) if args.storage else None,
+            fixtures=FixtureCache(engine, directory=args.fixture_dir, method=args.fixtures, bin_dir=args.pg_bin) if args.fixtures else None,
+            snapshot=TableSnapshot(engine) if args.isolate else None)
+    else:
+        try:
+            rows = compare(args.old, args.new, threshold=args.threshold, metric=args.metric)
+        except ValueError as error:
+            print(error)
+            sys.exit(2)
+        sys.exit(1 if any(row['regressed'] for row in rows) else 0)
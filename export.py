@@ -0,0 +1,200 @@
+import csv
+import importlib.util
+import json
+import time
+from sqlalchemy import text
+import init as db
+
+formats = ('csv', 'parquet')
+methods = ('cursor', 'copy')
+# information_schema data_type -> pyarrow type name, anything else is written as a string
+parquet_types = {
+    "bigint": "int64",
+    "integer": "int32",
+    "smallint": "int16",
+    "boolean": "bool_",
+    "double precision": "float64",
+    "real": "float32",
+    "date": "date32",
+    "bytea": "binary",
+}
+
+
+def parquet_available():
+    """
+    Returns:
+    bool: True if pyarrow, which Parquet exports need, is installed.
+    """
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_table(table_name, path, engine, fmt='csv', method='cursor', chunk_size=10000, data_ids=None, start=None, end=None, operations=None):
+    """
+    Write a table, or the part of it selected by the filters, to a CSV or Parquet file with
+    memory that does not grow with the table.
+
+    With method 'cursor' the rows are read through a server-side cursor chunk_size rows at a time
+    and every chunk is written before the next is fetched. With method 'copy' (CSV only) PostgreSQL
+    formats the rows itself with COPY ... TO STDOUT and psycopg2 writes them straight to the file.
+    Rows are written in index order.
+
+    Parquet needs pyarrow, which is optional; every chunk becomes one row group. jsonb values are
+    written as JSON text and timestamps without a time zone.
+
+    Parameters:
+    - table_name (str): 'action_history' or 'applicant_details'.
+    - path (str): File to write.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - fmt (str): 'csv' or 'parquet'. Default is 'csv'.
+    - method (str): 'cursor' or 'copy'. Default is 'cursor'.
+    - chunk_size (int): Rows fetched and written at a time. Default is 10000.
+    - data_ids, start, end, operations: Optional filters, see init.table_filter().
+
+    Returns:
+    dict: 'rows' written, 'chunks', 'bytes' of the file and 'seconds' taken.
+    """
+    if fmt not in formats:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {formats}")
+    if method not in methods:
+        raise ValueError(f"Unknown export method '{method}', expected one of {methods}")
+    if method == 'copy' and fmt != 'csv':
+        raise ValueError("COPY exports only write csv")
+    clause, params = db.table_filter(table_name, data_ids, start, end, operations)
+    query = f'SELECT * FROM {table_name} {clause} ORDER BY index'
+    s_time = time.perf_counter()
+    with engine.connect() as connection:
+        if method == 'copy':
+            rows, chunks = _copy_csv(query, params, path, connection)
+        else:
+            columns = db.table_columns(table_name, connection)
+            result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(text(query), params)
+            if fmt == 'csv':
+                rows, chunks = _write_csv(result.partitions(chunk_size), columns, path)
+            else:
+                rows, chunks = _write_parquet(result.partitions(chunk_size), columns, path)
+    seconds = time.perf_counter() - s_time
+    with open(path, 'rb') as file:
+        size = file.seek(0, 2)
+    db.dprint(f'Exported {rows} rows of {table_name} to {path} in {round(seconds, 3)}s')
+    return {"rows": rows, "chunks": chunks, "bytes": size, "seconds": seconds}
+
+
+def page_table(table_name, engine, after=None, page_size=20, data_ids=None, start=None, end=None, operations=None):
+    """
+    Read one page of a table in index order, starting after the last index of the previous page.
+    Each page is an index range scan of page_size rows (keyset pagination), so late pages cost
+    the same as the first, unlike OFFSET, which reads and throws away every earlier row.
+
+    Parameters:
+    - table_name (str): 'action_history' or 'applicant_details'.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - after (int, optional): Index of the last row of the previous page. None for the first page.
+    - page_size (int): Rows per page. Default is 20.
+    - data_ids, start, end, operations: Optional filters, see init.table_filter().
+
+    Returns:
+    tuple: (rows, next_after); next_after is passed as after to get the next page and is None
+           after the last page.
+    """
+    clause, params = db.table_filter(table_name, data_ids, start, end, operations)
+    if after is not None:
+        clause = f'{clause} AND index > :after' if clause else 'WHERE index > :after'
+        params["after"] = int(after)
+    with engine.connect() as connection:
+        rows = connection.execute(text(f'SELECT * FROM {table_name} {clause} ORDER BY index LIMIT :page_size;'),
+                                  {**params, "page_size": page_size}).all()
+    next_after = rows[-1].index if len(rows) == page_size else None
+    return rows, next_after
+
+
+def browse_table(table_name, engine, page_size=20, truncate=True, data_ids=None, start=None, end=None, operations=None):
+    """
+    Print a table page by page with page_table(), waiting for Enter between pages; 'q' stops.
+
+    Parameters:
+    - table_name (str): 'action_history' or 'applicant_details'.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - page_size (int): Rows per page. Default is 20.
+    - truncate (bool): Shorten long column names like print_table(). Default is True.
+    - data_ids, start, end, operations: Optional filters, see init.table_filter().
+
+    Returns:
+    int: Number of pages shown.
+    """
+    with engine.connect() as connection:
+        columns = db.table_columns(table_name, connection)
+    headers = [f'{col[:4]}_{col.rsplit("_", 1)[1]}'[:15] if len(col) > 15 and truncate else col for col in columns]
+    after = None
+    pages = 0
+    while True:
+        rows, after = page_table(table_name, engine, after, page_size, data_ids, start, end, operations)
+        table = db.PrettyTable(headers)
+        for row in rows:
+            table.add_row(db.format_row(row, columns.values()))
+        pages += 1
+        print(f"Table: {table_name} (page {pages})")
+        print(table)
+        if after is None or input('Enter for the next page, q to stop: ').strip().lower() == 'q':
+            return pages
+
+
+def _copy_csv(query, params, path, connection):
+    cursor = connection.connection.cursor()
+    # COPY takes no bind parameters, so let psycopg2 quote them into the statement
+    compiled = text(query).bindparams(**params).compile(dialect=connection.dialect)
+    statement = cursor.mogrify(compiled.string, compiled.params).decode()
+    with open(path, 'w', newline='') as file:
+        cursor.copy_expert(f'COPY ({statement}) TO STDOUT WITH (FORMAT csv, HEADER)', file)
+    return cursor.rowcount, 1
+
+
+def _write_csv(chunks, columns, path):
+    rows = 0
+    count = 0
+    with open(path, 'w', newline='') as file:
+        # booleans and line endings as COPY writes them
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(columns.keys())
+        for chunk in chunks:
+            writer.writerows([_csv_value(value, data_type) for value, data_type in zip(row, columns.values())] for row in chunk)
+            rows += len(chunk)
+            count += 1
+    return rows, count
+
+
+def _csv_value(value, data_type):
+    if value is None:
+        return None
+    if data_type == 'jsonb':
+        return json.dumps(value)
+    if data_type == 'boolean':
+        return 't' if value else 'f'
+    return value
+
+
+def _write_parquet(chunks, columns, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)')
+    fields = []
+    for column, data_type in columns.items():
+        if 'timestamp' in data_type:
+            fields.append(pa.field(column, pa.timestamp('us')))
+        else:
+            fields.append(pa.field(column, getattr(pa, parquet_types.get(data_type, 'string'))()))
+    schema = pa.schema(fields)
+    jsonb = [data_type == 'jsonb' for data_type in columns.values()]
+    rows = 0
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            values = [[] for _ in fields]
+            for row in chunk:
+                for i, value in enumerate(row):
+                    values[i].append(json.dumps(value) if jsonb[i] and value is not None else value)
+            writer.write_table(pa.Table.from_arrays([pa.array(v, type=f.type) for v, f in zip(values, fields)], schema=schema))
+            rows += len(chunk)
+            count += 1
+    return rows, count
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+import init as db
+
+methods = ('template', 'dump')
+# files whose contents end up in a fixture
+source_files = ('Applicant-details.csv', 'employees.csv')
+
+
+def schema_version():
+    """
+    Fingerprint of everything a fixture depends on besides its parameters: the table schemas, the
+    index definitions and the CSV files. Changing any of them changes every fixture key.
+
+    Returns:
+    str: A short hex digest.
+    """
+    digest = hashlib.sha1()
+    for schema in (db.data_schema, db.employee_schema, db.action_history_schema, db.action_history_jsonb_schema,
+                   db.privacy_policy_schema, db.fk_indexes, db.partial_indexes, db.composite_indexes, db.jsonb_indexes, db.purge_indexes,
+                   db.access_indexes):
+        digest.update(repr(sorted((key, repr(value)) for key, value in schema.items())).encode())
+    for name in source_files:
+        path = os.path.join(os.getcwd(), name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:12]
+
+
+class FixtureCache:
+    """
+    Builds a benchmark database once per set of parameters and restores it in seconds afterwards.
+
+    A fixture is keyed by its parameters (e.g. num_app, history size, seed) and schema_version().
+    It is stored either as a template database cloned with CREATE DATABASE ... TEMPLATE, or as a
+    pg_dump -Fc archive in the cache directory. An index file in the directory records every
+    fixture's parameters, size and last use. Once the fixtures take more than max_bytes, the least
+    recently used ones are evicted.
+
+    Storing a template ends the other sessions on the engine's database, since PostgreSQL only
+    copies a database nobody is connected to. Restoring a template replaces the engine's database:
+    it is dropped (WITH (FORCE)) and recreated from the template, so the role needs CREATEDB. Restoring a dump
+    resets the public schema and runs pg_restore. Either way the engine's pool is disposed and
+    init.invalidate_caches() is called.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - directory (str): Cache directory for the index and the dump archives. Default is .fixtures.
+    - method (str): 'template' or 'dump'. Default is 'template'.
+    - max_bytes (int): Total size of the fixtures kept. Default is 5 GiB.
+    - bin_dir (str, optional): Directory with pg_dump and pg_restore if they are not on the PATH.
+    """
+
+    def __init__(self, engine, directory='.fixtures', method='template', max_bytes=5 * 2**30, bin_dir=None):
+        if method not in methods:
+            raise ValueError(f"Unknown fixture method '{method}', expected one of {methods}")
+        self.engine = engine
+        self.directory = directory
+        self.method = method
+        self.max_bytes = max_bytes
+        self.bin_dir = bin_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, 'index.json')
+        self._admin_engine = None
+
+    def key(self, params):
+        """
+        Cache key of a set of parameters.
+
+        Parameters:
+        - params (dict): JSON serializable parameters that determine the fixture.
+
+        Returns:
+        str: The key.
+        """
+        payload = json.dumps({"params": params, "schema": schema_version(), "method": self.method}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+    def entries(self):
+        """
+        Returns:
+        dict: Key mapped to the stored fixture's params, schema, method, size, layout, partitioning, extra, created and last_used.
+        """
+        if not os.path.exists(self._index_path):
+            return {}
+        with open(self._index_path) as file:
+            return json.load(file)
+
+    def _write_entries(self, entries):
+        with open(self._index_path + '.tmp', 'w') as file:
+            json.dump(entries, file, indent=2)
+        os.replace(self._index_path + '.tmp', self._index_path)
+
+    def load(self, params, build):
+        """
+        Restore the fixture for params, or build and store it if there is none.
+
+        Parameters:
+        - params (dict): JSON serializable parameters that determine the fixture.
+        - build (callable): Builds the database from scratch. Whatever JSON serializable value it
+                            returns is stored with the fixture and returned by later restores.
+
+        Returns:
+        tuple: (extra, restore_seconds); restore_seconds is None if the fixture was built.
+        """
+        key = self.key(params)
+        s_time = time.perf_counter()
+        extra = self.restore(key)
+        if extra is not None:
+            self.hits += 1
+            return extra['extra'], time.perf_counter() - s_time
+        self.misses += 1
+        result = build()
+        self.store(key, params, result)
+        return result, None
+
+    def store(self, key, params, extra=None):
+        """
+        Save the current state of the engine's database as a fixture and evict old ones if needed.
+
+        Parameters:
+        - key (str): Key from key().
+        - params (dict): The parameters, kept in the index.
+        - extra (any, optional): JSON serializable value returned with the fixture on restore.
+
+        Returns:
+        None
+        """
+        self.invalidate(key)
+        if self.method == 'template':
+            self.engine.dispose()
+            with self._admin() as connection:
+                self._end_sessions(connection, self._database())
+                connection.execute(text(f'CREATE DATABASE "{self._template(key)}" TEMPLATE "{self._database()}";'))
+                size = connection.execute(text('SELECT pg_database_size(:name);'), {"name": self._template(key)}).scalar()
+        else:
+            path = self._archive(key)
+            self._run('pg_dump', '-Fc', '-f', path)
+            size = os.path.getsize(path)
+        now = time.time()
+        entries = self.entries()
+        entries[key] = {"params": params,
+                        "schema": schema_version(),
+                        "method": self.method,
+                        "size": int(size),
+                        "layout": db.HISTORY_LAYOUT.value,
+                        "partitioning": db.HISTORY_PARTITIONING.value,
+                        "extra": extra,
+                        "created": now,
+                        "last_used": now}
+        self._write_entries(entries)
+        db.dprint(f'Stored fixture {key} ({size} bytes)')
+        self.evict(keep=key)
+
+    def restore(self, key):
+        """
+        Replace the engine's database with a stored fixture.
+
+        Parameters:
+        - key (str): Key from key().
+
+        Returns:
+        dict: The fixture's index entry, or None if there is no usable fixture for the key.
+        """
+        entries = self.entries()
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if self.method == 'template':
+            self.engine.dispose()
+            with self._admin() as connection:
+                exists = connection.execute(text('SELECT 1 FROM pg_database WHERE datname = :name;'), {"name": self._template(key)}).scalar()
+                if not exists:
+                    self.invalidate(key)
+                    return None
+                connection.execute(text(f'DROP DATABASE IF EXISTS "{self._database()}" WITH (FORCE);'))
+                connection.execute(text(f'CREATE DATABASE "{self._database()}" TEMPLATE "{self._template(key)}";'))
+        else:
+            if not os.path.exists(self._archive(key)):
+                self.invalidate(key)
+                return None
+            db.hard_reset(self.engine)
+            self.engine.dispose()
+            self._run('pg_restore', '--no-owner', '-d', self._database(), self._archive(key))
+        db.HISTORY_LAYOUT = db.HistoryLayout(entry['layout'])
+        db.HISTORY_PARTITIONING = db.HistoryPartitioning(entry.get('partitioning', 'none'))
+        db.invalidate_caches()
+        entry['last_used'] = time.time()
+        entries[key] = entry
+        self._write_entries(entries)
+        db.dprint(f'Restored fixture {key}')
+        return entry
+
+    def invalidate(self, key=None):
+        """
+        Drop one fixture, or all of them.
+
+        Parameters:
+        - key (str, optional): The fixture to drop. Drops every fixture if None.
+
+        Returns:
+        None
+        """
+        entries = self.entries()
+        keys = list(entries.keys()) if key is None else [key]
+        for k in keys:
+            method = entries.get(k, {}).get('method', self.method)
+            if method == 'template':
+                with self._admin() as connection:
+                    connection.execute(text(f'DROP DATABASE IF EXISTS "{self._template(k)}" WITH (FORCE);'))
+            elif os.path.exists(self._archive(k)):
+                os.remove(self._archive(k))
+            entries.pop(k, None)
+        self._write_entries(entries)
+
+    def prune(self):
+        """
+        Drop the fixtures built with a different schema_version(), which can never be hit again.
+
+        Returns:
+        list: Keys that were dropped.
+        """
+        current = schema_version()
+        stale = [key for key, entry in self.entries().items() if entry['schema'] != current]
+        for key in stale:
+            self.invalidate(key)
+        return stale
+
+    def evict(self, keep=None):
+        """
+        Drop the least recently used fixtures until the total size is under max_bytes.
+
+        Parameters:
+        - keep (str, optional): A fixture that is never evicted, e.g. the one just stored.
+
+        Returns:
+        list: Keys that were evicted.
+        """
+        entries = self.entries()
+        total = sum(entry['size'] for entry in entries.values())
+        evicted = []
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.invalidate(key)
+            total -= entry['size']
+            evicted.append(key)
+        return evicted
+
+    def _database(self):
+        return self.engine.url.database
+
+    def _template(self, key):
+        return f'fixture_{key}'
+
+    def _archive(self, key):
+        return os.path.join(self.directory, f'{key}.dump')
+
+    def _admin(self):
+        # CREATE/DROP DATABASE cannot run inside a transaction or while connected to the target
+        if self._admin_engine is None:
+            self._admin_engine = create_engine(self.engine.url.set(database='postgres'), poolclass=NullPool)
+        return self._admin_engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+    def _end_sessions(self, connection, database):
+        connection.execute(text('''SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+            WHERE datname = :name AND pid <> pg_backend_pid();'''), {"name": database})
+
+    def _run(self, program, *args):
+        url = self.engine.url
+        path = os.path.join(self.bin_dir, program) if self.bin_dir else shutil.which(program)
+        if path is None:
+            raise RuntimeError(f'{program} was not found, pass bin_dir to FixtureCache')
+        env = dict(os.environ, PGPASSWORD=url.password or '')
+        command = [path, '-h', url.host or 'localhost', '-U', url.username]
+        if url.port:
+            command += ['-p', str(url.port)]
+        if program == 'pg_dump':
+            command += list(args) + [url.database]
+        else:
+            command += list(args)
+        subprocess.run(command, env=env, check=True, capture_output=True)
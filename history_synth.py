@@ -0,0 +1,182 @@
+import io
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import text, types
+import init as db
+from audit_log import copy_value
+from samplers import EmployeeSampler
+from value_generators import ValueGenerators, toggles
+
+# same order and weights as test.random_action()
+operations = list(db.Operation)
+operation_weights = [0, .1, .5, .4]
+update_columns = list(db.data_schema.keys())[1:-1]
+view_purposes = [db.Purpose.audit, db.Purpose.review]
+view_roles = list(db.Role)
+
+sql_types = {types.Integer: 'integer', types.BigInteger: 'bigint', types.Boolean: 'boolean'}
+
+
+def synthesize_history(engine, num_actions, seed=None, values=None, blacklist=None, acc_data=None, can_delete=True, per_action_policies=False):
+    """
+    Generate num_actions random actions at once and write them with COPY, instead of running
+    random_action() num_actions times.
+
+    Operation types, employees, target accounts, columns and view policies are drawn from a seeded
+    NumPy generator with the same weights as random_action(). Accounts that get soft deleted stop
+    being targets of later actions, as they would with get_random_account(). The updates are
+    applied to a local copy of the rows so toggled values (marital_status, loan_default_risk, ...)
+    follow each other the same way. Then, in one transaction:
+    - the needed policies are inserted in bulk;
+    - the action_history rows are streamed with COPY;
+    - the final value of every updated (account, column) is applied with one UPDATE per column;
+    - the soft deletes are applied with one UPDATE.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_actions (int): The number of actions to generate.
+    - seed (int, optional): Seed for the random generator.
+    - values (ValueGenerators, optional): Generates the updated values. Defaults to a new one seeded from seed.
+    - blacklist (list, optional): Account indexes that are never targeted.
+    - acc_data (tuple, optional): Target this account with every action (get this from get_random_account()).
+    - can_delete (bool, optional): Flag to allow soft deletion actions. Defaults to True.
+    - per_action_policies (bool, optional): Add a policy per action like the uncached path instead of one per
+                                            (role, purpose). Defaults to False.
+
+    Returns:
+    dict: Counts of 'actions', 'updates', 'views', 'soft_deletes' and 'policies', and timings in seconds.
+    """
+    s_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    weights = np.array(operation_weights, dtype=float)
+    if not can_delete:
+        weights[operations.index(db.Operation.delete)] = 0
+    weights /= weights.sum()
+
+    ops = rng.choice(len(operations), size=num_actions, p=weights)
+    employees = EmployeeSampler(seed=rng.integers(2**32)).sample(engine, num_actions)
+    columns = rng.integers(len(update_columns), size=num_actions)
+    roles = rng.integers(len(view_roles), size=num_actions)
+    purposes = rng.integers(len(view_purposes), size=num_actions)
+    picks = rng.random(num_actions)
+
+    # every non toggled update value in one batch per column
+    values = ValueGenerators(seed=rng.integers(2**32)) if values is None else values
+    is_update = ops == operations.index(db.Operation.update)
+    counts = np.bincount(columns[is_update], minlength=len(update_columns))
+    new_values = {column: values.batch(column, int(counts[c]))
+                  for c, column in enumerate(update_columns) if column not in toggles}
+
+    # local copy of the live accounts, in the column order of get_random_account()
+    if acc_data is not None:
+        rows = {acc_data[0]: list(acc_data)}
+    else:
+        with engine.connect() as connection:
+            result = connection.execute(text(f'''SELECT index,{','.join(db.data_schema.keys())}
+                FROM applicant_details
+                WHERE is_deleted = false
+                ORDER BY index;'''))
+            excluded = set(blacklist) if blacklist else set()
+            rows = {row[0]: list(row) for row in result if row[0] not in excluded}
+    pool = list(rows.keys())
+    positions = {index: i for i, index in enumerate(pool)}
+
+    now = datetime.now()
+    history = []
+    policy_keys = []
+    updated = {}
+    deleted = []
+    for i in range(num_actions):
+        operation = operations[ops[i]]
+        if acc_data is not None:
+            data = rows[acc_data[0]]
+        else:
+            if not pool:
+                break
+            data = rows[pool[int(picks[i] * len(pool))]]
+
+        column = None
+        value = None
+        if operation == db.Operation.update:
+            column = update_columns[columns[i]]
+            value = values.value(column, data) if column in toggles else new_values[column].pop()
+            data[list(db.data_schema.keys()).index(column) + 1] = value
+            updated[(data[0], column)] = value
+            policy_keys.append((db.Role.loan_officer, db.Purpose.audit))
+        elif operation == db.Operation.view:
+            policy_keys.append((view_roles[roles[i]], view_purposes[purposes[i]]))
+        else:
+            policy_keys.append((db.Role.loan_manager, db.Purpose.approval))
+            deleted.append(data[0])
+            if acc_data is None:
+                # swap-pop so later actions never pick a soft deleted account
+                position = positions.pop(data[0])
+                last = pool.pop()
+                if last != data[0]:
+                    pool[position] = last
+                    positions[last] = position
+
+        history.append([None, int(employees[i]), data[0], operation.value,
+                        now + timedelta(microseconds=i),
+                        db.format_new_data(value, column), column])
+    generate_time = time.perf_counter()
+
+    with engine.begin() as connection:
+        cursor = connection.connection.cursor()
+
+        # policies: one per (role, purpose), or one per action
+        keys = policy_keys if per_action_policies else list(dict.fromkeys(policy_keys))
+        ids = [row[0] for row in connection.execute(text('SELECT nextval(\'counter\') FROM generate_series(1, :n);'), {"n": len(keys)})]
+        end = now + timedelta(minutes=5)
+        write_copy(cursor, 'privacy_policies', ['index', 'entity_role', 'purpose', 'start_time', 'end_time'],
+                   [[policy_id, role.value, purpose.value, now, end] for policy_id, (role, purpose) in zip(ids, keys)])
+        policy_ids = dict(zip(keys, ids))
+        for i, row in enumerate(history):
+            row[0] = ids[i] if per_action_policies else policy_ids[policy_keys[i]]
+
+        write_copy(cursor, 'action_history', ['policy_id', 'employee_id', 'data_id', 'operation', 'time', 'new_data', 'column_modified'], history)
+
+        if updated:
+            connection.execute(text('CREATE TEMP TABLE history_synth_updates (index bigint, column_name text, value text) ON COMMIT DROP;'))
+            write_copy(cursor, 'history_synth_updates', ['index', 'column_name', 'value'],
+                       [[index, column, value] for (index, column), value in updated.items()])
+            for column in sorted(set(column for _, column in updated.keys())):
+                cast = sql_types.get(db.data_schema[column], 'varchar')
+                connection.execute(text(f'''UPDATE applicant_details a SET "{column}" = s.value::{cast}
+                    FROM history_synth_updates s
+                    WHERE s.index = a.index AND s.column_name = :column;'''), {"column": column})
+        if deleted:
+            connection.execute(text('UPDATE applicant_details SET is_deleted = true WHERE index = ANY(:ids);'), {"ids": sorted(set(deleted))})
+    db.applicants_version += 1
+    write_time = time.perf_counter()
+
+    counts = {op: int(np.sum(ops[:len(history)] == operations.index(op))) for op in operations}
+    return {"actions": len(history),
+            "updates": counts[db.Operation.update],
+            "views": counts[db.Operation.view],
+            "soft_deletes": counts[db.Operation.delete],
+            "policies": len(keys),
+            "generate_time": generate_time - s_time,
+            "write_time": write_time - generate_time,
+            "total_time": write_time - s_time}
+
+
+def write_copy(cursor, table, columns, rows):
+    """
+    Stream rows into a table with COPY FROM STDIN.
+
+    Parameters:
+    - cursor: A psycopg2 cursor inside the current transaction.
+    - table (str): The table to copy into.
+    - columns (list): The columns of each row, in order.
+    - rows (list of list): The values to write.
+
+    Returns:
+    None
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row) + '\n')
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer)
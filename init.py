@@ -1,10 +1,17 @@
+from collections import OrderedDict
 from config import load_config
 from datetime import datetime, timedelta
 from enum import Enum
+import io
+import json
 import os
 from os import getcwd
 import pandas as pd
-from sqlalchemy import create_engine, types, URL, text
+import threading
+import time
+import weakref
+from sqlalchemy import Column, MetaData, PrimaryKeyConstraint, Table, create_engine, types, URL, text
+from sqlalchemy.dialects import postgresql
 from prettytable import PrettyTable
 
 VERBOSE = False
@@ -29,6 +36,29 @@ class Role(Enum):
     loan_manager = 'loan_manager'
     loan_officer = 'loan_officer'
 
+class BatchMode(Enum):
+    single_query = 'single_query'   # every UPDATE in one query string, one VACUUM FULL
+    sequential = 'sequential'       # UPDATE, COMMIT and VACUUM FULL per index
+    set_based = 'set_based'         # one UPDATE ... WHERE index = ANY(ids) per table per chunk
+
+class HistoryLayout(Enum):
+    string = 'string'   # new_data is a comma joined key=value string
+    jsonb = 'jsonb'     # new_data is a JSONB object keyed by column
+
+class HistoryPartitioning(Enum):
+    none = 'none'       # one heap table
+    hash = 'hash'       # PARTITION BY HASH (data_id), an applicant's history is in one partition
+    range = 'range'     # PARTITION BY RANGE (time), one partition per interval plus a default one
+
+# layout of action_history.new_data, set by init() and migrate_history_to_jsonb()
+HISTORY_LAYOUT = HistoryLayout.string
+# partitioning of action_history, set by init()
+HISTORY_PARTITIONING = HistoryPartitioning.none
+
+# bumped whenever the employees or applicant_details tables are reloaded, so samplers know to refresh
+employees_version = 0
+applicants_version = 0
+
 
 # ------------------------------
 # Schema Definitions
@@ -45,6 +75,11 @@ action_history_schema = {
     "column_modified": types.String(100)                # column being modified
 }
 
+action_history_jsonb_schema = {
+    **action_history_schema,
+    "new_data": postgresql.JSONB                        # {column: value} for everything added or updated
+}
+
 data_schema = {
     "applicant_id": types.BigInteger,                   # unique ID for the applicant
     "annual_income": types.Integer,                     # applicant's income for the year
@@ -82,10 +117,397 @@ privacy_policy_schema = {
 }
 
 
+# ------------------------------
+# Index Definitions
+# ------------------------------
+fk_indexes = {
+    "ix_action_history_data_id": {                      # ON DELETE CASCADE and per applicant erasure
+        "table": "action_history",
+        "columns": ["data_id"]},
+    "ix_action_history_policy_id": {
+        "table": "action_history",
+        "columns": ["policy_id"]},
+    "ix_action_history_employee_id": {
+        "table": "action_history",
+        "columns": ["employee_id"]}
+}
+
+partial_indexes = {
+    "ix_applicant_details_live": {                      # accounts that have not been soft deleted
+        "table": "applicant_details",
+        "columns": ["index"],
+        "where": "is_deleted = false"}
+}
+
+composite_indexes = {
+    "ix_action_history_erasure": {                      # matches the erasure CASE on operation/column_modified
+        "table": "action_history",
+        "columns": ["data_id", "operation", "column_modified"]}
+}
+
+jsonb_indexes = {
+    "ix_action_history_new_data": {                     # key lookups (new_data ? column) for jsonb erasure
+        "table": "action_history",
+        "columns": ["new_data"],
+        "using": "gin"}
+}
+
+purge_indexes = {
+    "ix_action_history_deletes": {                      # soft delete time of each applicant, for the purger
+        "table": "action_history",
+        "columns": ["data_id", "time"],
+        "where": f"operation = '{Operation.delete.value}'"},
+    "ix_applicant_details_deleted": {                   # soft deleted applicants, the purger's candidates
+        "table": "applicant_details",
+        "columns": ["index"],
+        "where": "is_deleted"}
+}
+
+access_indexes = {
+    "ix_applicant_details_applicant_id": {              # subject access requests arrive by applicant_id
+        "table": "applicant_details",
+        "columns": ["applicant_id"]},
+    "ix_action_history_subject": {                      # one applicant's history already in time order
+        "table": "action_history",
+        "columns": ["data_id", "time"]}
+}
+
+default_indexes = {**fk_indexes, **partial_indexes}
+
+
+# ------------------------------
+# Policy Cache
+# ------------------------------
+# every live PolicyCache, so hard_reset() can drop ids that no longer exist
+_policy_caches = weakref.WeakSet()
+
+class PolicyCache:
+    """
+    Reuses privacy_policies rows by (Role, Purpose) while they are still inside their time window.
+
+    add_access_policy() only inserts a new policy when there is no cached policy for the pair, or
+    the cached one has reached its end_time (or is older than ttl seconds). Entries are evicted
+    least recently used first once max_size pairs are cached.
+
+    Parameters:
+    - max_size (int, optional): Maximum number of (Role, Purpose) pairs kept. Unlimited if None.
+    - ttl (float, optional): Seconds a policy is reused for, if shorter than its own window.
+    - enabled (bool): False restores the old behavior of inserting a policy for every operation. Default is True.
+    """
+
+    def __init__(self, max_size=None, ttl=None, enabled=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._policies = OrderedDict()      # (role, purpose) -> (policy_id, expires)
+        self._lock = threading.Lock()
+        _policy_caches.add(self)
+
+    def get(self, role, purpose, now=None):
+        """
+        Look up a still valid policy.
+
+        Parameters:
+        - role (Role): The role of the policy.
+        - purpose (Purpose): The purpose of the policy.
+        - now (datetime, optional): Time the policy must be valid at. Defaults to now.
+
+        Returns:
+        int: The policy index, or None if there is no valid cached policy.
+        """
+        now = datetime.now() if now is None else now
+        with self._lock:
+            entry = self._policies.get((role, purpose)) if self.enabled else None
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self._policies.move_to_end((role, purpose))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, role, purpose, policy_id, start_time, end_time):
+        """
+        Cache a newly added policy.
+
+        Parameters:
+        - role (Role): The role of the policy.
+        - purpose (Purpose): The purpose of the policy.
+        - policy_id (int): The index of the policy in privacy_policies.
+        - start_time (datetime): The start of the policy window.
+        - end_time (datetime): The end of the policy window.
+
+        Returns:
+        None
+        """
+        if not self.enabled:
+            return
+        expires = end_time if self.ttl is None else min(end_time, start_time + timedelta(seconds=self.ttl))
+        with self._lock:
+            self._policies[(role, purpose)] = (policy_id, expires)
+            self._policies.move_to_end((role, purpose))
+            if self.max_size is not None:
+                while len(self._policies) > self.max_size:
+                    self._policies.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget every cached policy.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self._policies.clear()
+
+
+# ------------------------------
+# Session
+# ------------------------------
+class Session:
+    """
+    Unit of work that carries one connection and one transaction through an operation.
+
+    update_data() and soft_delete() on a session run the data change, the policy insert, the
+    employee lookup and the log entry on the same connection, and everything is committed once
+    when the with block exits (or rolled back if it raises). The module level functions of the
+    same names open a session per call.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - writer (AuditLogWriter, optional): Queue log entries on this writer instead of inserting them in the transaction.
+    - policy_cache (PolicyCache, optional): Reuse still valid policies instead of adding one per operation.
+    - employee_sampler (EmployeeSampler, optional): Draw employees in process instead of querying for one.
+    - applicant_sampler (ApplicantSampler, optional): Draw accounts from an in-process pool instead of querying for one.
+    """
+
+    def __init__(self, engine, writer=None, policy_cache=None, employee_sampler=None, applicant_sampler=None):
+        self.engine = engine
+        self.writer = writer
+        self.policy_cache = policy_cache
+        self.employee_sampler = employee_sampler
+        self.applicant_sampler = applicant_sampler
+        self.connection = None
+        # policies added in the open transaction, cached only once it commits
+        self._pending_policies = []
+        # applicants deleted in the open transaction, taken out of the sampler only once it commits
+        self._pending_removals = []
+
+    def __enter__(self):
+        self.connection = self.engine.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.connection.rollback()
+        finally:
+            self._pending_policies = []
+            self._pending_removals = []
+            self.connection.close()
+            self.connection = None
+
+    def commit(self):
+        """
+        Commit the work done so far and start a new transaction on the same connection. Policies
+        added since the last commit are only handed to the policy cache now, so other sessions
+        never reuse a policy id that could still be rolled back, and deleted applicants only leave
+        the applicant sampler now, so a rollback does not take live applicants out of its pool.
+
+        Returns:
+        None
+        """
+        self.connection.commit()
+        for pending in self._pending_policies:
+            self.policy_cache.put(*pending)
+        self._pending_policies = []
+        if self.applicant_sampler is not None:
+            for index in self._pending_removals:
+                self.applicant_sampler.remove(index)
+        self._pending_removals = []
+
+    def add_access_policy(self, role, purpose, start_time=None, end_time=None):
+        """
+        Adds an access policy to the 'privacy-policies' table. See add_access_policy().
+
+        Returns:
+        int: The index of the added access policy in the 'privacy-policies' table.
+        """
+        # only policies with the default window are shared
+        cacheable = self.policy_cache is not None and start_time == None and end_time == None
+        if cacheable:
+            policy_id = self.policy_cache.get(role, purpose)
+            if policy_id is not None:
+                return policy_id
+            # not committed yet, but visible to this transaction
+            for pending in self._pending_policies:
+                if pending[:2] == (role, purpose) and pending[4] > datetime.now():
+                    return pending[2]
+        if start_time == None:
+            start_time = datetime.now()
+        if end_time == None:
+            end_time = start_time + timedelta(minutes=5)
+
+        policy_data = {
+            "entity_role": role.value,
+            "purpose": purpose.value,
+            "start_time": start_time,
+            "end_time": end_time
+        }
+
+        result = self.connection.execute(text("""
+            INSERT INTO "privacy_policies" (entity_role, purpose, start_time, end_time)
+            VALUES (:entity_role, :purpose, :start_time, :end_time)
+            RETURNING index
+        """), policy_data)
+        policy_id = result.scalar()
+        if cacheable:
+            self._pending_policies.append((role, purpose, policy_id, start_time, end_time))
+        return policy_id
+
+    def select_random_employee(self):
+        """
+        Selects a random employee ID from the employee table.
+
+        Returns:
+        int: The employee ID.
+        """
+        if self.employee_sampler is not None:
+            return self.employee_sampler.sample(self.engine)
+        result = self.connection.execute(text("""Select id
+                                         From employees
+                                         ORDER BY RANDOM()
+                                         LIMIT 1;
+                                         """))
+        return result.fetchone()[0]
+
+    def get_random_account(self, blacklist=None):
+        """
+        Returns the values from a random account. See get_random_account().
+
+        Returns:
+        tuple: values from the selected row
+        """
+        if self.applicant_sampler is not None:
+            return self.applicant_sampler.sample(self.engine, blacklist=blacklist)
+        blacklist_condition = f"AND index NOT IN ({','.join(map(str, blacklist))})" if blacklist else ""
+        result = self.connection.execute(text(f"""Select index,{','.join(list(data_schema.keys()))}
+                                         From applicant_details
+                                         Where is_deleted = false
+                                         {blacklist_condition}
+                                         ORDER BY RANDOM()
+                                         LIMIT 1;
+                                         """))
+        return result.fetchone()
+
+    def log_action(self, policy_id, employee_id, data_id, operation, new_data, modified_column):
+        """
+        Log an action into the action history table. See log_action().
+
+        Returns:
+        None
+        """
+        action_data = {
+            "policy_id": policy_id,
+            "employee_id": employee_id,
+            "data_id": data_id,
+            "operation": operation.value,
+            "time": datetime.now(),
+            "new_data": format_new_data(new_data, modified_column),
+            "modified_column": modified_column
+        }
+        if self.writer is not None:
+            self.writer.log(action_data)
+            return
+
+        self.connection.execute(text("""
+            INSERT INTO "action_history" (policy_id, employee_id, data_id, operation, time, new_data, column_modified)
+            VALUES (:policy_id, :employee_id, :data_id, :operation, :time, :new_data, :modified_column)
+        """), action_data)
+
+    def log_actions(self, actions):
+        """
+        Log multiple actions into the action history table. See log_actions().
+
+        Returns:
+        None
+        """
+        for action_data in actions:
+            action_data["new_data"] = format_new_data(action_data["new_data"], action_data["modified_column"])
+            action_data["time"] = datetime.now()
+        if self.writer is not None:
+            self.writer.log_many(actions)
+            return
+
+        for action_data in actions:
+            self.connection.execute(text("""
+                INSERT INTO "action_history" (policy_id, employee_id, data_id, operation, time, new_data, column_modified)
+                VALUES (:policy_id, :employee_id, :data_id, :operation, :time, :new_data, :modified_column)
+            """), action_data)
+
+    def log_view(self, policy_id, employee_id, data_id):
+        """
+        Update action_history to refelect an employee viewing data.
+
+        Returns:
+        None
+        """
+        self.log_action(policy_id, employee_id, data_id, Operation.view, None, None)
+
+    def soft_delete(self, index):
+        """
+        Soft delete a record in the 'applicant_details' table. Adds entry to action_history
+
+        Returns:
+        None
+        """
+        self.connection.execute(text(f'UPDATE applicant_details SET is_deleted = true WHERE index = {index};'))
+        self._pending_removals.append(index)
+        policy_id = self.add_access_policy(Role.loan_manager, Purpose.approval)
+        employee_id = self.select_random_employee()
+        self.log_action(policy_id, employee_id, index, Operation.delete, None, None)
+
+    def delete_rows(self, ids, index=False):
+        """
+        Hard delete applicants and their history with one statement per table. See delete_rows().
+
+        Returns:
+        dict: Rows deleted from 'action_history' and 'applicant_details'.
+        """
+        ids = [int(i) for i in ids]
+        if not index:
+            ids = [row[0] for row in self.connection.execute(text('SELECT index FROM applicant_details WHERE applicant_id = ANY(:ids);'), {"ids": ids})]
+        # history first, so the ON DELETE CASCADE check finds nothing left to delete
+        history_rows = self.connection.execute(text('DELETE FROM action_history WHERE data_id = ANY(:ids);'), {"ids": ids}).rowcount
+        applicant_rows = self.connection.execute(text('DELETE FROM applicant_details WHERE index = ANY(:ids);'), {"ids": ids}).rowcount
+        self._pending_removals.extend(ids)
+        return {"action_history": history_rows, "applicant_details": applicant_rows}
+
+    def update_data(self, id, column, value, index=-1):
+        """
+        Update a specific column with a new value for a row in the 'applicant_details' table. See update_data().
+
+        Returns:
+        None
+        """
+        a = f'applicant_id = {id}' if index < 0 else f'index = {index}'
+        if index < 0:
+            data_id = self.connection.execute(text(f'UPDATE applicant_details SET {column} = \'{value}\' WHERE {a} RETURNING index;')).scalar()
+        else:
+            self.connection.execute(text(f'UPDATE applicant_details SET {column} = \'{value}\' WHERE {a};'))
+            data_id = index
+        policy_id = self.add_access_policy(Role.loan_officer, Purpose.audit)
+        employee_id = self.select_random_employee()
+        self.log_action(policy_id, employee_id, data_id, Operation.update, value, column)
+
+
 # ------------------------------
 # Function Definitions
 # ------------------------------
-def add_access_policy(role, purpose, engine, start_time=None, end_time=None):
+def add_access_policy(role, purpose, engine, start_time=None, end_time=None, cache=None):
     """
     Adds an access policy to the 'privacy-policies' table in the database.
 
@@ -95,32 +517,13 @@ def add_access_policy(role, purpose, engine, start_time=None, end_time=None):
     - engine (sqlalchemy.engine.Engine): The SQLAlchemy engine object for executing SQL statements.
     - start_time (datetime, optional): The start time of the access policy. Defaults to the current time if not provided.
     - end_time (datetime, optional): The end time of the access policy. Defaults to 5 minutes from the start time if not provided.
+    - cache (PolicyCache, optional): Return a still valid policy for the same role and purpose instead of adding one.
 
     Returns:
     int: The index of the added access policy in the 'privacy-policies' table.
     """
-    if start_time == None:
-        start_time = datetime.now()
-    if end_time == None:
-        end_time = start_time + timedelta(minutes=5)
-
-    policy_data = {
-        "entity_role": role.value,
-        "purpose": purpose.value,
-        "start_time": start_time,
-        "end_time": end_time
-    }
-
-    with engine.connect() as connection:
-        result = connection.execute(text("""
-            INSERT INTO "privacy_policies" (entity_role, purpose, start_time, end_time)
-            VALUES (:entity_role, :purpose, :start_time, :end_time)
-            RETURNING index
-        """), policy_data)
-        policy_id = result.scalar()
-        connection.commit()
-        #print(f'Added policy {policy_id} {policy_data}')
-        return policy_id
+    with Session(engine, policy_cache=cache) as session:
+        return session.add_access_policy(role, purpose, start_time=start_time, end_time=end_time)
     
 
 def create_relationship(table_1, table_2, column_1, column_2, engine, cascade_del=False):
@@ -147,6 +550,70 @@ def create_relationship(table_1, table_2, column_1, column_2, engine, cascade_de
         connection.commit()
 
 
+def create_indexes(indexes, engine):
+    """
+    Create the indexes in an index definition dict (see fk_indexes) and refresh planner statistics.
+
+    Parameters:
+    - indexes (dict): Index names mapped to {'table', 'columns', optional 'where', optional 'using'}.
+    - engine (sqlalchemy.engine.base.Engine): SQLAlchemy database engine.
+
+    Returns:
+    None
+    """
+    with engine.connect() as connection:
+        for name, index in indexes.items():
+            using = f'USING {index["using"]} ' if 'using' in index else ''
+            where = f' WHERE {index["where"]}' if 'where' in index else ''
+            columns = ', '.join(f'"{col}"' for col in index['columns'])
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{index["table"]}" {using}({columns}){where};'))
+            dprint(f'Created index {name}')
+        for table in set(index['table'] for index in indexes.values()):
+            connection.execute(text(f'ANALYZE "{table}";'))
+        connection.commit()
+
+
+def drop_indexes(indexes, engine):
+    """
+    Drop the indexes in an index definition dict (see fk_indexes).
+
+    Parameters:
+    - indexes (dict): Index names mapped to their definitions.
+    - engine (sqlalchemy.engine.base.Engine): SQLAlchemy database engine.
+
+    Returns:
+    None
+    """
+    with engine.connect() as connection:
+        for name in indexes.keys():
+            connection.execute(text(f'DROP INDEX IF EXISTS {name};'))
+        connection.commit()
+
+
+def index_usage(engine, tables=None):
+    """
+    Report how often each index has been used, from pg_stat_user_indexes.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): SQLAlchemy database engine.
+    - tables (list, optional): Only report indexes on these tables.
+
+    Returns:
+    pandas.DataFrame: One row per index with its table, scan count, tuples read/fetched and size in bytes.
+    """
+    table_condition = f"WHERE relname IN ({','.join(repr(t) for t in tables)})" if tables else ""
+    with engine.connect() as connection:
+        return pd.read_sql(text(f'''SELECT relname AS table_name,
+                indexrelname AS index_name,
+                idx_scan,
+                idx_tup_read,
+                idx_tup_fetch,
+                pg_relation_size(indexrelid) AS size_bytes
+            FROM pg_stat_user_indexes
+            {table_condition}
+            ORDER BY relname, indexrelname;'''), connection)
+
+
 def create_sequence(engine):
     """
     This function creates a sequence named 'counter' if it doesn't already exist in the database.
@@ -193,6 +660,68 @@ def create_table(name, schema, engine, p_key='index'):
         dprint("Primary key: index")
     dprint()
 
+def create_partitioned_history(schema, engine, partitioning, partitions=8, interval=timedelta(days=30)):
+    """
+    Create action_history as a declaratively partitioned table with the same columns and index
+    default as create_table(). The partition key has to be part of the primary key, so the key is
+    (index, data_id) for hash and (index, time) for range partitioning.
+
+    Parameters:
+    - schema (dict): The action_history schema, e.g. action_history_schema.
+    - engine (sqlalchemy.engine.Engine): The SQLAlchemy engine object for executing SQL statements.
+    - partitioning (HistoryPartitioning): hash on data_id or range on time.
+    - partitions (int): Number of hash partitions, or of range partitions ending with the current interval. Default is 8.
+    - interval (timedelta): Width of each range partition. Times outside every range go to action_history_default.
+
+    Returns:
+    None
+    """
+    key = 'data_id' if partitioning == HistoryPartitioning.hash else 'time'
+    table = Table('action_history', MetaData(),
+                  Column('index', types.BigInteger, server_default=text("nextval('counter')"), nullable=False),
+                  *[Column(name, column_type, nullable=name != key) for name, column_type in schema.items()],
+                  PrimaryKeyConstraint('index', key),
+                  postgresql_partition_by=f'{partitioning.value.upper()} ({key})')
+    table.create(engine)
+    with engine.connect() as connection:
+        if partitioning == HistoryPartitioning.hash:
+            for i in range(partitions):
+                connection.execute(text(f'''CREATE TABLE action_history_p{i} PARTITION OF action_history
+                    FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i});'''))
+        else:
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - interval * (partitions - 1)
+            for i in range(partitions):
+                connection.execute(text(f'''CREATE TABLE action_history_p{i} PARTITION OF action_history
+                    FOR VALUES FROM ('{start + interval * i}') TO ('{start + interval * (i + 1)}');'''))
+            connection.execute(text('CREATE TABLE action_history_default PARTITION OF action_history DEFAULT;'))
+        connection.commit()
+    dprint(f'Created action_history with {partitions} {partitioning.value} partitions')
+
+
+def erase_history(column_name, condition, connection, params=None):
+    """
+    Run the history_erasure_query() UPDATE and report which action_history tables it changed, so
+    only those are vacuumed. On a partitioned action_history the partitions come back from the
+    UPDATE itself (RETURNING tableoid) instead of from a second scan.
+
+    Parameters:
+    - column_name (str or list): The column or columns to be erased.
+    - condition (str): SQL condition selecting the action_history rows, e.g. 'data_id = 5'.
+    - connection (sqlalchemy.engine.Connection): The connection the erasure runs on.
+    - params (dict, optional): Bound parameters used by condition.
+
+    Returns:
+    tuple: (rows updated, tables); tables is ['action_history'] if the table is not partitioned,
+           otherwise the partitions holding updated rows.
+    """
+    if HISTORY_PARTITIONING == HistoryPartitioning.none:
+        rows = connection.execute(text(history_erasure_query(column_name, condition)), params or {}).rowcount
+        return rows, ['action_history']
+    result = connection.execute(text(history_erasure_query(
+        column_name, condition, returning='SELECT tableoid::regclass::text, count(*) FROM erased GROUP BY 1')), params or {}).all()
+    return sum(row[1] for row in result), sorted(row[0] for row in result)
+
+
 def dprint(*args, sep=' ', end='\n', file=None, flush=False):
     """
     This function only executes print() when the VERBOSE flag is set to True.
@@ -227,7 +756,38 @@ def delete_row(app_id, engine):
         connection.commit()
 
 
-def log_view(policy_id, employee_id, data_id, engine):
+def delete_rows(app_ids, engine, chunk_size=1000, index=False):
+    """
+    Delete many applicants and their action_history. Each chunk deletes its history with one
+    data_id = ANY(:ids) statement, then its applicant_details rows, and commits, instead of one
+    statement, commit and cascade per applicant like delete_row(). The ON DELETE CASCADE still
+    checks action_history for every deleted applicant, so it needs the data_id index of fk_indexes
+    to stay cheap on large histories.
+
+    Parameters:
+    - app_ids (list): The applicant_ids of the applicants to be deleted (their indexes if index is set).
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Number of applicants per transaction. Default is 1000.
+    - index (bool): app_ids are applicant_details indexes instead of applicant_ids. Default is False.
+
+    Returns:
+    dict: Rows deleted from 'action_history' and 'applicant_details'.
+    """
+    global applicants_version
+    app_ids = list(dict.fromkeys(int(i) for i in app_ids))
+    counts = {"action_history": 0, "applicant_details": 0}
+    with Session(engine) as session:
+        for i in range(0, len(app_ids), chunk_size):
+            deleted = session.delete_rows(app_ids[i: i + chunk_size], index=index)
+            session.commit()
+            for table, rows in deleted.items():
+                counts[table] += rows
+    applicants_version += 1
+    dprint(f"Deleted {counts['applicant_details']} applicants and {counts['action_history']} history rows.")
+    return counts
+
+
+def log_view(policy_id, employee_id, data_id, engine, writer=None):
     """
     Update action_history to refelect an employee viewing data.
 
@@ -236,11 +796,13 @@ def log_view(policy_id, employee_id, data_id, engine):
     - employee_id (int): The unique ID of the employee who is viewing data.
     - data_id (int): The unique ID of the data being accessed.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - writer (AuditLogWriter, optional): Queue the log entry on this writer instead of inserting it directly.
 
     Returns:
     None
     """
-    log_action(policy_id, employee_id, data_id, Operation.view, None, None, engine)
+    with Session(engine, writer=writer) as session:
+        session.log_view(policy_id, employee_id, data_id)
 
 def hard_reset(engine):
     """
@@ -257,9 +819,26 @@ def hard_reset(engine):
         connection.execute(text('DROP SCHEMA public CASCADE;'))
         connection.execute(text('CREATE SCHEMA public;'))
         connection.commit()
+    invalidate_caches()
     dprint("Database reset")
 
 
+def invalidate_caches():
+    """
+    Forget every in-process copy of database state: cached policies are cleared and the samplers
+    reload employees and applicants on their next draw. Call this after the database was replaced
+    behind the module's back, e.g. restored from a fixture.
+
+    Returns:
+    None
+    """
+    global employees_version, applicants_version
+    for cache in list(_policy_caches):
+        cache.clear()
+    employees_version += 1
+    applicants_version += 1
+
+
 def soft_reset(engine):
     """
     Clears all records in the applicant_details and action_history tables
@@ -277,9 +856,11 @@ def soft_reset(engine):
         # Clear records from the applicant_details table
         connection.execute(text("DELETE FROM applicant_details;"))
         connection.commit()
+    global applicants_version
+    applicants_version += 1
 
 
-def log_action(policy_id, employee_id, data_id, operation, new_data, modified_column, engine):
+def log_action(policy_id, employee_id, data_id, operation, new_data, modified_column, engine, writer=None):
     """
     Log an action into the action history table.
 
@@ -288,31 +869,18 @@ def log_action(policy_id, employee_id, data_id, operation, new_data, modified_co
     - employee_id (int): The ID of the employee performing the action.
     - data_id (int): The ID of the data being acted upon.
     - operation (Operation): The operation being performed (Enum: Operation).
-    - new_data (str): The new data added or updated.
+    - new_data (str or dict): The new data added or updated. A dict holds every column of an added row.
     - modified_column (str): The column being modified.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - writer (AuditLogWriter, optional): Queue the log entry on this writer instead of inserting it directly.
 
     Returns:
     None
     """
-    with engine.connect() as connection:
-        action_data = {
-            "policy_id": policy_id,
-            "employee_id": employee_id,
-            "data_id": data_id,
-            "operation": operation.value,
-            "time": datetime.now(),
-            "new_data": new_data,
-            "modified_column": modified_column
-        }
+    with Session(engine, writer=writer) as session:
+        session.log_action(policy_id, employee_id, data_id, operation, new_data, modified_column)
 
-        connection.execute(text("""
-            INSERT INTO "action_history" (policy_id, employee_id, data_id, operation, time, new_data, column_modified)
-            VALUES (:policy_id, :employee_id, :data_id, :operation, :time, :new_data, :modified_column)
-        """), action_data)
-        connection.commit()
-
-def log_actions(actions, engine):
+def log_actions(actions, engine, writer=None):
     """
     Log multiple actions into the action history table.
 
@@ -321,20 +889,39 @@ def log_actions(actions, engine):
       Each dictionary should have keys: 'policy_id', 'employee_id', 'data_id',
       'operation', 'new_data', 'modified_column'.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - writer (AuditLogWriter, optional): Queue the log entries on this writer instead of inserting them directly.
 
     Returns:
     None
     """
-    with engine.connect() as connection:
-        for action_data in actions:
-            action_data["time"] = datetime.now()
+    with Session(engine, writer=writer) as session:
+        session.log_actions(actions)
 
-            connection.execute(text("""
-                INSERT INTO "action_history" (policy_id, employee_id, data_id, operation, time, new_data, column_modified)
-                VALUES (:policy_id, :employee_id, :data_id, :operation, :time, :new_data, :modified_column)
-            """), action_data)
+def format_new_data(new_data, modified_column, layout=None):
+    """
+    Convert a new_data value to the format used by the action_history layout.
+
+    Parameters:
+    - new_data (any): The value added or updated, or a dict of every column for an added row.
+    - modified_column (str): The column being modified.
+    - layout (HistoryLayout, optional): The layout to format for. Defaults to HISTORY_LAYOUT.
+
+    Returns:
+    str: A key=value string or a JSON object, or None if there is no new data.
+    """
+    layout = HISTORY_LAYOUT if layout is None else layout
+    if new_data is None:
+        return None
+    if layout == HistoryLayout.string:
+        if isinstance(new_data, dict):
+            return ','.join([f'{key}={value}' for key, value in new_data.items()])
+        return new_data
+    if not isinstance(new_data, dict):
+        new_data = {modified_column: new_data}
+    # numpy scalars and NaN from pandas rows are not valid JSON
+    new_data = {key: value.item() if hasattr(value, 'item') else value for key, value in new_data.items()}
+    return json.dumps({key: value for key, value in new_data.items() if not pd.isna(value)})
 
-        connection.commit()
 
 def load_applicants(engine, number_of_rows=-1):
     """
@@ -370,65 +957,267 @@ def load_applicants(engine, number_of_rows=-1):
             data_id = result.scalar()
             connection.commit()
             operation = Operation.add
-            new_data = ','.join([f'{key}={value}' for key, value in list(row._asdict().items())[1:]])
+            new_data = dict(list(row._asdict().items())[1:])
             modified_column = 'all_columns'
             log_action(policy_id, employee_id, data_id, operation, new_data, modified_column, engine)
+    global applicants_version
+    applicants_version += 1
     dprint(f'Added {num_rows} rows.')
 
 
-def print_table(table_name, engine, truncate=True):
+def bulk_load_applicants(engine, number_of_rows=-1):
+    """
+    Populate the data table using COPY FROM STDIN and log every 'add' in a single set-based statement.
+    Produces the same applicant_details and action_history rows as load_applicants().
+
+    Parameters:
+    - engine (sqlalchemy.engine.Engine): The SQLAlchemy engine object.
+    - number_of_rows (int): The number of rows to be populated. Default is -1, which loads the whole CSV.
+
+    Returns:
+    dict: Row counts ('applicants', 'history') and timings in seconds ('read_time', 'copy_time', 'history_time', 'total_time').
+    """
+    s_time = time.perf_counter()
+    policy_id = add_access_policy(Role.loan_officer, Purpose.onboarding, engine)
+    employee_id = select_random_employee(engine)
+    cwd = getcwd()
+    csv_name = "Applicant-details.csv"
+    csv_location = os.path.join(cwd, csv_name)
+    csv_data = pd.read_csv(csv_location, skiprows = 1, names = data_schema.keys(), dtype={'loan_default_risk':bool})
+    csv_data['is_deleted'] = False
+
+    if number_of_rows == -1:
+        num_rows = len(csv_data)
+    else:
+        num_rows = min(number_of_rows, len(csv_data))
+
+    selected_data = csv_data.head(num_rows)
+    buffer = io.StringIO()
+    selected_data.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    read_time = time.perf_counter()
+
+    columns = ','.join(f'"{col}"' for col in data_schema.keys())
+    if HISTORY_LAYOUT == HistoryLayout.jsonb:
+        new_data = "jsonb_strip_nulls(to_jsonb(ins) - 'index')"
+    else:
+        # rebuild the key=value string load_applicants makes in python (booleans print as True/False there)
+        new_data = " || ',' || ".join(
+            f"'{col}=' || CASE WHEN ins.\"{col}\" THEN 'True' ELSE 'False' END" if data_schema[col] is types.Boolean
+            else f"'{col}=' || COALESCE(ins.\"{col}\"::text, 'nan')"
+            for col in data_schema.keys())
+
+    with engine.connect() as connection:
+        # staging table has no default on index so the counter sequence is only used by the real insert
+        connection.execute(text(f'CREATE TEMP TABLE applicant_staging ON COMMIT DROP AS SELECT {columns} FROM applicant_details WITH NO DATA;'))
+        connection.execute(text('ALTER TABLE applicant_staging ADD COLUMN row_num BIGINT GENERATED ALWAYS AS IDENTITY;'))
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(f'COPY applicant_staging ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        copy_time = time.perf_counter()
+
+        # rows keep their CSV order so the generated indexes line up with load_applicants
+        result = connection.execute(text(f"""
+            WITH ins AS (
+                INSERT INTO applicant_details ({columns})
+                SELECT {columns} FROM applicant_staging ORDER BY row_num
+                RETURNING *
+            )
+            INSERT INTO action_history (policy_id, employee_id, data_id, operation, time, new_data, column_modified)
+            SELECT :policy_id, :employee_id, ins.index, :operation, :time, {new_data}, 'all_columns'
+            FROM ins
+            ORDER BY ins.index;
+        """), {"policy_id": policy_id,
+               "employee_id": employee_id,
+               "operation": Operation.add.value,
+               "time": datetime.now()})
+        history_rows = result.rowcount
+        connection.commit()
+        history_time = time.perf_counter()
+    global applicants_version
+    applicants_version += 1
+    dprint(f'Added {num_rows} rows.')
+
+    return {"applicants": num_rows,
+            "history": history_rows,
+            "read_time": read_time - s_time,
+            "copy_time": copy_time - read_time,
+            "history_time": history_time - copy_time,
+            "total_time": history_time - s_time}
+
+
+def table_filter(table_name, data_ids=None, start=None, end=None, operations=None):
+    """
+    Build the WHERE clause that selects part of a table by applicant, time and operation.
+    The applicant filter uses data_id on action_history and index on applicant_details; the time
+    and operation filters only exist on action_history.
+
+    Parameters:
+    - table_name (str): 'action_history' or 'applicant_details'.
+    - data_ids (list, optional): Only rows of these applicant indexes.
+    - start (datetime, optional): Only actions at or after this time.
+    - end (datetime, optional): Only actions before this time.
+    - operations (list, optional): Only these Operation values (or Operation members).
+
+    Returns:
+    tuple: (clause, params); clause is '' or starts with WHERE and binds params with :name.
+    """
+    conditions = []
+    params = {}
+    if data_ids is not None:
+        column = 'index' if table_name == 'applicant_details' else 'data_id'
+        conditions.append(f'"{column}" = ANY(:data_ids)')
+        params["data_ids"] = [int(i) for i in data_ids]
+    if table_name != 'action_history' and (start is not None or end is not None or operations is not None):
+        raise ValueError(f"Time and operation filters only apply to action_history, not '{table_name}'")
+    if start is not None:
+        conditions.append('time >= :start')
+        params["start"] = start
+    if end is not None:
+        conditions.append('time < :end')
+        params["end"] = end
+    if operations is not None:
+        conditions.append('operation = ANY(CAST(:operations AS operation_enum[]))')
+        params["operations"] = [op.value if isinstance(op, Operation) else op for op in operations]
+    clause = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    return clause, params
+
+
+def table_columns(table_name, connection):
+    """
+    Parameters:
+    - table_name (str): The name of the table.
+    - connection (sqlalchemy.engine.base.Connection): Connection to read the catalog with.
+
+    Returns:
+    dict: Column name mapped to its information_schema data_type, in table order.
+    """
+    columns_result = connection.execute(text('''SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_name = :table_name
+        ORDER BY ordinal_position;'''), {"table_name": table_name})
+    return {row[0]: row[1] for row in columns_result}
+
+
+def format_row(row, data_types, chunksize=80):
+    """
+    Turn a row into the strings print_table shows: short timestamps, JSON for jsonb, long text
+    wrapped every chunksize characters and NULL for missing values.
+
+    Parameters:
+    - row (sequence): The values of the row.
+    - data_types (iterable): information_schema data_type of each value.
+    - chunksize (int): Characters per line of long text. Default is 80.
+
+    Returns:
+    list: The formatted values.
     """
-    Print the entire content of the specified table.
+    formatted_row = []
+    for value, data_type in zip(row, data_types):
+        if 'timestamp' in data_type and value != None:
+            value = value.strftime('%m-%d-%y %H:%M:%S')
+        if data_type == 'jsonb' and value != None:
+            value = json.dumps(value)
+        if data_type in ('character varying', 'jsonb') and value != None:
+            if(len(value) > chunksize):
+                chunks = [value[i: i + chunksize] for i in range(0, len(value), chunksize)]
+                value = '\n'.join(chunks)
+        if value == None:
+            value = "NULL"
+        formatted_row.append(value)
+    return formatted_row
+
+
+def print_table(table_name, engine, truncate=True, page_size=20, data_ids=None, start=None, end=None, operations=None):
+    """
+    Print the content of the specified table, page_size rows at a time. The rows are read with a
+    server-side cursor, so only one page is held in memory however large the table is.
 
     Parameters:
     - table_name (str): The name of the table to be printed.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - truncate (bool): Shorten long column names. Default is True.
+    - page_size (int): Rows per printed table. Default is 20.
+    - data_ids, start, end, operations: Optional filters, see table_filter().
 
     Returns:
     None
     """
-    chunksize = 80
+    clause, params = table_filter(table_name, data_ids, start, end, operations)
     with engine.connect() as connection:
-        columns_result = connection.execute(text(f'''SELECT column_name, data_type 
-        FROM information_schema.columns 
-        WHERE table_name = '{table_name}' 
-        ORDER BY ordinal_position;'''))
-        columns_info = {row[0]: row[1] for row in columns_result}
+        columns_info = table_columns(table_name, connection)
 
         truncated_columns = {f'{col[:4]}_{col.rsplit("_", 1)[1]}'[:15] if len(col) > 15 and truncate else col: data_type for col, data_type in columns_info.items()}
-        result = connection.execute(text(f"SELECT * FROM {table_name};"))
+        result = connection.execution_options(stream_results=True, yield_per=page_size).execute(
+            text(f"SELECT * FROM {table_name} {clause} ORDER BY index;"), params)
 
         table = PrettyTable(truncated_columns.keys())
-        row_count = 0
         table_count = 0
-        for row in result:
-            formatted_row = []
-            for value, data_type in zip(row, truncated_columns.values()):
-                if 'timestamp' in data_type:
-                    value = value.strftime('%m-%d-%y %H:%M:%S')
-                if data_type == 'character varying' and value != None:
-                    if(len(value) > chunksize):
-                        chunks = [value[i: i + chunksize] for i in range(0, len(value), chunksize)]
-                        value = '\n'.join(chunks)
-                if value == None:
-                    value = "NULL"
-                formatted_row.append(value)
-            table.add_row(formatted_row)
-            row_count += 1
-            if(row_count == 20):
-                print(table)
-                print('\n')
-                row_count = 0
-                table_count += 1
-                table.clear_rows()      
-        # Print the table
-        if row_count > 0  or table_count == 0:
+        for page in result.partitions(page_size):
+            for row in page:
+                table.add_row(format_row(row, truncated_columns.values()))
+            if table_count == 0:
+                print(f"Table: {table_name}")
+            print(table)
+            print('\n')
+            table_count += 1
+            table.clear_rows()
+        if table_count == 0:
             print(f"Table: {table_name}")
             print(table)
             print('\n')
 
 
-def remove_column_for_applicant(column_name, index, engine, vacuum=False):
+def history_erasure_query(column_name, condition, layout=None, returning=None):
+    """
+    Build the UPDATE that erases a column's values from action_history.new_data.
+
+    Parameters:
+    - column_name (str or list): The name of the column to be erased, or a list of columns erased in one pass.
+    - condition (str): SQL condition selecting the action_history rows, e.g. 'data_id = 5'.
+    - layout (HistoryLayout, optional): The layout of action_history. Defaults to HISTORY_LAYOUT.
+    - returning (str, optional): Statement run on the tableoid of every updated row. The UPDATE becomes
+                                 the CTE erased(tableoid) of this statement, e.g. to find out which
+                                 partitions it changed.
+
+    Returns:
+    str: The UPDATE statement.
+    """
+    query = _history_erasure_update(column_name, condition, layout)
+    if returning is None:
+        return query
+    return f'WITH erased AS ({query.rstrip().rstrip(";")} RETURNING tableoid) {returning};'
+
+
+def _history_erasure_update(column_name, condition, layout):
+    layout = HISTORY_LAYOUT if layout is None else layout
+    columns = [column_name] if isinstance(column_name, str) else list(column_name)
+    if layout == HistoryLayout.jsonb:
+        keys = f"'{columns[0]}'" if len(columns) == 1 else f"ARRAY[{','.join(repr(col) for col in columns)}]"
+        has_key = '?' if len(columns) == 1 else '?|'
+        # only rows still holding the key are touched, so the GIN index on new_data can be used
+        return f'''UPDATE action_history SET new_data =
+                CASE
+                    WHEN operation = 'add'
+                    THEN new_data - {keys}
+                    ELSE NULL
+                END
+                WHERE {condition} AND new_data {has_key} {keys};'''
+    added = 'new_data'
+    for col in columns:
+        added = f"REGEXP_REPLACE({added}, '({col}=)[^,]+(,|$)', '\\1NULL\\2')"
+    modified = f"= '{columns[0]}'" if len(columns) == 1 else f"IN ({','.join(repr(col) for col in columns)})"
+    return f'''UPDATE action_history SET new_data = 
+                CASE
+                    WHEN operation = 'add' 
+                    THEN {added}
+                    WHEN operation = 'update' AND column_modified {modified}
+                    THEN NULL
+                    ELSE new_data
+                END
+                WHERE {condition};'''
+
+
+def remove_column_for_applicant(column_name, index, engine, vacuum=False, scheduler=None):
     """
     Remove the specified column for a specific applicant in the 'applicant_details' table
     and update 'action_history' table accordingly.
@@ -437,6 +1226,8 @@ def remove_column_for_applicant(column_name, index, engine, vacuum=False):
     - column_name (str): The name of the column to be removed.
     - index (int): The index of the applicant whose column is to be removed.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - vacuum (bool): Run VACUUM FULL on both tables right after the erasure (only the applicant's partitions of a partitioned action_history).
+    - scheduler (VacuumScheduler, optional): Hand the erasure to this scheduler instead of vacuuming here.
 
     Returns:
     None
@@ -449,64 +1240,197 @@ def remove_column_for_applicant(column_name, index, engine, vacuum=False):
         connection.commit()
         
         # Sanatize action_history table
-        query = text(f'''UPDATE action_history
-            SET new_data = 
-                CASE
-                    WHEN operation = 'add' 
-                    THEN REGEXP_REPLACE(new_data, '({column_name}=)[^,]+(,|$)', '\\1NULL\\2')
-                    WHEN operation = 'update' AND column_modified = '{column_name}'
-                    THEN NULL
-                    ELSE new_data
-                END
-            WHERE data_id = {index};''')
-        connection.execute(query)
+        tables = ['applicant_details', *erase_history(column_name, f'data_id = {index}', connection)[1]]
         connection.execute(text("COMMIT;")) # have to do it this way for vacuum
-        if vacuum:
-            connection.execute(text('VACUUM FULL applicant_details;'))
-            connection.execute(text('VACUUM FULL action_history;'))
+        if vacuum and scheduler is None:
+            for table in tables:
+                connection.execute(text(f'VACUUM FULL {table};'))
+    if scheduler is not None:
+        scheduler.erasure_done(tables)
 
 
     dprint(f"Column '{column_name}' removed for applicant {index} in 'applicant_details' table and action history updated.\n")
 
 
-def column_batch_delete(column_name, indexs, is_sequential, engine):
+def column_batch_delete(column_name, indexs, is_sequential, engine, chunk_size=1000, scheduler=None):
+    """
+    Remove a column for many applicants in 'applicant_details' and 'action_history', then VACUUM FULL.
+
+    Parameters:
+    - column_name (str or list): The column to be removed. BatchMode.set_based also takes a list of columns.
+    - indexs (list): Indexes of the applicants whose column is to be removed.
+    - is_sequential (bool or BatchMode): False (BatchMode.single_query) builds one query string with two
+      UPDATEs per index, True (BatchMode.sequential) commits and vacuums after every index, and
+      BatchMode.set_based runs one UPDATE per table for each chunk of indexes.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Number of indexes per UPDATE in BatchMode.set_based. Default is 1000.
+    - scheduler (VacuumScheduler, optional): Hand each erasure to this scheduler instead of running VACUUM FULL.
+
+    Returns:
+    tuple: Rows updated in each table for BatchMode.set_based, otherwise None.
+    """
+    mode = is_sequential if isinstance(is_sequential, BatchMode) else BatchMode.sequential if is_sequential else BatchMode.single_query
+    if mode == BatchMode.set_based:
+        return column_batch_delete_set(column_name, indexs, engine, chunk_size=chunk_size, scheduler=scheduler)
+    if not isinstance(column_name, str):
+        for col in column_name:
+            column_batch_delete(col, indexs, mode, engine, scheduler=scheduler)
+        return
+
     with engine.connect() as connection:
         ad_query = ''
         ah_query = ''
-        if not is_sequential:
+        if mode == BatchMode.single_query:
+            partitioned = HISTORY_PARTITIONING != HistoryPartitioning.none
+            # every UPDATE notes the partitions it changed, and the last statement of the string lists them
+            returning = 'INSERT INTO erased_partitions SELECT DISTINCT tableoid::regclass FROM erased' if partitioned else None
             for x in indexs:
                 ad_query += f'UPDATE applicant_details SET "{column_name}" = NULL WHERE index = {x};'
-                ah_query += f'''UPDATE action_history SET new_data = 
-                CASE
-                    WHEN operation = 'add' 
-                    THEN REGEXP_REPLACE(new_data, '({column_name}=)[^,]+(,|$)', '\\1NULL\\2')
-                    WHEN operation = 'update' AND column_modified = '{column_name}'
-                    THEN NULL
-                    ELSE new_data
-                END
-                WHERE data_id = {x};'''
+                ah_query += history_erasure_query(column_name, f'data_id = {x}', returning=returning)
             connection.execute(text(ad_query))
-            connection.execute(text(ah_query))
+            if partitioned:
+                connection.execute(text('CREATE TEMP TABLE erased_partitions (partition regclass) ON COMMIT DROP;'))
+                ah_query += 'SELECT DISTINCT partition::text FROM erased_partitions;'
+                tables = ['applicant_details', *sorted(row[0] for row in connection.execute(text(ah_query)))]
+            else:
+                connection.execute(text(ah_query))
+                tables = ['applicant_details', 'action_history']
             connection.execute(text("COMMIT;")) # have to do it this way for vacuum
-            connection.execute(text('VACUUM FULL applicant_details;'))
-            connection.execute(text('VACUUM FULL action_history;'))
+            if scheduler is not None:
+                scheduler.erasure_done(tables)
+            else:
+                for table in tables:
+                    connection.execute(text(f'VACUUM FULL {table};'))
         else:
             for x in indexs:
                 ad_query = f'UPDATE applicant_details SET "{column_name}" = NULL WHERE index = {x};'
-                ah_query = f'''UPDATE action_history SET new_data = 
-                CASE
-                    WHEN operation = 'add' 
-                    THEN REGEXP_REPLACE(new_data, '({column_name}=)[^,]+(,|$)', '\\1NULL\\2')
-                    WHEN operation = 'update' AND column_modified = '{column_name}'
-                    THEN NULL
-                    ELSE new_data
-                END
-                WHERE data_id = {x};'''
                 connection.execute(text(ad_query))
-                connection.execute(text(ah_query))
+                tables = ['applicant_details', *erase_history(column_name, f'data_id = {x}', connection)[1]]
                 connection.execute(text("COMMIT;")) # have to do it this way for vacuum
-                connection.execute(text('VACUUM FULL applicant_details;'))
-                connection.execute(text('VACUUM FULL action_history;'))
+                if scheduler is not None:
+                    scheduler.erasure_done(tables)
+                else:
+                    for table in tables:
+                        connection.execute(text(f'VACUUM FULL {table};'))
+
+
+def column_batch_delete_set(column_names, indexs, engine, chunk_size=1000, scheduler=None):
+    """
+    Set-based batch erasure. Each chunk of indexes is one UPDATE on applicant_details and one on
+    action_history with the ids bound as an array (index = ANY(:ids)), followed by a single
+    VACUUM FULL of both tables (only the partitions holding the applicants' history if action_history is partitioned).
+
+    Parameters:
+    - column_names (str or list): The column or columns to be removed.
+    - indexs (list): Indexes of the applicants whose columns are to be removed. Duplicates are ignored.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Number of indexes per UPDATE. Default is 1000.
+    - scheduler (VacuumScheduler, optional): Hand the erasure to this scheduler instead of running VACUUM FULL.
+
+    Returns:
+    tuple: Number of applicant_details rows and action_history rows updated.
+    """
+    columns = [column_names] if isinstance(column_names, str) else list(column_names)
+    ids = sorted(set(int(x) for x in indexs))
+    assignments = ', '.join(f'"{col}" = NULL' for col in columns)
+    ad_query = text(f'UPDATE applicant_details SET {assignments} WHERE index = ANY(:ids);')
+    ad_rows = 0
+    ah_rows = 0
+    tables = {'applicant_details'}
+    with engine.connect() as connection:
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i: i + chunk_size]
+            ad_rows += connection.execute(ad_query, {"ids": chunk}).rowcount
+            rows, history_tables = erase_history(columns, 'data_id = ANY(:ids)', connection, {"ids": chunk})
+            ah_rows += rows
+            tables.update(history_tables)
+            connection.commit()
+        if scheduler is None:
+            connection.execute(text("COMMIT;")) # have to do it this way for vacuum
+            for table in sorted(tables):
+                connection.execute(text(f'VACUUM FULL {table};'))
+    if scheduler is not None:
+        scheduler.erasure_done(sorted(tables))
+    dprint(f"Columns {columns} removed for {ad_rows} applicants, {ah_rows} history rows updated.")
+    return ad_rows, ah_rows
+
+
+def migrate_history_to_jsonb(engine):
+    """
+    Convert action_history.new_data from key=value strings to JSONB objects keyed by column
+    and add a GIN index on it. Values are split on the known column names, so commas inside a
+    value survive. Columns already erased (col=NULL) are left out of the object.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+
+    Returns:
+    None
+    """
+    global HISTORY_LAYOUT
+    columns = list(data_schema.keys())
+    typed = {types.Integer: 'bigint', types.BigInteger: 'bigint', types.Boolean: 'boolean'}
+
+    def to_json(value, col):
+        if data_schema[col] in typed:
+            return f"to_jsonb(NULLIF(NULLIF({value}, 'NULL'), 'nan')::{typed[data_schema[col]]})"
+        return f"to_jsonb(NULLIF({value}, 'NULL'))"
+
+    pairs = []
+    for i, col in enumerate(columns):
+        end = f',{columns[i + 1]}=' if i + 1 < len(columns) else '$'
+        value = f"substring(new_data from '{col}=(.*){end}')"
+        pairs.append(f"'{col}', {to_json(value, col)}")
+    updated = ' '.join(f"WHEN '{col}' THEN {to_json('new_data', col)}" for col in columns)
+
+    with engine.connect() as connection:
+        connection.execute(text(f'''ALTER TABLE action_history ALTER COLUMN new_data TYPE jsonb USING
+            CASE
+                WHEN new_data IS NULL THEN NULL
+                WHEN operation = 'add'
+                THEN jsonb_strip_nulls(jsonb_build_object({', '.join(pairs)}))
+                WHEN operation = 'update'
+                THEN jsonb_strip_nulls(jsonb_build_object(column_modified, CASE column_modified {updated} ELSE to_jsonb(new_data) END))
+                ELSE NULL
+            END;'''))
+        connection.commit()
+    create_indexes(jsonb_indexes, engine)
+    HISTORY_LAYOUT = HistoryLayout.jsonb
+    dprint('Migrated action_history.new_data to jsonb')
+
+
+def detect_history_layout(engine):
+    """
+    Look up the layout of action_history.new_data from the database column type.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+
+    Returns:
+    HistoryLayout: jsonb if new_data is a jsonb column, otherwise string.
+    """
+    with engine.connect() as connection:
+        data_type = connection.execute(text('''SELECT data_type
+            FROM information_schema.columns
+            WHERE table_name = 'action_history' AND column_name = 'new_data';''')).scalar()
+    return HistoryLayout.jsonb if data_type == 'jsonb' else HistoryLayout.string
+
+
+def detect_history_partitioning(engine):
+    """
+    Look up how action_history is partitioned from pg_partitioned_table.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+
+    Returns:
+    HistoryPartitioning: hash or range for a partitioned action_history, otherwise none.
+    """
+    with engine.connect() as connection:
+        strategy = connection.execute(text('''SELECT partstrat
+            FROM pg_partitioned_table
+            WHERE partrelid = to_regclass('action_history');''')).scalar()
+    return {'h': HistoryPartitioning.hash, 'r': HistoryPartitioning.range}.get(strategy, HistoryPartitioning.none)
 
 
 def load_employees(engine):
@@ -523,70 +1447,61 @@ def load_employees(engine):
     csv_location = os.path.join(cwd, "employees.csv")
     csv_data = pd.read_csv(csv_location, skiprows=1, names=employee_schema.keys())
     
+    global employees_version
     with engine.connect() as connection:
         csv_data.to_sql('employees', con=connection, if_exists='append', index=False)
         connection.commit()
+    employees_version += 1
     
-def select_random_employee(engine):
+def select_random_employee(engine, sampler=None):
     """
     Selects a random employee ID from the employee table.
 
     Paramters:
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - sampler (EmployeeSampler, optional): Draw the employee from this sampler instead of querying.
 
     Returns:
     int: The employee ID.
     """
-    with engine.connect() as connection:
-        result = connection.execute(text("""Select id
-                                         From employees
-                                         ORDER BY RANDOM()
-                                         LIMIT 1;
-                                         """))
-        return result.fetchone()[0]
+    if sampler is not None:
+        return sampler.sample(engine)
+    with Session(engine) as session:
+        return session.select_random_employee()
 
-def soft_delete(index, engine):
+def soft_delete(index, engine, writer=None, sampler=None):
     """
     Soft delete a record in the 'applicant_details' table. Adds entry to action_history
 
     Parameters:
     - index (int): The index of the record to be soft-deleted.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - writer (AuditLogWriter, optional): Queue the log entry on this writer instead of inserting it directly.
+    - sampler (ApplicantSampler, optional): Sampler to drop the record from.
 
     Returns:
     None
     """
-    with engine.connect() as connection:
-        connection.execute(text(f'UPDATE applicant_details SET is_deleted = true WHERE index = {index};'))
-        connection.commit()
-    policy_id = add_access_policy(Role.loan_manager, Purpose.approval, engine)
-    employee_id = select_random_employee(engine)
-    log_action(policy_id, employee_id, index, Operation.delete, None, None, engine)
+    with Session(engine, writer=writer, applicant_sampler=sampler) as session:
+        session.soft_delete(index)
 
-def get_random_account(engine, blacklist=None):
+def get_random_account(engine, blacklist=None, sampler=None):
     '''
     Returns the values from a random account in the accounts table
 
     Parameters:
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
     - blacklist (list, optional): A list of account index's to exclude from selection.
+    - sampler (ApplicantSampler, optional): Draw the account from this sampler instead of ORDER BY RANDOM().
 
     Returns:
     tuple: values from the selected row
     '''
-    blacklist_condition = f"AND index NOT IN ({','.join(map(str, blacklist))})" if blacklist else ""
-    with engine.connect() as connection:
-        result = connection.execute(text(f"""Select index,{','.join(list(data_schema.keys()))}
-                                         From applicant_details
-                                         Where is_deleted = false
-                                         {blacklist_condition}
-                                         ORDER BY RANDOM()
-                                         LIMIT 1;
-                                         """))
-        return result.fetchone()
+    with Session(engine, applicant_sampler=sampler) as session:
+        return session.get_random_account(blacklist=blacklist)
 
 
-def update_data(id, column, value, engine, index=-1):
+def update_data(id, column, value, engine, index=-1, writer=None):
     """
     Update a specific column with a new value for a row in the 'applicant_details' table.
 
@@ -596,21 +1511,12 @@ def update_data(id, column, value, engine, index=-1):
     - value (any): The new value to be set in the specified column.
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
     - index (int): default -1. option to provide index value to prevent looking it up again.
+    - writer (AuditLogWriter, optional): Queue the log entry on this writer instead of inserting it directly.
     Returns:
     None
     """
-    with engine.connect() as connection:
-        a = f'applicant_id = {id}' if index < 0 else f'index = {index}'
-        query = text(f'UPDATE applicant_details SET {column} = \'{value}\' WHERE {a};')
-        connection.execute(query)
-        connection.commit()
-        if index < 0:
-            data_id = connection.execute(text(f'SELECT index FROM applicant_details WHERE {a}')).scalar()
-        else:
-            data_id = index
-    policy_id = add_access_policy(Role.loan_officer, Purpose.audit, engine)
-    employee_id = select_random_employee(engine)
-    log_action(policy_id, employee_id, data_id, Operation.update, value, column, engine)
+    with Session(engine, writer=writer) as session:
+        session.update_data(id, column, value, index=index)
 
 def engine():
     dprint("Connecting engine to database")
@@ -626,9 +1532,29 @@ def engine():
     dprint("Connection established!")
     return engine
 
-def init(engine, num_applicants=-1):
+def init(engine, num_applicants=-1, bulk=True, layout=HistoryLayout.string, indexes=None, partitioning=HistoryPartitioning.none, partitions=8):
+    """
+    Reset the database, create the tables and relationships, and load the CSV data.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_applicants (int): Number of applicants to load. Default is -1, which loads the whole CSV.
+    - bulk (bool): Load applicants with bulk_load_applicants() instead of load_applicants(). Default is True.
+    - layout (HistoryLayout): Store action_history.new_data as key=value strings or JSONB. Default is string.
+    - indexes (dict, optional): Index definitions to create once the data is loaded, e.g. default_indexes.
+                                Default is None, which only keeps the primary keys.
+    - partitioning (HistoryPartitioning): Create action_history as one table, or hash partitioned on data_id
+                                          or range partitioned on time. Default is none.
+    - partitions (int): Number of action_history partitions. Default is 8.
+
+    Returns:
+    None
+    """
+    global HISTORY_LAYOUT, HISTORY_PARTITIONING
      # reset the database just in case
     hard_reset(engine)
+    HISTORY_LAYOUT = layout
+    HISTORY_PARTITIONING = partitioning
 
     #create sequence for unique indexes in tables
     create_sequence(engine)
@@ -637,7 +1563,13 @@ def init(engine, num_applicants=-1):
     dprint("Initializing tables...")
     create_table('applicant_details', data_schema, engine)
     create_table('employees', employee_schema, engine, p_key='id')
-    create_table('action_history', action_history_schema, engine)
+    history_schema = action_history_jsonb_schema if layout == HistoryLayout.jsonb else action_history_schema
+    if partitioning == HistoryPartitioning.none:
+        create_table('action_history', history_schema, engine)
+    else:
+        create_partitioned_history(history_schema, engine, partitioning, partitions)
+    if layout == HistoryLayout.jsonb:
+        create_indexes(jsonb_indexes, engine)
     create_table('privacy_policies', privacy_policy_schema, engine)
     dprint("Finished initializing tables!")
     
@@ -651,8 +1583,16 @@ def init(engine, num_applicants=-1):
     #add CSV data to applicant_details table
     dprint("Populating tables...")
     load_employees(engine)
-    load_applicants(engine, num_applicants)
-    dprint("CSV converted to table!\n")   
+    if bulk:
+        stats = bulk_load_applicants(engine, num_applicants)
+        dprint(f"Bulk loaded {stats['applicants']} applicants in {round(stats['total_time'], 3)}s")
+    else:
+        load_applicants(engine, num_applicants)
+    dprint("CSV converted to table!\n")
+
+    if indexes:
+        dprint("Creating indexes...")
+        create_indexes(indexes, engine)   
 
 if __name__ == '__main__':
     
@@ -0,0 +1,306 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+from prettytable import PrettyTable
+from sqlalchemy import event
+
+# INSERTs are left out: their defaults draw from sequences, which a rolled back EXPLAIN ANALYZE still advances
+explainable = ('UPDATE', 'DELETE', 'SELECT')
+# running these a second time changes something a rollback does not undo, or takes locks
+side_effects = re.compile(r'\bnextval\s*\(|\bsetval\s*\(|\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b|\bFOR\s+(?:KEY\s+)?SHARE\b', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    """
+    Normalize a statement so runs of the same query with different values group together.
+
+    String and number literals and bound parameters become ?, lists of them become (...), and
+    whitespace is collapsed.
+
+    Parameters:
+    - statement (str): The SQL sent to the database.
+
+    Returns:
+    str: The normalized statement.
+    """
+    statement = re.sub(r'--[^\n]*', ' ', statement)
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'%\(\w+\)s|%s', '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', statement)
+    return re.sub(r'\s+', ' ', statement).strip().rstrip(';')
+
+
+def phase_name(statement):
+    """
+    Short label for a statement: the command and the table it works on, e.g. 'UPDATE action_history'.
+
+    Parameters:
+    - statement (str): The SQL sent to the database.
+
+    Returns:
+    str: The label.
+    """
+    words = fingerprint(statement).replace('"', '').split()
+    if not words:
+        return ''
+    verb = words[0].upper()
+    upper = [word.upper() for word in words]
+    if verb in ('UPDATE', 'VACUUM', 'ANALYZE', 'TRUNCATE') and len(words) > 1:
+        if len(words) > 2 and upper[1] == 'FULL':
+            return f'{verb} FULL {words[2]}'
+        return f'{verb} {words[1]}'
+    if verb == 'INSERT' and 'INTO' in upper:
+        return f'INSERT {words[upper.index("INTO") + 1]}'
+    if verb in ('DELETE', 'SELECT', 'WITH') and 'FROM' in upper and upper.index('FROM') + 1 < len(words):
+        return f'{verb} {words[upper.index("FROM") + 1]}'
+    return verb
+
+
+class SQLInstrument:
+    """
+    Records every statement run on an engine with before_cursor_execute/after_cursor_execute events.
+
+    Each record holds the duration, the rowcount, the fingerprint, a phase label (the command and
+    table, or the name given with phase()) and the iteration set with iteration(). breakdown() sums
+    the records per phase so a slow erasure can be split into its UPDATEs, COMMIT and VACUUMs.
+
+    Statements whose fingerprint matches one of the explain patterns also get their
+    EXPLAIN (ANALYZE, BUFFERS) plan saved. The plan is taken on a separate cursor just before the
+    statement runs, inside a savepoint (or a transaction on autocommit connections) that is rolled
+    back, so the statement the caller executes, its result and its rowcount are unchanged and the
+    plan sees the same rows. The EXPLAIN is not part of the recorded duration; its time is added up
+    per iteration in explain_seconds() so timed tests can take it out of their samples. It still
+    warms the buffer cache, so an explained statement's own duration is a warm cache time and
+    runs with explain patterns are not comparable with runs without. Only single UPDATE,
+    DELETE and SELECT statements are explained; strings of several statements and statements with
+    effects a rollback does not undo (nextval, setval) or row locks (FOR UPDATE/SHARE) are not.
+    connection.commit() goes straight to the DBAPI and is not recorded, only COMMIT statements are.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The engine to instrument, e.g. from init.engine().
+    - explain (list, optional): Regular expressions matched against fingerprints.
+    - max_statement (int): Characters of each statement kept in the records. Default is 200.
+    """
+
+    def __init__(self, engine, explain=None, max_statement=200):
+        self.engine = engine
+        self.explain = [re.compile(pattern, re.IGNORECASE) for pattern in (explain or [])]
+        self.max_statement = max_statement
+        self.records = []
+        self.plans = []
+        self.explain_time = {}      # iteration -> seconds spent capturing plans
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._attached = False
+
+    def __enter__(self):
+        self.attach()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.detach()
+
+    def attach(self):
+        """
+        Start listening to the engine's cursor events.
+
+        Returns:
+        None
+        """
+        if not self._attached:
+            event.listen(self.engine, 'before_cursor_execute', self._before)
+            event.listen(self.engine, 'after_cursor_execute', self._after)
+            event.listen(self.engine, 'handle_error', self._error)
+            self._attached = True
+
+    def detach(self):
+        """
+        Stop listening to the engine's cursor events.
+
+        Returns:
+        None
+        """
+        if self._attached:
+            event.remove(self.engine, 'before_cursor_execute', self._before)
+            event.remove(self.engine, 'after_cursor_execute', self._after)
+            event.remove(self.engine, 'handle_error', self._error)
+            self._attached = False
+
+    def reset(self):
+        """
+        Forget every record and plan.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self.records = []
+            self.plans = []
+            self.explain_time = {}
+
+    def explain_seconds(self, iteration=None):
+        """
+        Time spent running the EXPLAIN ANALYZE of explained statements, which the caller's own
+        timing includes although the instrument put it there.
+
+        Parameters:
+        - iteration (any, optional): Only count this iteration. Defaults to every statement recorded.
+
+        Returns:
+        float: Seconds.
+        """
+        with self._lock:
+            if iteration is None:
+                return sum(self.explain_time.values())
+            return self.explain_time.get(iteration, 0.0)
+
+    @contextmanager
+    def iteration(self, label):
+        """
+        Tag the statements run inside the with block with an iteration label.
+
+        Parameters:
+        - label (any): The iteration, e.g. its number.
+        """
+        previous = getattr(self._local, 'iteration', None)
+        self._local.iteration = label
+        try:
+            yield
+        finally:
+            self._local.iteration = previous
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Label the statements run inside the with block with a phase name instead of their command and table.
+
+        Parameters:
+        - name (str): The phase name.
+        """
+        previous = getattr(self._local, 'phase', None)
+        self._local.phase = name
+        try:
+            yield
+        finally:
+            self._local.phase = previous
+
+    def _should_explain(self, normalized):
+        if not self.explain or not any(pattern.search(normalized) for pattern in self.explain):
+            return False
+        verb = normalized.split(' ', 1)[0].upper()
+        # literals are gone from the fingerprint, so any ; left separates statements
+        return verb in explainable and ';' not in normalized and not side_effects.search(normalized)
+
+    def _capture_plan(self, conn, statement, parameters):
+        dbapi_connection = conn.connection.dbapi_connection
+        autocommit = dbapi_connection.autocommit
+        explain_cursor = dbapi_connection.cursor()
+        try:
+            explain_cursor.execute('BEGIN;' if autocommit else 'SAVEPOINT instrument_explain;')
+            try:
+                explain_cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                return '\n'.join(row[0] for row in explain_cursor.fetchall())
+            except Exception:
+                # the statement itself reports the error when it runs
+                return None
+            finally:
+                explain_cursor.execute('ROLLBACK;' if autocommit else 'ROLLBACK TO SAVEPOINT instrument_explain;')
+                if not autocommit:
+                    explain_cursor.execute('RELEASE SAVEPOINT instrument_explain;')
+        finally:
+            explain_cursor.close()
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        normalized = fingerprint(statement)
+        plan = None
+        if not executemany and self._should_explain(normalized):
+            e_time = time.perf_counter()
+            plan = self._capture_plan(conn, statement, parameters)
+            iteration = getattr(self._local, 'iteration', None)
+            with self._lock:
+                self.explain_time[iteration] = self.explain_time.get(iteration, 0.0) + time.perf_counter() - e_time
+        conn.info.setdefault('instrument', []).append((time.perf_counter(), statement, normalized, plan))
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started, original, normalized, plan = conn.info['instrument'].pop()
+        duration = time.perf_counter() - started
+        rowcount = cursor.rowcount
+
+        record = {"iteration": getattr(self._local, 'iteration', None),
+                  "phase": getattr(self._local, 'phase', None) or phase_name(original),
+                  "fingerprint": normalized,
+                  "statement": original[:self.max_statement],
+                  "duration": duration,
+                  "rowcount": rowcount}
+        with self._lock:
+            self.records.append(record)
+            if plan is not None:
+                self.plans.append({**record, "plan": plan})
+
+    def _error(self, context):
+        # a failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('instrument'):
+            context.connection.info['instrument'].pop()
+
+    def dataframe(self):
+        """
+        Returns:
+        pandas.DataFrame: One row per recorded statement.
+        """
+        with self._lock:
+            return pd.DataFrame(self.records, columns=['iteration', 'phase', 'fingerprint', 'statement', 'duration', 'rowcount'])
+
+    def breakdown(self, iteration=None):
+        """
+        Sum the recorded statements per phase.
+
+        Parameters:
+        - iteration (any, optional): Only count statements from this iteration. Defaults to every
+                                     statement run inside an iteration() block.
+
+        Returns:
+        pandas.DataFrame: phase, calls, rows, total_ms, mean_ms and share of the total time, slowest first.
+        """
+        records = self.dataframe()
+        records = records[records['iteration'] == iteration] if iteration is not None else records[records['iteration'].notna()]
+        if records.empty:
+            return pd.DataFrame(columns=['phase', 'calls', 'rows', 'total_ms', 'mean_ms', 'share'])
+        table = records.groupby('phase', sort=False).agg(calls=('duration', 'size'),
+                                                         rows=('rowcount', lambda x: x.dropna().clip(lower=0).sum()),
+                                                         total_ms=('duration', 'sum'),
+                                                         mean_ms=('duration', 'mean')).reset_index()
+        table['total_ms'] *= 1000
+        table['mean_ms'] *= 1000
+        table['share'] = table['total_ms'] / table['total_ms'].sum()
+        return table.sort_values('total_ms', ascending=False).reset_index(drop=True)
+
+    def summary(self, iteration=None):
+        """
+        breakdown() as a dict, for attaching to benchmark results.
+
+        Returns:
+        dict: Phase mapped to calls, rows, total_ms and mean_ms.
+        """
+        return {row['phase']: {"calls": int(row['calls']), "rows": int(row['rows']),
+                               "total_ms": float(row['total_ms']), "mean_ms": float(row['mean_ms'])}
+                for _, row in self.breakdown(iteration).iterrows()}
+
+    def print_breakdown(self, iteration=None):
+        """
+        Print breakdown() as a table.
+
+        Parameters:
+        - iteration (any, optional): Only count statements from this iteration.
+
+        Returns:
+        None
+        """
+        table = PrettyTable(['phase', 'calls', 'rows', 'total (ms)', 'mean (ms)', 'share'])
+        table.align['phase'] = 'l'
+        for _, row in self.breakdown(iteration).iterrows():
+            table.add_row([row['phase'], row['calls'], int(row['rows']), round(row['total_ms'], 3),
+                           round(row['mean_ms'], 3), f'{round(row["share"] * 100, 1)}%'])
+        print(table)
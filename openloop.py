@@ -0,0 +1,313 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import matplotlib.pyplot as plt
+import numpy as np
+from sqlalchemy import create_engine, text
+import init as db
+from samplers import EmployeeSampler
+from value_generators import ValueGenerators
+
+# share of each operation in the offered load
+default_mix = {
+    "view": .40,
+    "update": .45,
+    "soft_delete": .10,
+    "column_erasure": .04,
+    "row_erasure": .01,
+}
+arrivals = ('poisson', 'fixed')
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram: log-linear buckets with a fixed relative error, so recording is
+    O(1), memory does not grow with the number of samples and tail percentiles stay accurate.
+
+    Values are recorded in microseconds. Values below 2**sub_bucket_bits are exact and every
+    power of two above that is split into 2**(sub_bucket_bits - 1) buckets, which bounds the error
+    of a reported percentile to 2**-(sub_bucket_bits - 1) (under 1.6% with the default of 7).
+    Thread safe.
+
+    Parameters:
+    - sub_bucket_bits (int): Precision of the buckets. Default is 7.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.counts = np.zeros(65 * self.sub_buckets, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, micros):
+        if micros < self.sub_buckets:
+            return micros
+        shift = micros.bit_length() - self.sub_bucket_bits
+        return shift * self.sub_buckets + (micros >> shift)
+
+    def _value(self, bucket):
+        # highest value that lands in the bucket
+        shift, sub = divmod(bucket, self.sub_buckets)
+        if shift == 0:
+            return sub
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        """
+        Record one latency.
+
+        Parameters:
+        - seconds (float): The latency in seconds.
+
+        Returns:
+        None
+        """
+        bucket = self._bucket(max(0, int(seconds * 1e6)))
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        """
+        Add the samples of another histogram with the same precision.
+
+        Parameters:
+        - other (LatencyHistogram): The histogram to add.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self.counts += other.counts
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        Latency at or below which p percent of the samples fall.
+
+        Parameters:
+        - p (float): Percentile between 0 and 100.
+
+        Returns:
+        float: The latency in seconds, or None if nothing was recorded.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = max(1, int(np.ceil(p / 100 * self.count)))
+            bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+            return min(self._value(bucket) / 1e6, self.max)
+
+    def summary(self):
+        """
+        Returns:
+        dict: count, mean, p50, p95, p99 and max, in seconds.
+        """
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else None,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99),
+                "max": self.max if self.count else None}
+
+
+def schedule(rate, duration, arrival, rng):
+    """
+    Start times of the operations, in seconds from the start of the run.
+
+    Parameters:
+    - rate (float): Offered load in operations per second.
+    - duration (float): Length of the run in seconds.
+    - arrival (str): 'poisson' for exponential gaps or 'fixed' for evenly spaced starts.
+    - rng (numpy.random.Generator): Random generator for the Poisson gaps.
+
+    Returns:
+    numpy.ndarray: Sorted start times.
+    """
+    if arrival == 'fixed':
+        return np.arange(0, duration, 1 / rate)
+    gaps = rng.exponential(1 / rate, size=int(rate * duration * 1.5) + 16)
+    times = np.cumsum(gaps)
+    while times[-1] < duration:
+        times = np.concatenate([times, times[-1] + np.cumsum(rng.exponential(1 / rate, size=len(gaps)))])
+    return times[times < duration]
+
+
+def open_loop(engine, rate, duration, mix=None, arrival='poisson', seed=None, max_workers=32, vacuum=False):
+    """
+    Issue operations at a target rate, independent of how fast they complete, and record their latency.
+
+    Every operation is drawn up front (type, target account, column, new value) and submitted to a
+    thread pool at its scheduled time. Latency is measured from the scheduled start, not from when a
+    thread picked it up, so queueing behind slow operations is counted (no coordinated omission).
+    Service time, from the actual start, is recorded separately. Row erasures target accounts that
+    no other operation in the run touches.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - rate (float): Offered load in operations per second.
+    - duration (float): Seconds over which operations are issued.
+    - mix (dict, optional): Operation name mapped to its share of the load. Defaults to default_mix.
+    - arrival (str): 'poisson' or 'fixed'. Default is 'poisson'.
+    - seed (int, optional): Seed for the schedule and the operations.
+    - max_workers (int): Threads (and pooled connections) executing operations. Default is 32.
+    - vacuum (bool): Run VACUUM FULL on both tables after each column erasure. Default is False.
+
+    Returns:
+    dict: 'offered' and 'achieved' rates, 'elapsed' seconds, and per operation in 'operations' the
+          latency summary, the service time summary and the error count.
+    """
+    if arrival not in arrivals:
+        raise ValueError(f"Unknown arrival '{arrival}', expected one of {arrivals}")
+    mix = default_mix if mix is None else mix
+    names = list(mix.keys())
+    weights = np.array([mix[name] for name in names], dtype=float)
+    rng = np.random.default_rng(seed)
+    values = ValueGenerators(seed=rng.integers(2**32))
+
+    with engine.connect() as connection:
+        accounts = connection.execute(text('SELECT index, applicant_id FROM applicant_details WHERE is_deleted = false ORDER BY index;')).all()
+    starts = schedule(rate, duration, arrival, rng)
+    ops = rng.choice(len(names), size=len(starts), p=weights / weights.sum())
+    # row erasure victims are drawn without replacement and kept away from every other operation
+    num_rows = int(np.sum(ops == names.index('row_erasure'))) if 'row_erasure' in names else 0
+    order = rng.permutation(len(accounts))
+    victims = [accounts[i] for i in order[:num_rows]]
+    others = [accounts[i] for i in order[num_rows:]]
+    if not others:
+        raise ValueError('Not enough live applicants for the run')
+    targets = rng.integers(len(others), size=len(starts))
+    # toggled columns depend on the current row, which is not known up front
+    update_columns = ['annual_income', 'applicant_age', 'work_experience', 'occupation', 'residence_city', 'residence_state',
+                      'years_in_current_employment', 'years_in_current_residence']
+    columns = rng.integers(len(update_columns), size=len(starts))
+    roles = rng.integers(len(db.Role), size=len(starts))
+    purposes = rng.integers(2, size=len(starts))
+
+    tasks = []
+    for i, op in enumerate(ops):
+        name = names[op]
+        if name == 'row_erasure':
+            tasks.append((name, victims.pop()))
+        elif name == 'update':
+            column = update_columns[columns[i]]
+            tasks.append((name, others[targets[i]], column, values.batch(column, 1)[0]))
+        elif name == 'view':
+            tasks.append((name, others[targets[i]], list(db.Role)[roles[i]], [db.Purpose.audit, db.Purpose.review][purposes[i]]))
+        else:
+            tasks.append((name, others[targets[i]]))
+
+    # a pool as large as the thread pool, so operations never wait for a connection
+    pooled = create_engine(engine.url, pool_size=max_workers, max_overflow=0)
+    cache = db.PolicyCache()
+    local = threading.local()
+    latency = {name: LatencyHistogram() for name in names}
+    service = {name: LatencyHistogram() for name in names}
+    errors = {name: 0 for name in names}
+    seeds = iter(rng.integers(2**32, size=max_workers).tolist())
+    seeds_lock = threading.Lock()
+
+    def run(task, scheduled):
+        begun = time.perf_counter()
+        if not hasattr(local, 'employees'):
+            with seeds_lock:
+                local.employees = EmployeeSampler(seed=next(seeds))
+        name, account = task[0], task[1]
+        try:
+            if name == 'column_erasure':
+                db.remove_column_for_applicant('residence_city', account[0], pooled, vacuum=vacuum)
+            elif name == 'row_erasure':
+                db.delete_row(account[1], pooled)
+            else:
+                with db.Session(pooled, policy_cache=cache, employee_sampler=local.employees) as session:
+                    if name == 'update':
+                        session.update_data(account[1], task[2], task[3], index=account[0])
+                    elif name == 'view':
+                        session.log_view(session.add_access_policy(task[2], task[3]), session.select_random_employee(), account[0])
+                    else:
+                        session.soft_delete(account[0])
+        except Exception:
+            with seeds_lock:
+                errors[name] += 1
+        finished = time.perf_counter()
+        latency[name].record(finished - scheduled)
+        service[name].record(finished - begun)
+
+    db.dprint(f'Open loop: {len(tasks)} operations at {rate}/s ({arrival})')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        s_time = time.perf_counter()
+        for task, start in zip(tasks, starts):
+            delay = s_time + start - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, task, s_time + start)
+    elapsed = time.perf_counter() - s_time
+    pooled.dispose()
+
+    return {"offered": rate,
+            "achieved": len(tasks) / elapsed,
+            "elapsed": elapsed,
+            "operations": {name: {"latency": latency[name].summary(),
+                                  "service": service[name].summary(),
+                                  "errors": errors[name]} for name in names}}
+
+
+def evaluate_open_loop(num_app, hist_size, engine, rates=(25, 50, 100, 200, 400), duration=20.0, mix=None, arrival='poisson', seed=-1, max_workers=32, p99_limit=1.0):
+    """
+    Run open_loop() at increasing offered loads on a fresh database each, print p50/p95/p99/max per
+    operation and plot p99 against the offered load.
+
+    A load is reported as saturated when fewer operations per second complete than are offered
+    (below 95%) or an operation's p99 passes p99_limit seconds.
+
+    Parameters:
+    - num_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - rates (tuple): Offered loads in operations per second.
+    - duration (float): Seconds each load is offered for. Default is 20.
+    - mix (dict, optional): Operation name mapped to its share of the load. Defaults to default_mix.
+    - arrival (str): 'poisson' or 'fixed'. Default is 'poisson'.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - max_workers (int): Threads executing operations. Default is 32.
+    - p99_limit (float): p99 latency in seconds past which a load counts as saturated. Default is 1.
+
+    Returns:
+    list: The open_loop() result for each rate, with a 'saturated' flag added.
+    """
+    import test
+    runs = []
+    for rate in rates:
+        print(f'Open loop test [rate={rate}/s, arrival={arrival}, duration={duration}s, num_app={num_app}, num_hist={hist_size}]')
+        test.init(engine, num_app, hist_size)
+        result = open_loop(engine, rate, duration, mix=mix, arrival=arrival, seed=seed if seed > 0 else None, max_workers=max_workers)
+        p99s = [op['latency']['p99'] for op in result['operations'].values() if op['latency']['p99'] is not None]
+        result['saturated'] = result['achieved'] < .95 * rate or any(p99 > p99_limit for p99 in p99s)
+        for name, op in result['operations'].items():
+            summary = op['latency']
+            if summary['count'] == 0:
+                continue
+            print(f'\t{name:>15}: n={summary["count"]:<6} ' +
+                  ' '.join(f'{key}={round(summary[key] * 1000, 2)}ms' for key in ('p50', 'p95', 'p99', 'max')) +
+                  (f' errors={op["errors"]}' if op['errors'] else ''))
+        print(f'\tachieved {round(result["achieved"], 1)}/s{" (saturated)" if result["saturated"] else ""}')
+        runs.append(result)
+
+    names = list((default_mix if mix is None else mix).keys())
+    for name in names:
+        plt.plot(rates, [(run['operations'][name]['latency']['p99'] or 0) * 1000 for run in runs], marker='o', label=name)
+    plt.title(f'p99 latency vs offered load ({arrival} arrivals)')
+    plt.xlabel('Offered Load (ops/sec)')
+    plt.ylabel('p99 Latency (ms)')
+    plt.yscale('log')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+    return runs
@@ -0,0 +1,204 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import text
+import init as db
+
+
+# soft delete time of the applicant a, one index lookup on init.purge_indexes
+deleted_at_query = f'''SELECT max(h.time) AS deleted_at FROM action_history h
+                      WHERE h.data_id = a.index AND h.operation = '{db.Operation.delete.value}' '''
+
+
+class Purger:
+    """
+    Turns soft deletes into hard deletes once they are older than a retention window.
+
+    The time of a soft delete is the time of its soft_delete entry in action_history. Each chunk is one
+    transaction that:
+    - picks up to chunk_size soft deleted applicants past the window, in no particular order, with
+      FOR UPDATE SKIP LOCKED, so rows a foreground transaction is changing are left for later and
+      several purgers can share the backlog;
+    - deletes their action_history rows, then their applicant_details rows, with one statement
+      each (Session.delete_rows()).
+    Between chunks the purger sleeps long enough to stay under rate rows per second. The deleted
+    rows stay on disk until the tables are vacuumed; pass a VacuumScheduler to have it track them.
+    Soft deleted applicants without a soft_delete entry in their history are never purged.
+
+    Without the data_id index of init.fk_indexes, every purged applicant costs a scan of
+    action_history for the ON DELETE CASCADE check. With init.purge_indexes a chunk reads only the
+    soft deleted applicants it looks at, each with one index lookup of its soft delete time, instead
+    of every soft_delete entry in action_history.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - retention (float): Seconds a soft deleted applicant is kept before it is purged. Default is 0.
+    - chunk_size (int): Applicants purged per transaction. Default is 500.
+    - rate (float, optional): Maximum applicants purged per second. Default is None, no limit.
+    - scheduler (VacuumScheduler, optional): Told about every purged chunk so it can compact the tables.
+    """
+
+    def __init__(self, engine, retention=0.0, chunk_size=500, rate=None, scheduler=None):
+        self.engine = engine
+        self.retention = retention
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.scheduler = scheduler
+        self.purged = 0
+        self.history_rows = 0
+        self.chunks = []
+        self._lags = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def backlog(self):
+        """
+        Count the soft deleted applicants that are waiting.
+
+        Returns:
+        dict: 'soft_deleted' (all of them), 'due' (past the retention window) and 'oldest' (seconds
+              since the oldest soft delete, None if there is none).
+        """
+        with self.engine.connect() as connection:
+            row = connection.execute(text(f'''SELECT count(*),
+                    count(*) FILTER (WHERE d.deleted_at <= :cutoff),
+                    min(d.deleted_at)
+                FROM applicant_details a
+                CROSS JOIN LATERAL ({deleted_at_query}) d
+                WHERE a.is_deleted AND d.deleted_at IS NOT NULL;'''), {"cutoff": self._cutoff()}).fetchone()
+        return {"soft_deleted": row[0],
+                "due": row[1],
+                "oldest": (datetime.now() - row[2]).total_seconds() if row[2] is not None else None}
+
+    def purge_chunk(self):
+        """
+        Hard delete one chunk of due applicants and their history.
+
+        Returns:
+        int: Number of applicants purged, 0 once nothing is due.
+        """
+        s_time = time.perf_counter()
+        with db.Session(self.engine) as session:
+            # no ORDER BY: the scan stops after chunk_size due applicants instead of looking at the whole backlog
+            rows = session.connection.execute(text(f'''SELECT a.index, d.deleted_at
+                FROM applicant_details a
+                CROSS JOIN LATERAL ({deleted_at_query}) d
+                WHERE a.is_deleted AND d.deleted_at <= :cutoff
+                LIMIT :chunk_size
+                FOR UPDATE OF a SKIP LOCKED;'''), {"cutoff": self._cutoff(), "chunk_size": self.chunk_size}).all()
+            if not rows:
+                return 0
+            ids = [row[0] for row in rows]
+            history_rows = session.delete_rows(ids, index=True)['action_history']
+        now = datetime.now()
+        db.applicants_version += 1
+        if self.scheduler is not None:
+            self.scheduler.erasure_done(['applicant_details', 'action_history'])
+        with self._lock:
+            self.purged += len(ids)
+            self.history_rows += history_rows
+            self._lags.extend((now - row[1]).total_seconds() for row in rows)
+            self.chunks.append({"time": now, "applicants": len(ids), "history": history_rows, "seconds": time.perf_counter() - s_time})
+        db.dprint(f'Purged {len(ids)} applicants and {history_rows} history rows')
+        return len(ids)
+
+    def run_once(self, max_chunks=None):
+        """
+        Purge chunks until nothing is due (or max_chunks were purged), respecting rate.
+
+        Parameters:
+        - max_chunks (int, optional): Stop after this many chunks.
+
+        Returns:
+        int: Number of applicants purged.
+        """
+        total = 0
+        chunks = 0
+        s_time = time.perf_counter()
+        while not self._stop.is_set() and (max_chunks is None or chunks < max_chunks):
+            purged = self.purge_chunk()
+            if purged == 0:
+                break
+            total += purged
+            chunks += 1
+            if self.rate:
+                # sleep until the applicants purged so far fit under the rate
+                wait = total / self.rate - (time.perf_counter() - s_time)
+                if wait > 0:
+                    self._stop.wait(wait)
+        return total
+
+    def metrics(self):
+        """
+        Progress of the purger and the delay between soft delete and purge.
+
+        Returns:
+        dict: 'purged' applicants, 'history' rows, 'chunks', the current 'backlog' (see backlog()),
+              'rows_per_second' while purging and 'lag' (mean, p50, p99 and max seconds from soft
+              delete to purge, empty if nothing was purged).
+        """
+        with self._lock:
+            lags = np.array(self._lags)
+            chunks = list(self.chunks)
+            purged = self.purged
+            history_rows = self.history_rows
+        busy = sum(chunk['seconds'] for chunk in chunks)
+        lag = {}
+        if len(lags):
+            lag = {"mean": float(lags.mean()),
+                   "p50": float(np.percentile(lags, 50)),
+                   "p99": float(np.percentile(lags, 99)),
+                   "max": float(lags.max())}
+        return {"purged": purged,
+                "history": history_rows,
+                "chunks": len(chunks),
+                "backlog": self.backlog(),
+                "rows_per_second": purged / busy if busy else None,
+                "lag": lag}
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=5.0):
+        """
+        Run run_once() every interval seconds in a background thread.
+
+        Parameters:
+        - interval (float): Seconds between passes over the backlog. Default is 5.
+
+        Returns:
+        None
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='purger', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread started by start(), after the chunk in progress.
+
+        Returns:
+        None
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._stop.clear()
+
+    def _cutoff(self):
+        return datetime.now() - timedelta(seconds=self.retention)
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as error:
+                print(f'Purger pass failed: {error}')
+            self._stop.wait(interval)
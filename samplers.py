@@ -0,0 +1,247 @@
+import numpy as np
+from sqlalchemy import text
+import init as db
+
+
+class EmployeeSampler:
+    """
+    Draws random employee IDs in process instead of running ORDER BY RANDOM() for every action.
+
+    The IDs are read once into a NumPy array and reloaded whenever init.load_employees() or
+    init.hard_reset() has run since the last load.
+
+    Parameters:
+    - seed (int, optional): Seed for the random generator, so runs with the same seed draw the same employees.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.ids = np.empty(0, dtype=np.int64)
+        self._version = None
+
+    def seed(self, seed):
+        """
+        Restart the random generator from a seed.
+
+        Parameters:
+        - seed (int): The new seed.
+
+        Returns:
+        None
+        """
+        self.rng = np.random.default_rng(seed)
+
+    def refresh(self, engine):
+        """
+        Reload the employee IDs.
+
+        Parameters:
+        - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+
+        Returns:
+        None
+        """
+        with engine.connect() as connection:
+            result = connection.execute(text('SELECT id FROM employees ORDER BY id;'))
+            self.ids = np.fromiter((row[0] for row in result), dtype=np.int64)
+        self._version = db.employees_version
+
+    def sample(self, engine, n=None):
+        """
+        Draw random employee IDs, reloading them first if the employee table was reloaded.
+
+        Parameters:
+        - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+        - n (int, optional): Number of IDs to draw. Draws a single ID if None.
+
+        Returns:
+        int or numpy.ndarray: One employee ID, or an array of n IDs drawn with replacement.
+        """
+        if self._version != db.employees_version:
+            self.refresh(engine)
+        if len(self.ids) == 0:
+            raise ValueError('There are no employees to sample from')
+        if n is None:
+            return int(self.ids[self.rng.integers(len(self.ids))])
+        return self.ids[self.rng.integers(len(self.ids), size=n)]
+
+
+class ApplicantSampler:
+    """
+    Draws random live applicants from an in-process pool instead of sorting the table by RANDOM().
+
+    The pool holds the index of every applicant that is not soft deleted, with a position map so
+    excluding or removing an index is O(1). Rows are fetched by primary key in batches of
+    batch_size and handed out one at a time, so a row can be slightly out of date when it is used.
+    If the table holds more than max_pool live applicants the pool is not built and batches are
+    drawn with TABLESAMPLE instead. The pool is rebuilt whenever applicants are (re)loaded.
+
+    Parameters:
+    - seed (int, optional): Seed for the random generator.
+    - batch_size (int): Number of rows fetched per query. Default is 64.
+    - max_pool (int): Largest number of live applicants mirrored in memory. Default is 5,000,000.
+    - tablesample (str): TABLESAMPLE method used past max_pool, 'SYSTEM' or 'BERNOULLI'. Default is 'SYSTEM'.
+    """
+
+    def __init__(self, seed=None, batch_size=64, max_pool=5000000, tablesample='SYSTEM'):
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.max_pool = max_pool
+        self.tablesample = tablesample
+        self.mirrored = True
+        self.pool = []              # live, non excluded applicant indexes
+        self.positions = {}         # index -> position in pool
+        self.excluded = set()      # the blacklist currently in effect
+        self._held = set()          # excluded indexes taken out of pool, put back when no longer excluded
+        self._rows = []             # prefetched rows, consumed from the end
+        self._version = None
+        self._last_blacklist = None
+
+    def seed(self, seed):
+        """
+        Restart the random generator from a seed and drop prefetched rows.
+
+        Parameters:
+        - seed (int): The new seed.
+
+        Returns:
+        None
+        """
+        self.rng = np.random.default_rng(seed)
+        self._rows = []
+
+    def refresh(self, engine):
+        """
+        Rebuild the pool of live applicant indexes, or switch to TABLESAMPLE if there are too many.
+
+        Parameters:
+        - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+
+        Returns:
+        None
+        """
+        with engine.connect() as connection:
+            live = connection.execute(text('SELECT count(*) FROM applicant_details WHERE is_deleted = false;')).scalar()
+            self.mirrored = live <= self.max_pool
+            self.pool = []
+            if self.mirrored:
+                result = connection.execute(text('SELECT index FROM applicant_details WHERE is_deleted = false ORDER BY index;'))
+                self.pool = [row[0] for row in result]
+        self.positions = {index: i for i, index in enumerate(self.pool)}
+        # indexes are reused after a reset, so an old blacklist may name different applicants now
+        self.excluded = set()
+        self._held = set()
+        self._last_blacklist = None
+        self._rows = []
+        self._version = db.applicants_version
+
+    def exclude(self, indexes):
+        """
+        Stop handing out these applicants until include() is called for them, sample() is given a
+        blacklist without them or the sampler is rebuilt for new data.
+
+        Parameters:
+        - indexes (iterable): Applicant indexes to exclude.
+
+        Returns:
+        None
+        """
+        for index in indexes:
+            if index not in self.excluded:
+                self.excluded.add(index)
+                if index in self.positions:
+                    self._drop(index)
+                    self._held.add(index)
+
+    def include(self, indexes):
+        """
+        Hand out previously excluded applicants again, unless they were removed in the meantime.
+
+        Parameters:
+        - indexes (iterable): Applicant indexes to include.
+
+        Returns:
+        None
+        """
+        for index in indexes:
+            self.excluded.discard(index)
+            if index in self._held:
+                self._held.discard(index)
+                self.positions[index] = len(self.pool)
+                self.pool.append(index)
+
+    def remove(self, index):
+        """
+        Drop an applicant from the pool, e.g. after a soft delete. O(1).
+
+        Parameters:
+        - index (int): The applicant index.
+
+        Returns:
+        None
+        """
+        self._held.discard(index)
+        self._drop(index)
+
+    def _drop(self, index):
+        position = self.positions.pop(index, None)
+        if position is None:
+            return
+        last = self.pool.pop()
+        if last != index:
+            self.pool[position] = last
+            self.positions[last] = position
+
+    def sample(self, engine, blacklist=None):
+        """
+        Return a random live applicant row, like init.get_random_account().
+
+        Parameters:
+        - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+        - blacklist (list, optional): Applicant indexes to exclude for this call, replacing the
+                                      previous call's blacklist. Passing the same list again costs nothing.
+
+        Returns:
+        tuple: values from the selected row, or None if there are no applicants left.
+        """
+        if self._version != db.applicants_version:
+            self.refresh(engine)
+        if blacklist is not self._last_blacklist:
+            blacklisted = set(blacklist) if blacklist else set()
+            self.include(self.excluded - blacklisted)
+            self.exclude(blacklisted - self.excluded)
+            self._last_blacklist = blacklist
+        for _ in range(10):
+            while self._rows:
+                row = self._rows.pop()
+                if row[0] in self.positions or (not self.mirrored and row[0] not in self.excluded):
+                    return row
+            if self.mirrored and not self.pool:
+                return None
+            self._rows = self._fetch(engine)
+        return None
+
+    def _fetch(self, engine):
+        columns = ','.join(list(db.data_schema.keys()))
+        with engine.connect() as connection:
+            if not self.mirrored:
+                estimate = connection.execute(text("SELECT reltuples FROM pg_class WHERE relname = 'applicant_details';")).scalar()
+                percent = min(100.0, 100.0 * 2 * self.batch_size / max(estimate, 1))
+                result = connection.execute(text(f'''SELECT index,{columns}
+                    FROM applicant_details TABLESAMPLE {self.tablesample} ({percent})
+                    WHERE is_deleted = false
+                    LIMIT {self.batch_size};'''))
+                rows = list(result)
+                return [rows[i] for i in self.rng.permutation(len(rows))]
+
+            picks = self.rng.integers(len(self.pool), size=min(self.batch_size, len(self.pool)))
+            indexes = list(dict.fromkeys(self.pool[i] for i in picks))
+            result = connection.execute(text(f'''SELECT index,{columns}
+                FROM applicant_details
+                WHERE index = ANY(:indexes) AND is_deleted = false;'''), {"indexes": indexes})
+            rows = {row[0]: row for row in result}
+        # anything missing was deleted or soft deleted behind our back
+        for index in indexes:
+            if index not in rows:
+                self.remove(index)
+        return [rows[index] for index in reversed(indexes) if index in rows]
@@ -0,0 +1,325 @@
+import base64
+import os
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy import text, types
+import init as db
+from history_synth import write_copy
+
+# columns of data_schema that hold personal data and are stored encrypted
+sealed_columns = [col for col in db.data_schema.keys() if col not in ('applicant_id', 'is_deleted')]
+
+sealed_data_schema = {col: types.LargeBinary if col in sealed_columns else col_type for col, col_type in db.data_schema.items()}
+
+# new_data holds base64 ciphertexts, an encrypted 'add' row does not fit in 500 characters
+sealed_history_schema = {**db.action_history_schema, "new_data": types.Text}
+
+granularities = ('column', 'applicant')
+# column_name of the key that encrypts every column with 'applicant' granularity
+applicant_key = '*'
+
+
+def seal(key, data_id, column, value):
+    """
+    Encrypt one value with AES-GCM. The applicant and column are bound in as associated data, so a
+    ciphertext copied to another row or column does not decrypt.
+
+    Parameters:
+    - key (bytes): The 256 bit data key.
+    - data_id (int): Index of the applicant the value belongs to.
+    - column (str): Column of data_schema the value belongs to.
+    - value (any): The value, or None.
+
+    Returns:
+    bytes: 12 byte nonce followed by the ciphertext and tag, or None for None.
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    nonce = os.urandom(12)
+    return nonce + AESGCM(key).encrypt(nonce, str(value).encode(), f'{data_id}:{column}'.encode())
+
+
+def unseal(key, data_id, column, sealed):
+    """
+    Decrypt a value written by seal() and convert it back to the column's type.
+
+    Parameters:
+    - key (bytes): The data key, or None if it was shredded.
+    - data_id (int): Index of the applicant the value belongs to.
+    - column (str): Column of data_schema the value belongs to.
+    - sealed (bytes): The output of seal(), or None.
+
+    Returns:
+    any: The value, or None if it is NULL or its key is gone.
+    """
+    if key is None or sealed is None:
+        return None
+    sealed = bytes(sealed)
+    value = AESGCM(bytes(key)).decrypt(sealed[:12], sealed[12:], f'{data_id}:{column}'.encode()).decode()
+    if db.data_schema[column] is types.Integer:
+        return int(value)
+    if db.data_schema[column] is types.Boolean:
+        return value == 'True'
+    return value
+
+
+class CryptoShredder:
+    """
+    Storage mode where every personal value is encrypted with a data key of its applicant, and
+    erasure deletes keys instead of rewriting rows.
+
+    The personal columns of applicant_details are bytea ciphertexts, and action_history.new_data
+    holds base64 ciphertexts in the usual key=value layout. The keys live in applicant_keys, one
+    row per applicant and column ('column' granularity) or one per applicant ('applicant'
+    granularity). Erasing a column or an applicant deletes its keys and runs VACUUM FULL on
+    applicant_keys only, which does not depend on the size of the history. The ciphertexts stay in
+    both tables (and in the WAL and backups) but can no longer be read. Backups of applicant_keys
+    have to expire for the erasure to be complete.
+
+    Encryption happens in Python with AES-GCM, so keys never appear in SQL text or the server log.
+    view() and history() decrypt many applicants in one query each.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - granularity (str): 'column' for a key per applicant and column, 'applicant' for one key per applicant. Default is 'column'.
+    """
+
+    def __init__(self, engine, granularity='column'):
+        if granularity not in granularities:
+            raise ValueError(f"Unknown key granularity '{granularity}', expected one of {granularities}")
+        self.engine = engine
+        self.granularity = granularity
+
+    def key_name(self, column):
+        """
+        Returns:
+        str: The applicant_keys.column_name of the key that encrypts column.
+        """
+        return column if self.granularity == 'column' else applicant_key
+
+    def init(self, num_applicants=-1):
+        """
+        Reset the database and create the tables of init.init() with encrypted personal columns,
+        plus applicant_keys, then load employees and applicants.
+
+        Parameters:
+        - num_applicants (int): Number of applicants to load. Default is -1, which loads the whole CSV.
+
+        Returns:
+        dict: The statistics of bulk_load().
+        """
+        db.hard_reset(self.engine)
+        db.HISTORY_LAYOUT = db.HistoryLayout.string
+        db.HISTORY_PARTITIONING = db.HistoryPartitioning.none
+        db.create_sequence(self.engine)
+        db.create_table('applicant_details', sealed_data_schema, self.engine)
+        db.create_table('employees', db.employee_schema, self.engine, p_key='id')
+        db.create_table('action_history', sealed_history_schema, self.engine)
+        db.create_table('privacy_policies', db.privacy_policy_schema, self.engine)
+        db.create_relationship("privacy_policies", "action_history", "index", "policy_id", self.engine)
+        db.create_relationship("applicant_details", "action_history", "index", "data_id", self.engine, cascade_del=True)
+        db.create_relationship("employees", "action_history", "id", "employee_id", self.engine)
+        with self.engine.connect() as connection:
+            connection.execute(text('''CREATE TABLE applicant_keys (
+                data_id BIGINT NOT NULL REFERENCES applicant_details(index) ON DELETE CASCADE,
+                column_name VARCHAR(100) NOT NULL,
+                key BYTEA NOT NULL,
+                PRIMARY KEY (data_id, column_name));'''))
+            connection.commit()
+        db.load_employees(self.engine)
+        return self.bulk_load(num_applicants)
+
+    def bulk_load(self, number_of_rows=-1):
+        """
+        Encrypt the CSV applicants with fresh keys and write applicant_details, applicant_keys and
+        the 'add' history with COPY in one transaction. The indexes are taken from the counter
+        sequence up front so every ciphertext can be bound to its applicant.
+
+        Parameters:
+        - number_of_rows (int): The number of rows to be populated. Default is -1, which loads the whole CSV.
+
+        Returns:
+        dict: Row counts ('applicants', 'keys') and timings in seconds ('encrypt_time', 'copy_time', 'total_time').
+        """
+        s_time = time.perf_counter()
+        policy_id = db.add_access_policy(db.Role.loan_officer, db.Purpose.onboarding, self.engine)
+        employee_id = db.select_random_employee(self.engine)
+        csv_data = pd.read_csv(os.path.join(os.getcwd(), 'Applicant-details.csv'), skiprows=1,
+                               names=db.data_schema.keys(), dtype={'loan_default_risk': bool})
+        csv_data['is_deleted'] = False
+        if number_of_rows != -1:
+            csv_data = csv_data.head(number_of_rows)
+
+        with self.engine.begin() as connection:
+            ids = [row[0] for row in connection.execute(text('SELECT nextval(\'counter\') FROM generate_series(1, :n);'), {"n": len(csv_data)})]
+            names = list(dict.fromkeys(self.key_name(col) for col in sealed_columns))
+            applicants = []
+            keys = []
+            history = []
+            now = datetime.now()
+            for data_id, row in zip(ids, csv_data.itertuples(index=False)):
+                row = row._asdict()
+                data_keys = {name: AESGCM.generate_key(bit_length=256) for name in names}
+                keys.extend([data_id, name, key] for name, key in data_keys.items())
+                sealed = {col: seal(data_keys[self.key_name(col)], data_id, col, row[col]) for col in sealed_columns}
+                applicants.append([data_id] + [sealed[col] if col in sealed else row[col] for col in db.data_schema.keys()])
+                added = {col: base64.b64encode(seal(data_keys[self.key_name(col)], data_id, col, row[col])).decode() for col in sealed_columns}
+                history.append([policy_id, employee_id, data_id, db.Operation.add.value, now,
+                                db.format_new_data(added, 'all_columns', db.HistoryLayout.string), 'all_columns'])
+            encrypt_time = time.perf_counter()
+
+            cursor = connection.connection.cursor()
+            write_copy(cursor, 'applicant_details', ['index'] + [f'"{col}"' for col in db.data_schema.keys()], applicants)
+            write_copy(cursor, 'applicant_keys', ['data_id', 'column_name', 'key'], keys)
+            write_copy(cursor, 'action_history', ['policy_id', 'employee_id', 'data_id', 'operation', 'time', 'new_data', 'column_modified'], history)
+        db.applicants_version += 1
+        copy_time = time.perf_counter()
+        db.dprint(f'Added {len(applicants)} encrypted rows.')
+        return {"applicants": len(applicants),
+                "keys": len(keys),
+                "encrypt_time": encrypt_time - s_time,
+                "copy_time": copy_time - encrypt_time,
+                "total_time": copy_time - s_time}
+
+    def _keys(self, connection, ids):
+        result = connection.execute(text('SELECT data_id, column_name, key FROM applicant_keys WHERE data_id = ANY(:ids);'),
+                                    {"ids": [int(i) for i in ids]})
+        return {(row[0], row[1]): bytes(row[2]) for row in result}
+
+    def view(self, ids):
+        """
+        Decrypt the current record of many applicants in one query.
+
+        Parameters:
+        - ids (list): Indexes of the applicants.
+
+        Returns:
+        pandas.DataFrame: index and the data_schema columns in plain text; shredded values are None.
+        """
+        columns = ', '.join(f'a."{col}"' for col in db.data_schema.keys())
+        with self.engine.connect() as connection:
+            result = connection.execute(text(f'''SELECT a.index, {columns}, k.key_names, k.key_values
+                FROM applicant_details a
+                LEFT JOIN LATERAL (SELECT array_agg(column_name) AS key_names, array_agg(key) AS key_values
+                                   FROM applicant_keys WHERE data_id = a.index) k ON true
+                WHERE a.index = ANY(:ids)
+                ORDER BY a.index;'''), {"ids": [int(i) for i in ids]})
+            rows = []
+            for row in result:
+                index = row[0]
+                keys = dict(zip(row[-2] or [], row[-1] or []))
+                values = dict(zip(db.data_schema.keys(), row[1:-2]))
+                for col in sealed_columns:
+                    values[col] = unseal(keys.get(self.key_name(col)), index, col, values[col])
+                rows.append({"index": index, **values})
+        return pd.DataFrame(rows, columns=['index'] + list(db.data_schema.keys()))
+
+    def history(self, ids):
+        """
+        Decrypt the action_history of many applicants in one query.
+
+        Parameters:
+        - ids (list): Indexes of the applicants.
+
+        Returns:
+        pandas.DataFrame: One row per action with new_data as a dict of plain text values (None if shredded).
+        """
+        with self.engine.connect() as connection:
+            keys = self._keys(connection, ids)
+            result = connection.execute(text('''SELECT index, policy_id, employee_id, data_id, operation, time, new_data, column_modified
+                FROM action_history
+                WHERE data_id = ANY(:ids)
+                ORDER BY data_id, time;'''), {"ids": [int(i) for i in ids]})
+            rows = []
+            for row in result:
+                row = dict(row._mapping)
+                if row['new_data'] is not None:
+                    if row['operation'] == db.Operation.add.value:
+                        pairs = dict(pair.split('=', 1) for pair in row['new_data'].split(','))
+                    else:
+                        pairs = {row['column_modified']: row['new_data']}
+                    row['new_data'] = {col: unseal(keys.get((row['data_id'], self.key_name(col))), row['data_id'], col,
+                                                   base64.b64decode(value))
+                                       for col, value in pairs.items()}
+                rows.append(row)
+        return pd.DataFrame(rows, columns=['index', 'policy_id', 'employee_id', 'data_id', 'operation', 'time', 'new_data', 'column_modified'])
+
+    def update_many(self, changes):
+        """
+        Encrypt and apply many updates at once: one UPDATE per column from a COPY staged table,
+        and the 'update' history rows with COPY, all in one transaction.
+
+        Parameters:
+        - changes (list): (index, column, value) tuples. The last change of an (index, column) wins.
+
+        Returns:
+        int: Number of history rows written.
+        """
+        policy_id = db.add_access_policy(db.Role.loan_officer, db.Purpose.audit, self.engine)
+        employee_id = db.select_random_employee(self.engine)
+        with self.engine.begin() as connection:
+            keys = self._keys(connection, set(index for index, _, _ in changes))
+            staged = {}
+            history = []
+            now = datetime.now()
+            for i, (index, column, value) in enumerate(changes):
+                key = keys.get((index, self.key_name(column)))
+                if key is None:
+                    raise ValueError(f'No key for applicant {index} column {column}, it was shredded')
+                staged[(index, column)] = seal(key, index, column, value)
+                history.append([policy_id, employee_id, index, db.Operation.update.value, now + timedelta(microseconds=i),
+                                base64.b64encode(seal(key, index, column, value)).decode(), column])
+            cursor = connection.connection.cursor()
+            connection.execute(text('CREATE TEMP TABLE sealed_updates (index bigint, column_name text, value bytea) ON COMMIT DROP;'))
+            write_copy(cursor, 'sealed_updates', ['index', 'column_name', 'value'],
+                       [[index, column, value] for (index, column), value in staged.items()])
+            for column in sorted(set(column for _, column in staged.keys())):
+                connection.execute(text(f'''UPDATE applicant_details a SET "{column}" = s.value
+                    FROM sealed_updates s
+                    WHERE s.index = a.index AND s.column_name = :column;'''), {"column": column})
+            write_copy(cursor, 'action_history', ['policy_id', 'employee_id', 'data_id', 'operation', 'time', 'new_data', 'column_modified'], history)
+        return len(history)
+
+    def shred(self, ids, columns=None, vacuum=True):
+        """
+        Erase applicants, or some of their columns, by deleting their keys.
+
+        Parameters:
+        - ids (list): Indexes of the applicants.
+        - columns (list, optional): Only erase these columns. Needs 'column' granularity. Default is every column.
+        - vacuum (bool): Run VACUUM FULL on applicant_keys so the deleted keys are gone from disk. Default is True.
+
+        Returns:
+        int: Number of keys deleted.
+        """
+        if columns is not None and self.granularity != 'column':
+            raise ValueError("Erasing single columns needs 'column' key granularity")
+        condition = 'data_id = ANY(:ids)' + (' AND column_name = ANY(:columns)' if columns is not None else '')
+        with self.engine.connect() as connection:
+            deleted = connection.execute(text(f'DELETE FROM applicant_keys WHERE {condition};'),
+                                         {"ids": [int(i) for i in ids], "columns": list(columns or [])}).rowcount
+            connection.execute(text("COMMIT;")) # have to do it this way for vacuum
+            if vacuum:
+                connection.execute(text('VACUUM FULL applicant_keys;'))
+        db.dprint(f'Shredded {deleted} keys of {len(ids)} applicants')
+        return deleted
+
+    def shred_column(self, column_name, index, vacuum=True):
+        """
+        Counterpart of init.remove_column_for_applicant(): make one column of one applicant unreadable.
+
+        Returns:
+        int: Number of keys deleted.
+        """
+        return self.shred([index], columns=[column_name], vacuum=vacuum)
+
+    def shred_row(self, index, vacuum=True):
+        """
+        Counterpart of init.delete_row(): make every value of one applicant unreadable.
+
+        Returns:
+        int: Number of keys deleted.
+        """
+        return self.shred([index], vacuum=vacuum)
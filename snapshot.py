@@ -0,0 +1,120 @@
+import time
+from sqlalchemy import text
+import init as db
+from vacuum import erasure_tables
+
+
+class TableSnapshot:
+    """
+    Saves the rows of the erasure tables once and puts them back before every timed iteration, so
+    each erasure is measured against the same database instead of one earlier iterations changed.
+
+    save() copies every table into an UNLOGGED <table>_snapshot table. restore() empties the tables
+    with a single TRUNCATE and refills them with INSERT ... SELECT from the copies, parents first so
+    the foreign keys hold, then runs ANALYZE so the planner sees the same statistics every time. It
+    all happens in one transaction, which is committed before the erasure runs, so the erasure's
+    VACUUM (which cannot run inside a transaction) is unaffected. TRUNCATE writes new files, so a
+    restored table has no dead tuples or bloat from previous iterations, whatever they vacuumed.
+
+    The saved rows already satisfied the foreign keys, so when the role is a superuser the restore
+    sets session_replication_role = replica for its transaction, which skips the per-row foreign
+    key triggers (most of the restore time for action_history).
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - tables (tuple): Tables to save, referenced tables first. Default is applicant_details and action_history.
+    - trusted (bool): Skip the foreign key checks on restore if the role allows it. Default is True.
+    - analyze (bool): ANALYZE the tables after restoring them. Default is True.
+    """
+
+    def __init__(self, engine, tables=erasure_tables, trusted=True, analyze=True):
+        self.engine = engine
+        self.tables = tuple(tables)
+        self.trusted = trusted
+        self.analyze = analyze
+        self.history = []
+        self.saved = False
+        self._skip_checks = False
+
+    def save(self):
+        """
+        Copy the current rows of every table into its snapshot table, replacing an older snapshot.
+
+        Returns:
+        float: Seconds the copy took.
+        """
+        s_time = time.perf_counter()
+        with self.engine.connect() as connection:
+            for table in self.tables:
+                connection.execute(text(f'DROP TABLE IF EXISTS "{self._copy(table)}";'))
+                connection.execute(text(f'CREATE UNLOGGED TABLE "{self._copy(table)}" AS TABLE "{table}";'))
+            self._skip_checks = self.trusted and connection.execute(text("SELECT current_setting('is_superuser') = 'on';")).scalar()
+            connection.commit()
+        self.saved = True
+        seconds = time.perf_counter() - s_time
+        db.dprint(f'Saved snapshot of {", ".join(self.tables)} in {round(seconds, 3)}s')
+        return seconds
+
+    def restore(self):
+        """
+        Replace the rows of every table with the saved ones.
+
+        Returns:
+        float: Seconds the restore took, also appended to history.
+        """
+        if not self.saved:
+            raise RuntimeError('restore() called before save()')
+        s_time = time.perf_counter()
+        tables = ', '.join(f'"{table}"' for table in self.tables)
+        with self.engine.connect() as connection:
+            if self._skip_checks:
+                connection.execute(text('SET LOCAL session_replication_role = replica;'))
+            connection.execute(text(f'TRUNCATE {tables};'))
+            for table in self.tables:
+                connection.execute(text(f'INSERT INTO "{table}" SELECT * FROM "{self._copy(table)}";'))
+            if self.analyze:
+                for table in self.tables:
+                    connection.execute(text(f'ANALYZE "{table}";'))
+            connection.commit()
+        # rows deleted by the iteration are back
+        db.applicants_version += 1
+        seconds = time.perf_counter() - s_time
+        self.history.append(seconds)
+        db.dprint(f'Restored {", ".join(self.tables)} in {round(seconds, 3)}s')
+        return seconds
+
+    def drop(self):
+        """
+        Remove the snapshot tables.
+
+        Returns:
+        None
+        """
+        with self.engine.connect() as connection:
+            for table in self.tables:
+                connection.execute(text(f'DROP TABLE IF EXISTS "{self._copy(table)}";'))
+            connection.commit()
+        self.saved = False
+
+    def reset(self):
+        """
+        Forget the recorded restore times.
+
+        Returns:
+        None
+        """
+        self.history = []
+
+    def summary(self):
+        """
+        Returns:
+        dict: Number of restores and their mean and max time in seconds. Empty if nothing was restored.
+        """
+        if not self.history:
+            return {}
+        return {"restores": len(self.history),
+                "mean": sum(self.history) / len(self.history),
+                "max": max(self.history)}
+
+    def _copy(self, table):
+        return f'{table}_snapshot'
@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import text
+from vacuum import erasure_tables
+
+size_columns = ('relation_size', 'total_size', 'index_size', 'live_tuples', 'dead_tuples')
+
+
+class StorageProbe:
+    """
+    Records the disk footprint of the erasure tables and the WAL written around a deletion.
+
+    A snapshot holds, per table, pg_relation_size (heap), pg_total_relation_size (heap, TOAST and
+    indexes), pg_indexes_size and the live and dead tuple counts from pg_stat_user_tables, plus
+    pg_current_wal_lsn(). A partitioned table is reported as the sum of its partitions. measure()
+    takes a snapshot before and after its with block and keeps the difference in results. Tuple
+    counts come from the statistics system, which other backends report when they go idle, so
+    they can lag behind by a moment; sizes and WAL are exact.
+
+    WAL amplification is the WAL written divided by the total size the tables had before, i.e.
+    how many times over the tables were written to the log (about 1 per table after VACUUM FULL).
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - tables (tuple): Tables to measure. Default is applicant_details and action_history.
+    """
+
+    def __init__(self, engine, tables=erasure_tables):
+        self.engine = engine
+        self.tables = tuple(tables)
+        self.results = []
+
+    def snapshot(self):
+        """
+        Read the current sizes, tuple counts and WAL position.
+
+        Returns:
+        dict: 'time', 'wal_lsn' and 'tables' (table name mapped to the values in size_columns).
+        """
+        with self.engine.connect() as connection:
+            connection.execute(text('SELECT pg_stat_clear_snapshot();'))
+            result = connection.execute(text('''SELECT c.relname,
+                    sum(pg_relation_size(p.relid)) AS relation_size,
+                    sum(pg_total_relation_size(p.relid)) AS total_size,
+                    sum(pg_indexes_size(p.relid)) AS index_size,
+                    sum(coalesce(s.n_live_tup, 0)) AS live_tuples,
+                    sum(coalesce(s.n_dead_tup, 0)) AS dead_tuples
+                FROM pg_class c
+                CROSS JOIN LATERAL pg_partition_tree(c.oid) p
+                LEFT JOIN pg_stat_user_tables s ON s.relid = p.relid
+                WHERE c.relname = ANY(:tables) AND c.relkind IN ('r', 'p') AND p.isleaf
+                GROUP BY c.relname;'''), {"tables": list(self.tables)})
+            tables = {row[0]: {column: int(row._mapping[column]) for column in size_columns} for row in result}
+            lsn = connection.execute(text('SELECT pg_current_wal_lsn()::text;')).scalar()
+        return {"time": datetime.now(), "wal_lsn": lsn, "tables": tables}
+
+    def diff(self, before, after):
+        """
+        Difference between two snapshots.
+
+        Parameters:
+        - before (dict): Snapshot taken first.
+        - after (dict): Snapshot taken second.
+
+        Returns:
+        dict: 'wal_bytes', 'wal_amplification', 'total_bytes' (change of every table's total size)
+              and 'tables' (table name mapped to the before, after and change of each value).
+        """
+        with self.engine.connect() as connection:
+            wal_bytes = int(connection.execute(text('SELECT pg_wal_lsn_diff(:after, :before);'),
+                                               {"after": after['wal_lsn'], "before": before['wal_lsn']}).scalar())
+        tables = {}
+        for table, values in after['tables'].items():
+            old = before['tables'].get(table, {column: 0 for column in size_columns})
+            tables[table] = {column: {"before": old[column], "after": values[column], "change": values[column] - old[column]}
+                             for column in size_columns}
+        size_before = sum(values['total_size'] for values in before['tables'].values())
+        return {"wal_bytes": wal_bytes,
+                "wal_amplification": wal_bytes / size_before if size_before else None,
+                "total_bytes": sum(values['total_size']['change'] for values in tables.values()),
+                "tables": tables}
+
+    @contextmanager
+    def measure(self, label=None):
+        """
+        Snapshot before and after the with block and append the difference to results.
+
+        Parameters:
+        - label (any, optional): Stored with the result, e.g. the iteration number.
+        """
+        before = self.snapshot()
+        yield
+        result = self.diff(before, self.snapshot())
+        result['label'] = label
+        self.results.append(result)
+
+    def reset(self):
+        """
+        Forget every result.
+
+        Returns:
+        None
+        """
+        self.results = []
+
+    def summary(self, per=1):
+        """
+        Average the results, optionally per deleted applicant.
+
+        Parameters:
+        - per (int): Number of erasures each result covers, e.g. the batch size. Default is 1.
+
+        Returns:
+        dict: Mean 'wal_bytes' and 'total_bytes' per erasure, 'wal_amplification' averaged over the
+              measured blocks, and per table the mean change of every value in size_columns per
+              erasure. Empty if nothing was measured.
+        """
+        if not self.results:
+            return {}
+        n = len(self.results) * per
+        amplification = [r['wal_amplification'] for r in self.results if r['wal_amplification'] is not None]
+        tables = {}
+        for result in self.results:
+            for table, values in result['tables'].items():
+                totals = tables.setdefault(table, {column: 0 for column in size_columns})
+                for column in size_columns:
+                    totals[column] += values[column]['change']
+        return {"erasures": n,
+                "wal_bytes": sum(r['wal_bytes'] for r in self.results) / n,
+                "wal_amplification": sum(amplification) / len(amplification) if amplification else None,
+                "total_bytes": sum(r['total_bytes'] for r in self.results) / n,
+                "tables": {table: {column: total / n for column, total in totals.items()} for table, totals in tables.items()}}
@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text
+import init as db
+from openloop import LatencyHistogram
+
+# what the report says about every action, in the order the query returns it
+action_fields = ["action", "time", "operation", "column_modified", "new_data", "policy_id", "role", "purpose",
+                 "employee_id", "first_name", "last_name", "email"]
+
+# the record and the joined history come back from one statement; part 0 is the record, part 1 the actions
+report_query = '''
+    WITH subject AS (
+        SELECT * FROM applicant_details WHERE applicant_id = :applicant_id
+    )
+    SELECT 0 AS part, to_jsonb(s) AS record, NULL AS action, NULL AS time, NULL AS operation, NULL AS column_modified,
+           NULL AS new_data, NULL AS policy_id, NULL AS role, NULL AS purpose, NULL AS employee_id, NULL AS first_name,
+           NULL AS last_name, NULL AS email
+    FROM subject s
+    UNION ALL
+    SELECT 1, NULL, h.index, h.time, h.operation::text, h.column_modified, h.new_data::text, h.policy_id,
+           p.entity_role::text, p.purpose::text, h.employee_id, e.first_name, e.last_name, e.email
+    FROM subject s
+    JOIN action_history h ON h.data_id = s.index
+    LEFT JOIN privacy_policies p ON p.index = h.policy_id
+    LEFT JOIN employees e ON e.id = h.employee_id
+    ORDER BY part, time, action;'''
+
+
+def subject_access(applicant_id, connection, chunk_size=1000):
+    """
+    Stream everything held about one applicant: the current applicant_details record, then every
+    action_history entry in time order with the role and purpose of the policy it was done under
+    and the employee who did it.
+
+    Record and history come from a single statement read through a server-side cursor, so a long
+    history is never held in memory at once. With init.access_indexes the statement is an index
+    lookup of the applicant and an index range scan of their history, without them it scans
+    both tables.
+
+    Parameters:
+    - applicant_id (int): The applicant_id of the subject.
+    - connection (sqlalchemy.engine.base.Connection): Connection to read with.
+    - chunk_size (int): Rows fetched from the cursor at a time. Default is 1000.
+
+    Returns:
+    generator: Yields the record as a dict (None if there is no such applicant), then one dict per
+               action with the keys in action_fields.
+    """
+    result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(
+        text(report_query), {"applicant_id": int(applicant_id)})
+    record_seen = False
+    for row in result:
+        if row[0] == 0:
+            if not record_seen:
+                record_seen = True
+                yield row[1]
+            continue
+        if not record_seen:
+            record_seen = True
+            yield None
+        yield dict(zip(action_fields, row[2:]))
+    if not record_seen:
+        yield None
+
+
+def subject_access_report(applicant_id, engine, chunk_size=1000):
+    """
+    Collect subject_access() for one applicant into a single report.
+
+    Parameters:
+    - applicant_id (int): The applicant_id of the subject.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Rows fetched from the cursor at a time. Default is 1000.
+
+    Returns:
+    dict: 'applicant_id', 'record' (None if there is no such applicant) and 'history', the actions in time order.
+    """
+    with engine.connect() as connection:
+        rows = subject_access(applicant_id, connection, chunk_size)
+        record = next(rows)
+        return {"applicant_id": applicant_id, "record": record, "history": list(rows)}
+
+
+def write_subject_access(applicant_id, path, engine, chunk_size=1000):
+    """
+    Write the report of one applicant to a JSON file as it is read, so its size is not limited by memory.
+
+    Parameters:
+    - applicant_id (int): The applicant_id of the subject.
+    - path (str): File to write.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Rows fetched from the cursor at a time. Default is 1000.
+
+    Returns:
+    int: Number of actions written.
+    """
+    actions = 0
+    with engine.connect() as connection, open(path, 'w') as file:
+        rows = subject_access(applicant_id, connection, chunk_size)
+        file.write(f'{{"applicant_id": {json.dumps(applicant_id)}, "record": {json.dumps(next(rows), default=str)}, "history": [')
+        for action in rows:
+            file.write(('\n  ' if actions == 0 else ',\n  ') + json.dumps(action, default=str))
+            actions += 1
+        file.write('\n]}\n')
+    return actions
+
+
+def subject_access_batch(applicant_ids, engine, workers=4, chunk_size=1000, handle=None):
+    """
+    Answer many subject access requests with a pool of threads, one connection each.
+
+    Parameters:
+    - applicant_ids (list): The applicant_ids of the subjects.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - workers (int): Requests answered at the same time. Default is 4.
+    - chunk_size (int): Rows fetched from the cursor at a time. Default is 1000.
+    - handle (callable, optional): Called with every report as it is finished instead of keeping
+                                   it, e.g. to write it out. The reports are returned if None.
+
+    Returns:
+    tuple: (reports, stats); reports maps applicant_id to its report (empty if handle is given),
+           stats has 'requests', 'found', 'actions', 'errors', 'seconds', 'requests_per_second',
+           'actions_per_second' and the 'latency' summary of a LatencyHistogram.
+    """
+    pooled = create_engine(engine.url, pool_size=workers, max_overflow=0)
+    latency = LatencyHistogram()
+    lock = threading.Lock()
+    reports = {}
+    counts = {"found": 0, "actions": 0, "errors": 0}
+
+    def run(applicant_id):
+        begun = time.perf_counter()
+        try:
+            report = subject_access_report(applicant_id, pooled, chunk_size)
+        except Exception as error:
+            db.dprint(f'Subject access for {applicant_id} failed: {error}')
+            with lock:
+                counts["errors"] += 1
+            return
+        latency.record(time.perf_counter() - begun)
+        if handle is not None:
+            handle(report)
+        with lock:
+            counts["found"] += report['record'] is not None
+            counts["actions"] += len(report['history'])
+            if handle is None:
+                reports[applicant_id] = report
+
+    s_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run, applicant_ids))
+    seconds = time.perf_counter() - s_time
+    pooled.dispose()
+
+    db.dprint(f'Answered {len(applicant_ids)} subject access requests in {round(seconds, 3)}s with {workers} workers')
+    return reports, {"requests": len(applicant_ids),
+                     **counts,
+                     "seconds": seconds,
+                     "requests_per_second": len(applicant_ids) / seconds if seconds else None,
+                     "actions_per_second": counts["actions"] / seconds if seconds else None,
+                     "latency": latency.summary()}
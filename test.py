@@ -1,14 +1,37 @@
 import init as db
+from audit_log import AuditLogWriter
+from history_synth import synthesize_history
+from samplers import ApplicantSampler, EmployeeSampler
+from value_generators import ValueGenerators
+from vacuum import VacuumScheduler
+from snapshot import TableSnapshot
+from shredding import CryptoShredder
+from purger import Purger
+from export import export_table, parquet_available
+from subject_access import subject_access_batch
+from workload import evaluate_concurrency
+from openloop import evaluate_open_loop
 import random
+from contextlib import nullcontext
+import os
 import sys
-from faker import Faker
+import tempfile
 import time
+import tracemalloc
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
 from sqlalchemy import text
 
-def random_action(engine, blacklist=None, acc_data=None, can_delete=True):
+# shared by random_action() and gen_random_action(); set policy_cache.enabled = False to add a policy per action
+policy_cache = db.PolicyCache()
+# shared employee and applicant samplers, seeded together with random in the timed tests
+employee_sampler = EmployeeSampler()
+applicant_sampler = ApplicantSampler()
+# pre-generated column values, replaces building a Faker per value
+value_generators = ValueGenerators()
+
+def random_action(engine, blacklist=None, acc_data=None, can_delete=True, writer=None):
     """
     Perform a randomly selected operation (add, update, view, or delete) on applicant_details
 
@@ -16,28 +39,32 @@ def random_action(engine, blacklist=None, acc_data=None, can_delete=True):
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
     - acc_data (tuple, optional): Account data to be used in the action. (get this from get_random_account())
     - can_delete (bool, optional): Flag to allow deletion actions. Defaults to True.
+    - writer (AuditLogWriter, optional): Queue the action_history entries on this writer.
 
     Returns:
-    None
+    Operation: The operation that was performed.
     """
     operation = random.choices(list(db.Operation), weights = [0, .1, .5, .4])[0]
-    entity = db.select_random_employee(engine)
-    data = db.get_random_account(engine, blacklist=blacklist) if acc_data is None else acc_data
+    if operation == db.Operation.delete and can_delete != True:
+        return random_action(engine, blacklist=blacklist, acc_data=acc_data, can_delete=False, writer=writer)
 
-    if operation == db.Operation.update:
-        column= random.choice(list(db.data_schema.keys())[1:-1])
-        new_value = gen_new_value(column, data)
-        db.update_data(data[1], column, new_value, engine, index=data[0])
-    elif operation == db.Operation.view:
-        purpose = random.choice([db.Purpose.audit, db.Purpose.review])
-        role = random.choice(list(db.Role))
-        policy = db.add_access_policy(role, purpose, engine)
-        db.log_view(policy, entity, data[0], engine)
-    elif operation == db.Operation.delete:
-        if can_delete == True:
-            db.soft_delete(data[0], engine)
-        else:
-            random_action(engine, blacklist=blacklist, acc_data=acc_data, can_delete=False)
+    # one connection and one commit for the whole action
+    with db.Session(engine, writer=writer, policy_cache=policy_cache, employee_sampler=employee_sampler, applicant_sampler=applicant_sampler) as session:
+        entity = session.select_random_employee()
+        data = session.get_random_account(blacklist=blacklist) if acc_data is None else acc_data
+
+        if operation == db.Operation.update:
+            column= random.choice(list(db.data_schema.keys())[1:-1])
+            new_value = gen_new_value(column, data)
+            session.update_data(data[1], column, new_value, index=data[0])
+        elif operation == db.Operation.view:
+            purpose = random.choice([db.Purpose.audit, db.Purpose.review])
+            role = random.choice(list(db.Role))
+            policy = session.add_access_policy(role, purpose)
+            session.log_view(policy, entity, data[0])
+        elif operation == db.Operation.delete:
+            session.soft_delete(data[0])
+    return operation
 
 
 def gen_random_action(engine, acc_data=None,can_delete=True):
@@ -60,8 +87,8 @@ def gen_random_action(engine, acc_data=None,can_delete=True):
             "new_data": None, 
             "modified_column": None}
     operation = random.choices(list(db.Operation), weights = [0, .1, .5, .4])[0]
-    employee = db.select_random_employee(engine)
-    data = db.get_random_account(engine) if acc_data == None else acc_data
+    employee = db.select_random_employee(engine, sampler=employee_sampler)
+    data = db.get_random_account(engine, sampler=applicant_sampler) if acc_data == None else acc_data
 
     action['operation'] = operation.value
     action['employee_id'] = employee
@@ -71,14 +98,14 @@ def gen_random_action(engine, acc_data=None,can_delete=True):
         column= random.choice(list(db.data_schema.keys())[1:-1])
         action['modified_column'] = column
         action['new_data'] = gen_new_value(column, data)
-        p_id = db.add_access_policy(db.Role.loan_officer, db.Purpose.audit, engine)
+        p_id = db.add_access_policy(db.Role.loan_officer, db.Purpose.audit, engine, cache=policy_cache)
     elif operation == db.Operation.view:
         purpose = random.choice([db.Purpose.audit, db.Purpose.review])
         role = random.choice(list(db.Role))
-        p_id = db.add_access_policy(role, purpose, engine)
+        p_id = db.add_access_policy(role, purpose, engine, cache=policy_cache)
     elif operation == db.Operation.delete:
         if can_delete:
-            p_id = db.add_access_policy(db.Role.loan_manager, db.Purpose.approval, engine)
+            p_id = db.add_access_policy(db.Role.loan_manager, db.Purpose.approval, engine, cache=policy_cache)
         else:
             return gen_random_action(engine, acc_data=acc_data, can_delete=can_delete)
     action['policy_id'] = p_id
@@ -102,51 +129,45 @@ def gen_random_actions(engine, num_actions, acc_data=None, can_delete=True):
         actions.append(gen_random_action(engine, acc_data= acc_data, can_delete=can_delete))
     return actions
 
-def random_actions(engine, num_actions, blacklist=None, can_delete=True):
+def random_actions(engine, num_actions, blacklist=None, can_delete=True, writer=None, bulk=False):
+    if bulk:
+        # same distribution, generated up front and written with COPY; seeded from random
+        return synthesize_history(engine, num_actions, seed=random.getrandbits(32), values=value_generators, blacklist=blacklist,
+                                  can_delete=can_delete, per_action_policies=not policy_cache.enabled)
     for _ in range(num_actions):
-        random_action(engine, blacklist=blacklist, can_delete=can_delete)
+        random_action(engine, blacklist=blacklist, can_delete=can_delete, writer=writer)
+
+def random_actions_rate(engine, num_actions, blacklist=None, can_delete=True, writer=None):
+    """
+    Run random_actions() and report its throughput.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_actions (int): The number of random actions to run.
+    - blacklist (list, optional): Account indexes to leave alone.
+    - can_delete (bool, optional): Flag to allow soft deletion actions. Defaults to True.
+    - writer (AuditLogWriter, optional): Queue the action_history entries on this writer.
+
+    Returns:
+    float: Actions per second.
+    """
+    s_time = time.perf_counter()
+    random_actions(engine, num_actions, blacklist=blacklist, can_delete=can_delete, writer=writer)
+    if writer is not None:
+        writer.flush()
+    rate = num_actions / (time.perf_counter() - s_time)
+    print(f'{num_actions} actions: {round(rate, 1)} ops/sec')
+    return rate
 
 def gen_new_value(column, data):
-    if column == 'annual_income':
-        return random.randint(10000, 10000000)
-    elif column == 'applicant_age':
-        return random.randint(21, 79)
-    elif column == 'work_experience':
-        return random.randint(0, 20)
-    elif column == 'marital_status':
-        return 'married' if data[5] == 'single' else 'single'
-    elif column == 'house_ownership':
-        return 'owned' if data[6] == 'rented' else 'rented'
-    elif column == 'vehicle_ownership':
-        return 'yes' if data[7] == 'no' else 'no'
-    elif column == 'occupation':
-        fake = Faker()
-        new_value = fake.job()
-        new_value = new_value.replace("'", "")
-        if len(new_value) > 40:
-            x = new_value.split(',')
-            if len(x) > 1:
-                new_value = x[0]
-            new_value = new_value[:40]
-        return new_value
-    elif column == 'residence_city':
-        fake = Faker()
-        return fake.city()
-    elif column == 'residence_state':
-        fake = Faker()
-        return fake.state()
-    elif column == 'years_in_current_employment':
-        return random.randint(0, 15)
-    elif column == 'years_in_current_residence':
-        return random.randint(0, 15)
-    elif column == 'loan_default_risk':
-        return True if data[13] == False else False
-    else:
+    if column not in value_generators.generators:
         print(f"Somehow you got an invalid column name to generate {column}")
         return None
+    return value_generators.value(column, data)
 
 
-def init(engine,num_applicants=-1, history_size=-1, acc=None, delete=True):
+def init(engine,num_applicants=-1, history_size=-1, acc=None, delete=True, layout=db.HistoryLayout.string, indexes=None, bulk=True,
+         partitioning=db.HistoryPartitioning.none, partitions=8):
     """
     Initialize the database with a specified number of applicants and random actions.
 
@@ -157,15 +178,28 @@ def init(engine,num_applicants=-1, history_size=-1, acc=None, delete=True):
     - history_size (float): Size of the action history relative to the number of applicants. Default is -1, which means no action history generation.
     - acc (tuple): Account data to use when generating actions. Default is None.
     - delete (bool): Indicates whether the generated actions can include deletion. Default is True.
+    - layout (HistoryLayout): Storage layout of action_history.new_data. Default is string.
+    - indexes (dict): Index definitions to create (e.g. db.default_indexes). Default is None, no extra indexes.
+    - bulk (bool): Generate the history with synthesize_history() instead of one random_action() at a time. Default is True.
+    - partitioning (HistoryPartitioning): Partitioning of action_history. Default is none.
+    - partitions (int): Number of action_history partitions. Default is 8.
 
     Returns:
     None
     """
-    db.init(engine, num_applicants=num_applicants)
+    db.init(engine, num_applicants=num_applicants, layout=layout, indexes=indexes, partitioning=partitioning, partitions=partitions)
     if(history_size > 0):
         hs = int(num_applicants * history_size)
-        for _ in range(hs):
-            random_action(engine, acc_data=acc, can_delete=delete)
+        if bulk:
+            if acc is None:
+                random_actions(engine, hs, can_delete=delete, bulk=True)
+            else:
+                synthesize_history(engine, hs, seed=random.getrandbits(32), values=value_generators, acc_data=acc, can_delete=delete,
+                                   per_action_policies=not policy_cache.enabled)
+            return
+        with AuditLogWriter(engine) as writer:
+            for _ in range(hs):
+                random_action(engine, acc_data=acc, can_delete=delete, writer=writer)
 
 def column_delete_test(engine):
     """
@@ -182,7 +216,7 @@ def column_delete_test(engine):
     for _ in range(10):
         random_action(engine, acc_data=victim, can_delete=False)
     for _ in range(2):
-        db.update_data(victim[1], 'residence_city', Faker().city(), engine)
+        db.update_data(victim[1], 'residence_city', value_generators.batch('residence_city', 1)[0], engine)
     db.print_table('applicant_details', engine)
     db.print_table('action_history', engine)
     db.remove_column_for_applicant('residence_city', victim[0],engine, vacuum=True)
@@ -216,7 +250,44 @@ def get_ids(engine):
         indexs = [row[0] for row in result]
     return indexs
 
-def timed_test(num_app, num_hist, num_iter, vacuum, engine, num_del=1, seed=-1):
+def seed_all(seed):
+    """
+    Seed random, the samplers and the value generators together (ignored if seed < 1).
+
+    Parameters:
+    - seed (int): The seed.
+
+    Returns:
+    None
+    """
+    if seed > 0:
+        random.seed(seed)
+        employee_sampler.seed(seed)
+        applicant_sampler.seed(seed)
+        value_generators.seed(seed)
+
+def load_fixture(fixtures, build, **params):
+    """
+    Run build(), or restore its result from a fixture cache when it was built with the same params before.
+
+    Parameters:
+    - fixtures (FixtureCache): The cache, or None to always build.
+    - build (callable): Builds the database and returns the picked applicant indexes.
+    - params: Everything the database built depends on. Unseeded builds (seed < 1) are random, so they
+              always build instead of replaying the first one.
+
+    Returns:
+    list: The picked applicant indexes.
+    """
+    if fixtures is None or params.get('seed', -1) < 1:
+        return build()
+    selected_ids, restore_time = fixtures.load(params, lambda: [int(i) for i in build()])
+    if restore_time is not None:
+        print(f'Restored fixture in {round(restore_time * 1000, 5)} ms')
+    return selected_ids
+
+def timed_test(num_app, num_hist, num_iter, vacuum, engine, num_del=1, seed=-1, layout=db.HistoryLayout.string, indexes=None, scheduler=None, warmup=0, samples=None, instrument=None, probe=None, fixtures=None, snapshot=None,
+               partitioning=db.HistoryPartitioning.none, partitions=8):
     """
     Measures the average execution time of a single column deletion operation in the database.
 
@@ -228,132 +299,756 @@ def timed_test(num_app, num_hist, num_iter, vacuum, engine, num_del=1, seed=-1):
     - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
     - num_del (int): Number of deletion operations per iteration (default is 1).
     - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - layout (HistoryLayout): Storage layout of action_history.new_data (default is string).
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+    - scheduler (VacuumScheduler): Defer vacuuming to this scheduler instead of vacuuming every deletion (default is None).
+    - warmup (int): Untimed deletions run before the timed ones, on their own victims (default is 0).
+    - samples (list): Receives the time of every timed iteration in seconds (default is None).
+    - instrument (SQLInstrument): Record the statements of every timed iteration and print their per-phase breakdown (default is None).
+    - probe (StorageProbe): Measure table sizes, tuple counts and WAL around every timed iteration (default is None).
+    - fixtures (FixtureCache): Restore the populated database from this cache instead of rebuilding it when it has been built before (default is None).
+    - snapshot (TableSnapshot): Save the tables after set up and restore them before every timed iteration, untimed (default is None).
+    - partitioning (HistoryPartitioning): Partitioning of action_history (default is none).
+    - partitions (int): Number of action_history partitions (default is 8).
 
     Returns:
     float: Average time taken for the deletion operation across all iterations.
     """
     # test set up
-    if seed > 0:
-        random.seed(seed)
+    seed_all(seed)
     time_sum = 0
-    n = int(num_app * num_hist) - (2 * num_iter)
-    print(f'Column test [iter={num_iter}, num_app={num_app}, num_hist={num_hist}, num_del={num_del}]')
+    n = max(int(num_app * num_hist) - (2 * (num_iter + warmup)), 0)
+    print(f'Column test [iter={num_iter}, num_app={num_app}, num_hist={num_hist}, num_del={num_del}, layout={layout.value}, indexed={bool(indexes)}'
+          f'{f", partitions={partitions} {partitioning.value}" if partitioning != db.HistoryPartitioning.none else ""}]')
 
-    print('Initializing db...', end='')
-    init(engine, num_app)
-    
-    print('Populating action history...')
-    selected_ids = random.choices(get_ids(engine), k=num_iter)
-    # add update calls for the test to have to overwrite
-    for i in selected_ids:
-        for _ in range(2):
-            db.update_data(None, 'residence_city', Faker().city(),engine, index=i)
-    random_actions(engine, n, selected_ids)
+    def build():
+        print('Initializing db...', end='')
+        init(engine, num_app, layout=layout, indexes=indexes, partitioning=partitioning, partitions=partitions)
+
+        print('Populating action history...')
+        selected_ids = random.choices(get_ids(engine), k=num_iter + warmup)
+        # add update calls for the test to have to overwrite
+        for i in selected_ids:
+            for _ in range(2):
+                db.update_data(None, 'residence_city', value_generators.batch('residence_city', 1)[0],engine, index=i)
+        random_actions(engine, n, selected_ids, bulk=True)
+        return selected_ids
+
+    selected_ids = load_fixture(fixtures, build, kind='column', num_app=num_app, num_hist=num_hist, victims=num_iter + warmup,
+                                seed=seed, layout=layout.value, indexes=sorted(indexes or {}),
+                                partitioning=partitioning.value, partitions=partitions)
+
+    for victim in selected_ids[num_iter:]:
+        db.remove_column_for_applicant('residence_city', victim, engine, vacuum=vacuum, scheduler=scheduler)
+    if snapshot is not None:
+        snapshot.save()
 
     for i in range(num_iter):
         print(f'\t{i + 1}: ', end='')
         
         victim = selected_ids[i]
+        if snapshot is not None:
+            print(f'Restored in {round(snapshot.restore() * 1000, 5)} ms, ', end='')
         
         print('Running test...', end='')
-        s_time = time.time()
-        db.remove_column_for_applicant('residence_city', victim, engine, vacuum=vacuum)
-        f_time = time.time()
-        time_sum += f_time - s_time
-        print(f'{round((f_time - s_time) * 1000, 5)} ms')
+        with probe.measure(i) if probe is not None else nullcontext(), \
+                instrument.iteration(i) if instrument is not None else nullcontext():
+            explained = instrument.explain_seconds() if instrument is not None else 0.0
+            s_time = time.perf_counter()
+            db.remove_column_for_applicant('residence_city', victim, engine, vacuum=vacuum, scheduler=scheduler)
+            f_time = time.perf_counter()
+        # the instrument's EXPLAIN ANALYZE runs are not part of the erasure
+        elapsed = f_time - s_time - (instrument.explain_seconds() - explained if instrument is not None else 0.0)
+        time_sum += elapsed
+        if samples is not None:
+            samples.append(elapsed)
+        print(f'{round(elapsed * 1000, 5)} ms')
+        if instrument is not None:
+            instrument.print_breakdown(i)
+    if scheduler is not None:
+        s_time = time.perf_counter()
+        scheduler.flush()
+        print(f'\tDeferred VACUUM FULL: {round((time.perf_counter() - s_time) * 1000, 5)} ms')
     avg_time = time_sum / num_iter
     return avg_time
 
-def batch_timed_test(num_iter, is_sequential, selected_ids):
+def batch_timed_test(num_iter, is_sequential, selected_ids, engine, scheduler=None, warmup=0, samples=None, instrument=None, probe=None, snapshot=None):
+    """
+    Measures the average execution time of a batch column deletion.
+
+    Parameters:
+    - num_iter (int): Number of iterations for the test.
+    - is_sequential (bool or BatchMode): The column_batch_delete mode.
+    - selected_ids (list): Indexes of the applicants to erase the column for.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - scheduler (VacuumScheduler): Defer vacuuming to this scheduler (default is None).
+    - warmup (int): Untimed batches run before the timed ones (default is 0).
+    - samples (list): Receives the time of every timed iteration in seconds (default is None).
+    - instrument (SQLInstrument): Record the statements of every timed iteration and print their per-phase breakdown (default is None).
+    - probe (StorageProbe): Measure table sizes, tuple counts and WAL around every timed iteration (default is None).
+    - snapshot (TableSnapshot): Restore the tables before every batch, untimed, so each one erases the same data; saved first if it was not (default is None).
+
+    Returns:
+    float: Average time taken for the batch across all iterations.
+    """
     time_sum = 0
+    if snapshot is not None and not snapshot.saved:
+        snapshot.save()
+    for _ in range(warmup):
+        if snapshot is not None:
+            snapshot.restore()
+        db.column_batch_delete('residence_city', selected_ids, is_sequential, engine, scheduler=scheduler)
     
     for i in range(num_iter):
         print(f'\t{i + 1}: ', end='')
+        if snapshot is not None:
+            print(f'Restored in {round(snapshot.restore(), 5)} s, ', end='')
         print('Running test...', end='')
-        s_time = time.time()
-        db.column_batch_delete('residence_city', selected_ids, is_sequential, engine)    
-        f_time = time.time()
-        time_sum += f_time - s_time
-        print(f'{round((f_time - s_time), 5)} s')
+        with probe.measure(i) if probe is not None else nullcontext(), \
+                instrument.iteration(i) if instrument is not None else nullcontext():
+            explained = instrument.explain_seconds() if instrument is not None else 0.0
+            s_time = time.perf_counter()
+            db.column_batch_delete('residence_city', selected_ids, is_sequential, engine, scheduler=scheduler)
+            f_time = time.perf_counter()
+        # the instrument's EXPLAIN ANALYZE runs are not part of the erasure
+        elapsed = f_time - s_time - (instrument.explain_seconds() - explained if instrument is not None else 0.0)
+        time_sum += elapsed
+        if samples is not None:
+            samples.append(elapsed)
+        print(f'{round(elapsed, 5)} s')
+        if instrument is not None:
+            instrument.print_breakdown(i)
+    if scheduler is not None:
+        s_time = time.perf_counter()
+        scheduler.flush()
+        print(f'\tDeferred VACUUM FULL: {round(time.perf_counter() - s_time, 5)} s')
     avg_time = time_sum / num_iter
     return avg_time
 
-def evaluate(total_app, hist_size, engine, num_steps = 4, num_iter=5, seed=-1):
+def row_batch_timed_test(num_iter, bulk, selected_ids, engine, chunk_size=1000, warmup=0, samples=None, instrument=None, probe=None, snapshot=None):
+    """
+    Measures the average execution time of deleting a batch of applicants with their history.
+    The tables are restored before every batch, so each one deletes the same rows.
+
+    Parameters:
+    - num_iter (int): Number of iterations for the test.
+    - bulk (bool): Use delete_rows() instead of calling delete_row() for every applicant.
+    - selected_ids (list): Indexes of the applicants to delete.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Applicants per transaction for delete_rows() (default is 1000).
+    - warmup (int): Untimed batches run before the timed ones (default is 0).
+    - samples (list): Receives the time of every timed iteration in seconds (default is None).
+    - instrument (SQLInstrument): Record the statements of every timed iteration and print their per-phase breakdown (default is None).
+    - probe (StorageProbe): Measure table sizes, tuple counts and WAL around every timed iteration (default is None).
+    - snapshot (TableSnapshot): Snapshot restored before every batch; saved first if it was not. A temporary one is used if None.
+
+    Returns:
+    float: Average time taken for the batch across all iterations.
+    """
+    own_snapshot = snapshot is None
+    if own_snapshot:
+        snapshot = TableSnapshot(engine)
+    if not snapshot.saved:
+        snapshot.save()
+    with engine.connect() as connection:
+        app_ids = [row[0] for row in connection.execute(text('SELECT applicant_id FROM applicant_details WHERE index = ANY(:ids);'),
+                                                        {"ids": [int(i) for i in selected_ids]})]
+
+    def run():
+        if bulk:
+            db.delete_rows(app_ids, engine, chunk_size=chunk_size)
+        else:
+            for app_id in app_ids:
+                db.delete_row(app_id, engine)
+
+    time_sum = 0
+    for _ in range(warmup):
+        snapshot.restore()
+        run()
+    for i in range(num_iter):
+        print(f'\t{i + 1}: ', end='')
+        print(f'Restored in {round(snapshot.restore(), 5)} s, ', end='')
+        print('Running test...', end='')
+        with probe.measure(i) if probe is not None else nullcontext(), \
+                instrument.iteration(i) if instrument is not None else nullcontext():
+            explained = instrument.explain_seconds() if instrument is not None else 0.0
+            s_time = time.perf_counter()
+            run()
+            f_time = time.perf_counter()
+        # the instrument's EXPLAIN ANALYZE runs are not part of the erasure
+        elapsed = f_time - s_time - (instrument.explain_seconds() - explained if instrument is not None else 0.0)
+        time_sum += elapsed
+        if samples is not None:
+            samples.append(elapsed)
+        print(f'{round(elapsed, 5)} s')
+        if instrument is not None:
+            instrument.print_breakdown(i)
+    snapshot.restore()
+    if own_snapshot:
+        snapshot.drop()
+    return time_sum / num_iter
+
+def row_batch_evaluate(total_app, hist_size, num_deletes, engine, num_steps=4, num_iter=5, seed=-1, indexes=None, chunk_size=1000):
+    """
+    Compare deleting applicants one delete_row() at a time with delete_rows() for growing batch sizes.
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - num_deletes (int): Largest number of deletions in a batch.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of batch sizes to test.
+    - num_iter (int): Number of iterations for each batch size.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+    - chunk_size (int): Applicants per transaction for delete_rows() (default is 1000).
+
+    Returns:
+    None
+    """
+    step_size = num_deletes // num_steps
+    test_sizes = range(step_size, num_deletes + 1, step_size)
+    print(f"Row batch test num_app={total_app}, num_hist={hist_size * total_app}, num_del={num_deletes} num_iter={num_iter} num_steps={num_steps}")
+    selected_ids = batch_setup(total_app, hist_size, num_deletes, engine, num_iter=num_iter, seed=seed, indexes=indexes)
+    snapshot = TableSnapshot(engine)
+    for bulk in (False, True):
+        label = f'delete_rows (chunk_size={chunk_size})' if bulk else 'delete_row'
+        avg_times = []
+        for i, size in enumerate(test_sizes):
+            print(f'[mode={label} iter={i + 1}/{num_steps} num_delete={size}]')
+            avg_time = row_batch_timed_test(num_iter, bulk, selected_ids[:size], engine, chunk_size=chunk_size, snapshot=snapshot)
+            print(f'\tAverage: {round(avg_time, 3)}s')
+            avg_times.append(avg_time)
+        plt.plot(test_sizes, avg_times, marker='o', label=label)
+    snapshot.drop()
+
+    plt.title(f'Batch Row Deletion Performance{" (indexed)" if indexes else ""}')
+    plt.xlabel('Number of Deletions')
+    plt.ylabel('Average Time (s)')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+def evaluate(total_app, hist_size, engine, num_steps = 4, num_iter=5, seed=-1, indexes=None):
     step_size = total_app // num_steps
     test_sizes = range(step_size, total_app + 1, step_size)
     avg_times = []
 
     for size in test_sizes:
-        avg_time = timed_test(size, hist_size, num_iter, True, engine, seed=seed)
+        avg_time = timed_test(size, hist_size, num_iter, True, engine, seed=seed, indexes=indexes)
         avg_time *= 1000
         print(f'\tAverage: {round(avg_time, 3)}ms')
         avg_times.append(avg_time)
 
     # Plotting the results
     plt.plot(test_sizes, avg_times, marker='o')
-    plt.title(f'Performance relative to data size ({int(100 + hist_size * 100)}% History Size)')
+    plt.title(f'Performance relative to data size ({int(100 + hist_size * 100)}% History Size){" (indexed)" if indexes else ""}')
+    plt.xlabel('Number of Applicants')
+    plt.ylabel('Average Time (ms)')
+    plt.grid(True)
+    plt.show()
+
+def evaluate_vacuum(total_app, hist_size, engine, num_steps=4, num_iter=5, seed=-1, max_age=60.0):
+    """
+    Compare VACUUM FULL after every column deletion against a VacuumScheduler that only compacts
+    when a bloat or erasure age threshold is crossed.
+
+    Parameters:
+    - total_app (int): Largest number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of data sizes to test.
+    - num_iter (int): Number of iterations for each test.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - max_age (float): Seconds an erasure may wait before the scheduler forces VACUUM FULL.
+
+    Returns:
+    None
+    """
+    step_size = total_app // num_steps
+    test_sizes = range(step_size, total_app + 1, step_size)
+    for label in ('VACUUM FULL per deletion', 'deferred'):
+        avg_times = []
+        for size in test_sizes:
+            scheduler = VacuumScheduler(engine, max_age=max_age) if label == 'deferred' else None
+            avg_time = timed_test(size, hist_size, num_iter, True, engine, seed=seed, scheduler=scheduler)
+            avg_time *= 1000
+            print(f'\tAverage: {round(avg_time, 3)}ms')
+            avg_times.append(avg_time)
+        plt.plot(test_sizes, avg_times, marker='o', label=label)
+
+    plt.title(f'Immediate vs Deferred Vacuum ({int(100 + hist_size * 100)}% History Size)')
+    plt.xlabel('Number of Applicants')
+    plt.ylabel('Average Time (ms)')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+def row_timed_test(victims, engine):
+    """
+    Measures the average time of delete_row() followed by the VACUUM FULL that removes the rows from disk.
+
+    Parameters:
+    - victims (list): Indexes of the applicants to delete.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+
+    Returns:
+    float: Average time taken per applicant.
+    """
+    with engine.connect() as connection:
+        app_ids = dict(connection.execute(text('SELECT index, applicant_id FROM applicant_details WHERE index = ANY(:ids);'),
+                                          {"ids": [int(i) for i in victims]}).all())
+    time_sum = 0
+    for victim in victims:
+        s_time = time.perf_counter()
+        db.delete_row(app_ids[victim], engine)
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('VACUUM FULL applicant_details;'))
+            connection.execute(text('VACUUM FULL action_history;'))
+        time_sum += time.perf_counter() - s_time
+    return time_sum / len(victims)
+
+def shred_timed_test(num_app, num_hist, num_iter, engine, seed=-1, granularity='column'):
+    """
+    Measures the average time of erasing a column and a whole applicant by deleting keys with a CryptoShredder.
+
+    Parameters:
+    - num_app (int): Number of applicants to use in test.
+    - num_hist (float): Number of update records relative to number of applicants.
+    - num_iter (int): Number of erasures of each kind.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - granularity (str): Key granularity of the CryptoShredder (default is column).
+
+    Returns:
+    tuple: Average time of a column erasure (None with applicant granularity) and of a row erasure.
+    """
+    seed_all(seed)
+    shredder = CryptoShredder(engine, granularity=granularity)
+    print(f'Shredding test [iter={num_iter}, num_app={num_app}, num_hist={num_hist}, granularity={granularity}]')
+    print('Initializing encrypted db...')
+    shredder.init(num_app)
+    ids = get_ids(engine)
+    n = int(num_app * num_hist)
+    columns = [random.choice(list(value_generators.generators.keys())) for _ in range(n)]
+    new_values = value_generators.batch_many({col: columns.count(col) for col in set(columns)})
+    shredder.update_many([(random.choice(ids), col, new_values[col].pop()) for col in columns])
+
+    victims = random.sample(ids, 2 * num_iter)
+    column_time = None
+    if granularity == 'column':
+        time_sum = 0
+        for victim in victims[:num_iter]:
+            s_time = time.perf_counter()
+            shredder.shred_column('residence_city', victim)
+            time_sum += time.perf_counter() - s_time
+        column_time = time_sum / num_iter
+    time_sum = 0
+    for victim in victims[num_iter:]:
+        s_time = time.perf_counter()
+        shredder.shred_row(victim)
+        time_sum += time.perf_counter() - s_time
+    return column_time, time_sum / num_iter
+
+def evaluate_shredding(total_app, hist_size, engine, num_steps=4, num_iter=5, seed=-1, granularity='column'):
+    """
+    Compare column and row erasure by rewriting history (remove_column_for_applicant(), delete_row())
+    with crypto-shredding (deleting keys) across data sizes. Every erasure includes its VACUUM FULL.
+
+    Parameters:
+    - total_app (int): Largest number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of data sizes to test.
+    - num_iter (int): Number of iterations for each test.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - granularity (str): Key granularity of the CryptoShredder (default is column).
+
+    Returns:
+    None
+    """
+    step_size = total_app // num_steps
+    test_sizes = range(step_size, total_app + 1, step_size)
+    results = {'column erasure': [], 'row erasure': [], 'shred column': [], 'shred row': []}
+    for size in test_sizes:
+        results['column erasure'].append(timed_test(size, hist_size, num_iter, True, engine, seed=seed) * 1000)
+        ids = get_ids(engine)
+        results['row erasure'].append(row_timed_test(random.sample(ids, num_iter), engine) * 1000)
+        column_time, row_time = shred_timed_test(size, hist_size, num_iter, engine, seed=seed, granularity=granularity)
+        results['shred column'].append(column_time * 1000 if column_time is not None else None)
+        results['shred row'].append(row_time * 1000)
+        print('\t' + ', '.join(f'{label}: {round(times[-1], 3)}ms' for label, times in results.items() if times[-1] is not None))
+
+    for label, times in results.items():
+        if None not in times:
+            plt.plot(test_sizes, times, marker='o', label=label)
+    plt.title(f'History Rewrite vs Crypto-shredding ({granularity} keys, {int(100 + hist_size * 100)}% History Size)')
     plt.xlabel('Number of Applicants')
     plt.ylabel('Average Time (ms)')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+def evaluate_purger(total_app, hist_size, engine, chunk_sizes=(50, 200, 1000, 5000), rate=None, seed=-1, indexes=None):
+    """
+    Purge the soft deletes of the same history with different chunk sizes and compare throughput
+    and the time each chunk holds its locks. The tables are restored before every run.
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_sizes (tuple): Applicants purged per transaction in each run.
+    - rate (float): Maximum applicants purged per second (default is None, no limit).
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+
+    Returns:
+    None
+    """
+    seed_all(seed)
+    print(f'Purger test [num_app={total_app}, num_hist={hist_size}, rate={rate}, indexed={bool(indexes)}]')
+    init(engine, total_app, hist_size, indexes=indexes)
+    snapshot = TableSnapshot(engine)
+    snapshot.save()
+    throughput = []
+    chunk_times = []
+    for chunk_size in chunk_sizes:
+        snapshot.restore()
+        purger = Purger(engine, chunk_size=chunk_size, rate=rate)
+        backlog = purger.backlog()['due']
+        purger.run_once()
+        metrics = purger.metrics()
+        if not purger.chunks:
+            # nothing was due, e.g. a history without soft deletes
+            print(f'\tchunk_size={chunk_size}: nothing to purge')
+            throughput.append(np.nan)
+            chunk_times.append(np.nan)
+            continue
+        throughput.append(metrics['rows_per_second'])
+        chunk_times.append(np.mean([chunk['seconds'] for chunk in purger.chunks]) * 1000)
+        print(f'\tchunk_size={chunk_size}: {metrics["purged"]}/{backlog} applicants and {metrics["history"]} history rows, '
+              f'{round(metrics["rows_per_second"], 1)} applicants/s, {round(chunk_times[-1], 3)} ms per chunk')
+    snapshot.drop()
+
+    figure, (left, right) = plt.subplots(1, 2, figsize=(12, 4.8))
+    left.plot(chunk_sizes, throughput, marker='o')
+    left.set_title('Purge Throughput')
+    left.set_xlabel('Chunk Size')
+    left.set_ylabel('Applicants per Second')
+    left.set_xscale('log')
+    left.grid(True)
+    right.plot(chunk_sizes, chunk_times, marker='o')
+    right.set_title('Lock Time per Chunk')
+    right.set_xlabel('Chunk Size')
+    right.set_ylabel('Time (ms)')
+    right.set_xscale('log')
+    right.grid(True)
+    figure.tight_layout()
+    plt.show()
+
+def evaluate_export(total_app, hist_size, engine, chunk_size=10000, seed=-1, formats=(('cursor', 'csv'), ('copy', 'csv'), ('cursor', 'parquet'))):
+    """
+    Export action_history with every method and format and compare time and peak Python memory
+    against fetching the whole table at once, the way print_table() used to read it.
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - chunk_size (int): Rows fetched and written at a time (default is 10000).
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - formats (tuple): (method, format) pairs to export with, see export.export_table(). Parquet is
+                       skipped if pyarrow is not installed.
+
+    Returns:
+    None
+    """
+    if not parquet_available():
+        print('pyarrow is not installed, skipping the parquet export')
+        formats = tuple((method, fmt) for method, fmt in formats if fmt != 'parquet')
+    seed_all(seed)
+    print(f'Export test [num_app={total_app}, num_hist={hist_size}, chunk_size={chunk_size}]')
+    init(engine, total_app, hist_size)
+    labels = []
+    times = []
+    peaks = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'action_history')
+
+        def run(method, fmt):
+            if method == 'fetchall':
+                with engine.connect() as connection:
+                    rows = connection.execute(text('SELECT * FROM action_history;')).all()
+                with open(path, 'w') as file:
+                    file.writelines(','.join(map(str, row)) + '\n' for row in rows)
+            else:
+                export_table('action_history', path, engine, fmt=fmt, method=method, chunk_size=chunk_size)
+
+        for method, fmt in (('fetchall', 'csv'),) + tuple(formats):
+            s_time = time.perf_counter()
+            run(method, fmt)
+            seconds = time.perf_counter() - s_time
+            # tracing slows python down, so the memory is measured in a second, untimed run
+            tracemalloc.start()
+            run(method, fmt)
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            labels.append(f'{method}\n{fmt}')
+            times.append(seconds)
+            peaks.append(peak)
+            print(f'\t{method} {fmt}: {round(seconds, 3)}s, peak {round(peak, 1)} MiB, {round(os.path.getsize(path) / 2**20, 1)} MiB written')
+
+    figure, (left, right) = plt.subplots(1, 2, figsize=(12, 4.8))
+    left.bar(labels, times)
+    left.set_title('Export Time')
+    left.set_ylabel('Time (s)')
+    right.bar(labels, peaks)
+    right.set_title('Peak Python Memory')
+    right.set_ylabel('MiB')
+    figure.tight_layout()
+    plt.show()
+
+def evaluate_subject_access(total_app, hist_size, engine, num_requests=500, workers=(1, 2, 4, 8), seed=-1, indexes=None):
+    """
+    Answer the same subject access requests with growing numbers of workers, first without and then
+    with init.access_indexes, and plot the throughput.
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_requests (int): Number of applicants to report on per run.
+    - workers (tuple): Numbers of concurrent workers to test.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - indexes (dict): Index definitions to create besides access_indexes (default is None, no extra indexes).
+
+    Returns:
+    None
+    """
+    seed_all(seed)
+    print(f'Subject access test [num_app={total_app}, num_hist={hist_size}, num_requests={num_requests}]')
+    init(engine, total_app, hist_size, indexes=indexes)
+    with engine.connect() as connection:
+        applicant_ids = [row[0] for row in connection.execute(text('SELECT applicant_id FROM applicant_details ORDER BY random() LIMIT :n;'),
+                                                              {"n": num_requests})]
+    for indexed in (False, True):
+        if indexed:
+            db.create_indexes(db.access_indexes, engine)
+        throughput = []
+        for count in workers:
+            reports, stats = subject_access_batch(applicant_ids, engine, workers=count, handle=lambda report: None)
+            throughput.append(stats['requests_per_second'])
+            print(f'\t{"indexed" if indexed else "no index"} workers={count}: {round(stats["requests_per_second"], 1)} requests/s, '
+                  f'{stats["actions"]} actions, p99 {round(stats["latency"]["p99"] * 1000, 3)} ms, {stats["errors"]} errors')
+        plt.plot(workers, throughput, marker='o', label='access_indexes' if indexed else 'no access indexes')
+    db.drop_indexes(db.access_indexes, engine)
+
+    plt.title('Subject Access Throughput')
+    plt.xlabel('Workers')
+    plt.ylabel('Requests per Second')
+    plt.legend()
     plt.grid(True)
     plt.show()
 
-def evaluate_hist(total_app, hist_inc, engine, num_steps=4, num_iter=5, seed=-1):
+def evaluate_hist(total_app, hist_inc, engine, num_steps=4, num_iter=5, seed=-1, indexes=None):
     avg_times = []
     step = int(total_app * hist_inc)
     step_sizes = range(total_app + step, total_app + (step * num_steps) + 1, step)
     for n in range(1,num_steps + 1):
-        avg_time = timed_test(total_app, hist_inc * n, num_iter, True, engine, seed=seed)
+        avg_time = timed_test(total_app, hist_inc * n, num_iter, True, engine, seed=seed, indexes=indexes)
         avg_time *= 1000
         print(f'\tAverage: {round(avg_time, 3)}ms')
         avg_times.append(avg_time)
     
     plt.plot(step_sizes, avg_times, marker='o')
-    plt.title(f'Performance Relative to Action History size({total_app} applicants)')
+    plt.title(f'Performance Relative to Action History size({total_app} applicants){" (indexed)" if indexes else ""}')
     plt.xlabel('History Size:')
     plt.ylabel('Average Time (ms)')
     plt.grid(True)
     plt.show()
 
-def batch_evaluate(total_app, hist_size, num_deletes, is_sequential, engine, num_steps = 4, num_iter=5, init_db=False):
-    step_size = num_deletes // num_steps
-    test_sizes = range(step_size, num_deletes + 1, step_size)
-    avg_times = []
-    
-    if init_db:
-        # test set up
-        if seed > 0:
-            random.seed(seed)
-        
-        n = int(total_app * hist_size) - (2 * num_iter)
-        print(f"Batch {' (Sequential)' if is_sequential else ''} test num_app={total_app}, num_hist={hist_size * total_app}, num_del={num_deletes} num_iter={num_iter}  num_steps={num_steps}")
+def evaluate_layouts(total_app, hist_inc, engine, num_steps=4, num_iter=5, seed=-1, indexes=None):
+    """
+    Compare column erasure on the key=value string and JSONB layouts of action_history.new_data
+    across the same history sizes as evaluate_hist().
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_inc (float): History size increment relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of history sizes to test.
+    - num_iter (int): Number of iterations for each test.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+
+    Returns:
+    None
+    """
+    step = int(total_app * hist_inc)
+    step_sizes = range(total_app + step, total_app + (step * num_steps) + 1, step)
+    for layout in db.HistoryLayout:
+        avg_times = []
+        for n in range(1,num_steps + 1):
+            avg_time = timed_test(total_app, hist_inc * n, num_iter, True, engine, seed=seed, layout=layout, indexes=indexes)
+            avg_time *= 1000
+            print(f'\tAverage: {round(avg_time, 3)}ms')
+            avg_times.append(avg_time)
+        plt.plot(step_sizes, avg_times, marker='o', label=layout.value)
+
+    plt.title(f'new_data Layout Performance Relative to Action History size({total_app} applicants){" (indexed)" if indexes else ""}')
+    plt.xlabel('History Size:')
+    plt.ylabel('Average Time (ms)')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+def evaluate_partitioning(total_app, hist_inc, engine, num_steps=4, num_iter=5, seed=-1, partitions=8, indexes=None):
+    """
+    Compare column erasure on a flat action_history with hash partitioning on data_id and range
+    partitioning on time across the same history sizes as evaluate_hist().
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_inc (float): History size increment relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of history sizes to test.
+    - num_iter (int): Number of iterations for each test.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - partitions (int): Number of partitions (default is 8).
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+
+    Returns:
+    None
+    """
+    step = int(total_app * hist_inc)
+    step_sizes = range(total_app + step, total_app + (step * num_steps) + 1, step)
+    for partitioning in db.HistoryPartitioning:
+        avg_times = []
+        for n in range(1,num_steps + 1):
+            avg_time = timed_test(total_app, hist_inc * n, num_iter, True, engine, seed=seed, indexes=indexes,
+                                  partitioning=partitioning, partitions=partitions)
+            avg_time *= 1000
+            print(f'\tAverage: {round(avg_time, 3)}ms')
+            avg_times.append(avg_time)
+        plt.plot(step_sizes, avg_times, marker='o', label=partitioning.value)
+
+    plt.title(f'action_history Partitioning ({partitions} partitions) Relative to History size({total_app} applicants){" (indexed)" if indexes else ""}')
+    plt.xlabel('History Size:')
+    plt.ylabel('Average Time (ms)')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+def evaluate_indexes(total_app, hist_size, engine, num_steps=4, num_iter=5, seed=-1):
+    """
+    Run the data size benchmark with and without db.default_indexes and print how often each index was used.
+
+    Parameters:
+    - total_app (int): Largest number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of data sizes to test.
+    - num_iter (int): Number of iterations for each test.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
 
+    Returns:
+    None
+    """
+    evaluate(total_app, hist_size, engine, num_steps=num_steps, num_iter=num_iter, seed=seed)
+    evaluate(total_app, hist_size, engine, num_steps=num_steps, num_iter=num_iter, seed=seed, indexes=db.default_indexes)
+    print(db.index_usage(engine).to_string(index=False))
+
+def batch_setup(total_app, hist_size, num_deletes, engine, num_iter=5, seed=-1, indexes=None, fixtures=None):
+    """
+    Rebuild the database and history for the batch tests and pick the applicants to erase.
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - num_deletes (int): Number of applicants to pick.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_iter (int): Number of iterations the history is sized for.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+    - fixtures (FixtureCache): Restore the populated database from this cache instead of rebuilding it when it has been built before (default is None).
+
+    Returns:
+    list: Indexes of the picked applicants, each with two residence_city updates in its history.
+    """
+    seed_all(seed)
+    n = max(int(total_app * hist_size) - (2 * num_iter), 0)
+
+    def build():
         print('Initializing db...', end='')
-        init(engine, total_app)
-        
+        init(engine, total_app, indexes=indexes)
+
         print('Populating action history...')
         selected_ids = random.choices(get_ids(engine), k=num_deletes)
         for i in selected_ids:
             for _ in range(2):
-                db.update_data(None, 'residence_city', Faker().city(),engine, index=i)
-        random_actions(engine, n, selected_ids)
+                db.update_data(None, 'residence_city', value_generators.batch('residence_city', 1)[0],engine, index=i)
+        random_actions(engine, n, selected_ids, bulk=True)
+        return selected_ids
+
+    return load_fixture(fixtures, build, kind='batch', num_app=total_app, num_hist=hist_size, victims=num_deletes,
+                        num_iter=num_iter, seed=seed, layout=db.HistoryLayout.string.value, indexes=sorted(indexes or {}))
+
+def batch_evaluate(total_app, hist_size, num_deletes, is_sequential, engine, num_steps = 4, num_iter=5, init_db=False, indexes=None, seed=-1, isolate=False):
+    """
+    Measure batch column deletion for an increasing number of deletions.
+
+    Parameters:
+    - total_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - num_deletes (int): Largest number of deletions in a batch.
+    - is_sequential (bool, BatchMode or list): The column_batch_delete mode, or a list of modes plotted together.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - num_steps (int): Number of batch sizes to test.
+    - num_iter (int): Number of iterations for each batch size.
+    - init_db (bool): Rebuild the database and history before testing.
+    - indexes (dict): Index definitions to create when init_db is set (default is None, no extra indexes).
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - isolate (bool): Restore applicant_details and action_history to their state before the test ahead of every batch (default is False).
+
+    Returns:
+    None
+    """
+    step_size = num_deletes // num_steps
+    test_sizes = range(step_size, num_deletes + 1, step_size)
+    modes = is_sequential if isinstance(is_sequential, list) else [is_sequential]
+    modes = [m if isinstance(m, db.BatchMode) else db.BatchMode.sequential if m else db.BatchMode.single_query for m in modes]
+    
+    if init_db:
+        print(f"Batch ({', '.join(m.value for m in modes)}) test num_app={total_app}, num_hist={hist_size * total_app}, num_del={num_deletes} num_iter={num_iter}  num_steps={num_steps}")
+        selected_ids = batch_setup(total_app, hist_size, num_deletes, engine, num_iter=num_iter, seed=seed, indexes=indexes)
     else:
+        seed_all(seed)
         selected_ids = random.choices(get_ids(engine), k=num_deletes)
+    snapshot = TableSnapshot(engine) if isolate else None
             
-    i = 1
-    for size in test_sizes:
-        print(f'[iter={str(i) + "/"+ str(num_steps)} num_delete={size}]')
-        avg_time = batch_timed_test(num_iter, is_sequential, selected_ids[:size])
-        #avg_time *= 1000
-        print(f'\tAverage: {round(avg_time, 3)}s')
-        avg_times.append(avg_time)
-        i += 1
+    for mode in modes:
+        avg_times = []
+        i = 1
+        for size in test_sizes:
+            print(f'[mode={mode.value} iter={str(i) + "/"+ str(num_steps)} num_delete={size}]')
+            avg_time = batch_timed_test(num_iter, mode, selected_ids[:size], engine, snapshot=snapshot)
+            #avg_time *= 1000
+            print(f'\tAverage: {round(avg_time, 3)}s')
+            avg_times.append(avg_time)
+            i += 1
+        plt.plot(test_sizes, avg_times, marker='o', label=mode.value)
     
        # Plotting the results
-    plt.plot(test_sizes, avg_times, marker='o')
-    s = ' (sequential)' if is_sequential else ''
-    plt.title(f'Batch{s} Deletion Performance')
+    s = f' ({modes[0].value})' if len(modes) == 1 else ''
+    if snapshot is not None:
+        print(f'Average restore: {round(snapshot.summary()["mean"], 3)}s')
+        snapshot.drop()
+    plt.title(f'Batch{s} Deletion Performance{" (indexed)" if indexes else ""}')
     plt.xlabel('Number of Deletions')
     plt.ylabel('Average Time (s)')
+    if len(modes) > 1:
+        plt.legend()
     plt.grid(True)
     plt.show()
 
@@ -368,7 +1063,27 @@ if __name__ == '__main__':
     evaluate(100000, .5, engine, num_iter=10, num_steps=4, seed=seed)
     # history performance test
     evaluate_hist(2000, 1, engine, num_steps=8, num_iter=10, seed=seed)
-    # batch test
-    batch_evaluate(100000, 1, 75000, False, engine, num_steps=5, num_iter=10, init_db=True)
-    # sequential batch test
-    batch_evaluate(100000, 1, 75000, True, engine, num_steps=5, num_iter=10, init_db=False)
\ No newline at end of file
+    # VACUUM FULL per deletion vs deferred vacuum
+    evaluate_vacuum(100000, .5, engine, num_iter=10, num_steps=4, seed=seed)
+    # with vs without the index set
+    evaluate_indexes(100000, .5, engine, num_iter=10, num_steps=4, seed=seed)
+    # string vs jsonb history layout test
+    evaluate_layouts(2000, 1, engine, num_steps=8, num_iter=10, seed=seed)
+    # history rewrite vs crypto-shredding
+    evaluate_shredding(20000, .5, engine, num_steps=4, num_iter=10, seed=seed)
+    # batched hard deletes of soft deleted applicants
+    evaluate_purger(100000, .5, engine, seed=seed, indexes={**db.default_indexes, **db.purge_indexes})
+    # streaming exports vs fetching the whole history
+    evaluate_export(100000, 5, engine, seed=seed)
+    # subject access reports with and without their indexes
+    evaluate_subject_access(100000, 5, engine, num_requests=500, seed=seed, indexes=db.default_indexes)
+    # flat vs hash and range partitioned action_history
+    evaluate_partitioning(20000, 1, engine, num_steps=4, num_iter=10, seed=seed, indexes=db.default_indexes)
+    # single query, sequential and set based batch tests
+    batch_evaluate(100000, 1, 75000, list(db.BatchMode), engine, num_steps=5, num_iter=10, init_db=True, seed=seed)
+    # one delete_row per applicant vs delete_rows
+    row_batch_evaluate(100000, 1, 20000, engine, num_steps=5, num_iter=5, seed=seed, indexes=db.default_indexes)
+    # erasure latency and contention with concurrent workers
+    evaluate_concurrency(20000, .5, engine, workers=(1, 2, 4, 8), duration=30, num_erasures=20, seed=seed)
+    # tail latency at increasing offered loads
+    evaluate_open_loop(20000, .5, engine, rates=(25, 50, 100, 200, 400, 800), duration=20, seed=seed)
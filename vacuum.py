@@ -0,0 +1,226 @@
+import threading
+from datetime import datetime
+from sqlalchemy import text
+import init as db
+
+erasure_tables = ('applicant_details', 'action_history')
+
+
+class VacuumScheduler:
+    """
+    Defers VACUUM until a table is bloated or an erasure has waited too long.
+
+    Erasures are recorded with record_erasure() instead of running VACUUM FULL right away. check()
+    reads dead and live tuple counts from pg_stat_user_tables and:
+    - runs VACUUM FULL on a table that has an erasure older than max_age seconds, because only a
+      rewrite guarantees the erased bytes are physically gone from the heap;
+    - runs plain VACUUM (or VACUUM FULL if full is set) on a table whose dead tuples pass both
+      min_dead and dead_ratio.
+    check() can be called after each erasure or from a background thread with start().
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - tables (tuple): Tables to watch. Default is applicant_details and action_history.
+    - dead_ratio (float): Fraction of dead tuples that makes a table due for VACUUM. Default is 0.2.
+    - min_dead (int): Minimum number of dead tuples before the ratio is considered. Default is 1000.
+    - max_age (float): Seconds an erasure may wait before VACUUM FULL is forced. Default is 60.
+    - full (bool): Use VACUUM FULL for bloat as well as for erasure age. Default is False.
+    """
+
+    def __init__(self, engine, tables=erasure_tables, dead_ratio=0.2, min_dead=1000, max_age=60.0, full=False):
+        self.engine = engine
+        self.tables = tuple(tables)
+        self.dead_ratio = dead_ratio
+        self.min_dead = min_dead
+        self.max_age = max_age
+        self.full = full
+        self.history = []
+        self._pending = {}          # table -> times of erasures not yet rewritten, oldest first
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record_erasure(self, tables=None, when=None):
+        """
+        Note that erased values may still be on disk in the given tables.
+
+        Parameters:
+        - tables (list, optional): Tables the erasure touched. Defaults to every watched table.
+        - when (datetime, optional): Time of the erasure. Defaults to now.
+
+        Returns:
+        None
+        """
+        when = datetime.now() if when is None else when
+        with self._lock:
+            for table in self.tables if tables is None else tables:
+                self._pending.setdefault(table, []).append(when)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def erasure_done(self, tables=None):
+        """
+        Record an erasure and, unless the background thread is handling it, check thresholds right away.
+
+        Parameters:
+        - tables (list, optional): Tables the erasure touched. Defaults to every watched table.
+
+        Returns:
+        dict: Table name mapped to the kind of vacuum that was run.
+        """
+        self.record_erasure(tables)
+        if self.running:
+            return {}
+        return self.check()
+
+    def stats(self):
+        """
+        Read tuple counts and vacuum history for the watched tables, per partition for a partitioned table.
+
+        Returns:
+        dict: Table (or partition) name mapped to a dict of n_live_tup, n_dead_tup, last_vacuum, last_autovacuum and vacuum_count.
+        """
+        with self.engine.connect() as connection:
+            result = connection.execute(text('''SELECT relname, n_live_tup, n_dead_tup, last_vacuum, last_autovacuum, vacuum_count
+                FROM pg_stat_user_tables
+                WHERE relid IN (SELECT p.relid FROM unnest(CAST(:tables AS text[])) t, pg_partition_tree(to_regclass(t)) p WHERE p.isleaf);'''),
+                {"tables": list(self.tables)})
+            return {row[0]: dict(row._mapping) for row in result}
+
+    def due(self, now=None):
+        """
+        Decide which tables need compaction.
+
+        Parameters:
+        - now (datetime, optional): Time to measure erasure age against. Defaults to now.
+
+        Returns:
+        dict: Table name mapped to 'full' or 'plain'.
+        """
+        now = datetime.now() if now is None else now
+        plan = {}
+        with self._lock:
+            pending = {table: times[0] for table, times in self._pending.items()}
+        for table, first in pending.items():
+            if (now - first).total_seconds() >= self.max_age:
+                plan[table] = 'full'
+        for table, row in self.stats().items():
+            if table in plan:
+                continue
+            dead = row['n_dead_tup'] or 0
+            total = dead + (row['n_live_tup'] or 0)
+            if dead >= self.min_dead and total > 0 and dead / total >= self.dead_ratio:
+                plan[table] = 'full' if self.full else 'plain'
+        return plan
+
+    def check(self):
+        """
+        Vacuum every table that due() reports.
+
+        Returns:
+        dict: Table name mapped to the kind of vacuum that was run.
+        """
+        plan = self.due()
+        for table, kind in plan.items():
+            self.vacuum(table, full=kind == 'full')
+        return plan
+
+    def flush(self):
+        """
+        VACUUM FULL every table with a pending erasure, whatever its age.
+
+        Returns:
+        list: Tables that were vacuumed.
+        """
+        with self._lock:
+            tables = list(self._pending.keys())
+        for table in tables:
+            self.vacuum(table, full=True)
+        return tables
+
+    def vacuum(self, table, full=False):
+        """
+        Run VACUUM or VACUUM FULL on one table and record it in history.
+
+        Parameters:
+        - table (str): The table to vacuum.
+        - full (bool): Rewrite the table with VACUUM FULL. Default is False.
+
+        Returns:
+        float: Seconds the vacuum took.
+        """
+        started = datetime.now()
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text(f'VACUUM {"FULL " if full else ""}"{table}";'))
+        finished = datetime.now()
+        with self._lock:
+            # only erasures recorded before the rewrite started are guaranteed to be gone
+            if full and table in self._pending:
+                remaining = [when for when in self._pending[table] if when > started]
+                if remaining:
+                    self._pending[table] = remaining
+                else:
+                    del self._pending[table]
+        seconds = (finished - started).total_seconds()
+        self.history.append({"table": table, "full": full, "start": started, "seconds": seconds})
+        db.dprint(f'VACUUM {"FULL " if full else ""}{table} took {round(seconds, 3)}s')
+        return seconds
+
+    def erased_before(self):
+        """
+        The compliance point: every erasure recorded before the returned time has been physically
+        removed by a table rewrite.
+
+        Returns:
+        datetime: The oldest pending erasure time, or now if nothing is pending.
+        """
+        with self._lock:
+            return min((times[0] for times in self._pending.values()), default=datetime.now())
+
+    def pending(self):
+        """
+        Tables holding erased values that have not been rewritten yet.
+
+        Returns:
+        dict: Table name mapped to the time of its oldest pending erasure.
+        """
+        with self._lock:
+            return {table: times[0] for table, times in self._pending.items()}
+
+    def start(self, interval=5.0):
+        """
+        Run check() every interval seconds in a background thread.
+
+        Parameters:
+        - interval (float): Seconds between checks. Default is 5.
+
+        Returns:
+        None
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='vacuum-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread started by start().
+
+        Returns:
+        None
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception as error:
+                print(f'Vacuum scheduler check failed: {error}')
@@ -0,0 +1,164 @@
+import numpy as np
+from faker import Faker
+import init as db
+
+# integer columns drawn uniformly from [low, high]
+integer_ranges = {
+    "annual_income": (10000, 10000000),
+    "applicant_age": (21, 79),
+    "work_experience": (0, 20),
+    "years_in_current_employment": (0, 15),
+    "years_in_current_residence": (0, 15),
+}
+
+# columns whose new value is the other one of two values
+toggles = {
+    "marital_status": ('single', 'married'),
+    "house_ownership": ('rented', 'owned'),
+    "vehicle_ownership": ('no', 'yes'),
+    "loan_default_risk": (False, True),
+}
+
+
+def clean_occupation(value):
+    """
+    Make a Faker job fit the occupation column: no quotes, at most 40 characters, cut at the first comma if too long.
+
+    Parameters:
+    - value (str): The generated job.
+
+    Returns:
+    str: The cleaned value.
+    """
+    value = value.replace("'", "")
+    if len(value) > 40:
+        x = value.split(',')
+        if len(x) > 1:
+            value = x[0]
+        value = value[:40]
+    return value
+
+
+class ValueGenerators:
+    """
+    Registry of new-value generators for the updatable columns of data_schema.
+
+    Faker is only used once, to fill a pool of pool_size cleaned values for each text column;
+    after that every value is drawn from a seeded NumPy generator. Integer columns are drawn with
+    rng.integers() and toggled columns flip the current value. batch() returns N values for a
+    column in one call, value() is a drop-in replacement for test.gen_new_value().
+
+    Parameters:
+    - seed (int, optional): Seed for the pools and the random generator.
+    - pool_size (int): Number of values pre-generated for each text column. Default is 1000.
+    """
+
+    def __init__(self, seed=None, pool_size=1000):
+        self.pool_size = pool_size
+        self.generators = {}
+        self.pools = {}
+        for column, (low, high) in integer_ranges.items():
+            self.register(column, self._integers(low, high))
+        for column, pair in toggles.items():
+            self.register(column, self._toggle(column, pair))
+        self.register('occupation', self._pool('occupation'))
+        self.register('residence_city', self._pool('residence_city'))
+        self.register('residence_state', self._pool('residence_state'))
+        self.seed(seed)
+
+    def register(self, column, generator):
+        """
+        Add or replace the generator for a column.
+
+        Parameters:
+        - column (str): A column of data_schema.
+        - generator (callable): generator(n, current) returns n new values; current is the list of
+                                the n current values of the column, or None if they are unknown.
+
+        Returns:
+        None
+        """
+        if column not in db.data_schema:
+            raise ValueError(f"Unknown column '{column}'")
+        self.generators[column] = generator
+
+    def seed(self, seed):
+        """
+        Restart the random generator and rebuild the text pools from a seed.
+
+        Parameters:
+        - seed (int): The new seed.
+
+        Returns:
+        None
+        """
+        self.rng = np.random.default_rng(seed)
+        fake = Faker()
+        # Faker's random only takes plain ints, not the NumPy integers synthesize_history draws
+        fake.seed_instance(None if seed is None else int(seed))
+        self.pools = {
+            'occupation': np.array([clean_occupation(fake.job()) for _ in range(self.pool_size)], dtype=object),
+            'residence_city': np.array([fake.city().replace("'", "")[:50] for _ in range(self.pool_size)], dtype=object),
+            'residence_state': np.array([fake.state().replace("'", "")[:50] for _ in range(self.pool_size)], dtype=object),
+        }
+
+    def batch(self, column, n, current=None):
+        """
+        Generate n new values for a column at once.
+
+        Parameters:
+        - column (str): The column being modified.
+        - n (int): Number of values.
+        - current (list, optional): The n current values, used by toggled columns.
+
+        Returns:
+        list: n new values, as Python ints, strs or bools.
+        """
+        if column not in self.generators:
+            raise ValueError(f"No value generator for column '{column}'")
+        return self.generators[column](n, current)
+
+    def batch_many(self, counts):
+        """
+        Generate values for several columns at once.
+
+        Parameters:
+        - counts (dict): Column mapped to the number of values needed.
+
+        Returns:
+        dict: Column mapped to a list of new values.
+        """
+        return {column: self.batch(column, n) for column, n in counts.items()}
+
+    def value(self, column, data):
+        """
+        Generate one new value for a column of an account row.
+
+        Parameters:
+        - column (str): The column being modified.
+        - data (tuple): The account row, as returned by get_random_account().
+
+        Returns:
+        any: The new value.
+        """
+        current = [data[list(db.data_schema.keys()).index(column) + 1]] if column in toggles else None
+        return self.batch(column, 1, current)[0]
+
+    def _integers(self, low, high):
+        def generate(n, current):
+            return self.rng.integers(low, high + 1, size=n).tolist()
+        return generate
+
+    def _toggle(self, column, pair):
+        def generate(n, current):
+            if current is None:
+                return [pair[i] for i in self.rng.integers(2, size=n)]
+            # same rule as before: anything but the first value becomes the first value
+            return [pair[1] if value == pair[0] else pair[0] for value in current]
+        return generate
+
+    def _pool(self, column):
+        def generate(n, current):
+            pool = self.pools[column]
+            return pool[self.rng.integers(len(pool), size=n)].tolist()
+        return generate
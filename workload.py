@@ -0,0 +1,283 @@
+import multiprocessing
+import queue
+import random
+import threading
+import time
+import matplotlib.pyplot as plt
+import numpy as np
+from sqlalchemy import text
+import init as db
+
+erasure_kinds = ('column', 'row')
+
+
+def worker_engine():
+    """
+    Engine for a worker process. Spawned processes import init afresh, so the history layout and
+    partitioning the parent set up are read back from the database instead of left at their defaults.
+
+    Returns:
+    sqlalchemy.engine.base.Engine: The new engine.
+    """
+    engine = db.engine()
+    db.HISTORY_LAYOUT = db.detect_history_layout(engine)
+    db.HISTORY_PARTITIONING = db.detect_history_partitioning(engine)
+    return engine
+
+
+def action_worker(worker_id, duration, seed, blacklist, start, results):
+    """
+    Run the random_action() mix on its own engine until duration seconds have passed.
+    Runs in a child process started by run_workload().
+
+    Parameters:
+    - worker_id (int): Number of the worker, added to the seed.
+    - duration (float): Seconds to run for once start is set.
+    - seed (int): Seed for random and the samplers (ignored if < 1).
+    - blacklist (list): Account indexes the worker leaves alone.
+    - start (multiprocessing.Event): Set by the parent when every process is ready.
+    - results (multiprocessing.Queue): Receives one dict of counts, latencies and errors per operation.
+
+    Returns:
+    None
+    """
+    import test
+    if seed > 0:
+        random.seed(seed + worker_id)
+        test.employee_sampler.seed(seed + worker_id)
+        test.applicant_sampler.seed(seed + worker_id)
+        test.value_generators.seed(seed + worker_id)
+    engine = worker_engine()
+    counts = {}
+    latencies = {}
+    errors = {}
+    start.wait()
+    s_time = time.perf_counter()
+    while time.perf_counter() - s_time < duration:
+        a_time = time.perf_counter()
+        try:
+            operation = test.random_action(engine, blacklist=blacklist).value
+        except Exception as error:
+            # deadlocks, or rows deleted under us by the erasure worker
+            name = type(getattr(error, 'orig', error)).__name__
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        counts[operation] = counts.get(operation, 0) + 1
+        latencies.setdefault(operation, []).append(time.perf_counter() - a_time)
+    elapsed = time.perf_counter() - s_time
+    engine.dispose()
+    results.put({"worker": worker_id, "elapsed": elapsed, "counts": counts, "latencies": latencies, "errors": errors})
+
+
+def erasure_worker(kind, victims, interval, vacuum, start, results):
+    """
+    Erase one victim every interval seconds on its own engine and time each erasure.
+    Runs in a child process started by run_workload().
+
+    Parameters:
+    - kind (str): 'column' for remove_column_for_applicant() or 'row' for delete_row().
+    - victims (list of tuple): (index, applicant_id) of the applicants to erase.
+    - interval (float): Seconds between the start of two erasures.
+    - vacuum (bool): Run VACUUM FULL on both tables as part of every erasure.
+    - start (multiprocessing.Event): Set by the parent when every process is ready.
+    - results (multiprocessing.Queue): Receives a dict with the erasure latencies.
+
+    Returns:
+    None
+    """
+    engine = worker_engine()
+    latencies = []
+    errors = {}
+    start.wait()
+    s_time = time.perf_counter()
+    for i, (index, applicant_id) in enumerate(victims):
+        delay = s_time + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        e_time = time.perf_counter()
+        try:
+            if kind == 'column':
+                db.remove_column_for_applicant('residence_city', index, engine, vacuum=vacuum)
+            else:
+                db.delete_row(applicant_id, engine)
+                if vacuum:
+                    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                        connection.execute(text('VACUUM FULL applicant_details;'))
+                        connection.execute(text('VACUUM FULL action_history;'))
+        except Exception as error:
+            name = type(getattr(error, 'orig', error)).__name__
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - e_time)
+    engine.dispose()
+    results.put({"worker": 'erasure', "latencies": latencies, "errors": errors})
+
+
+def sample_locks(engine, stop, samples, interval=0.1):
+    """
+    Poll pg_stat_activity and pg_locks until stop is set.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - stop (threading.Event): Set to end the sampling.
+    - samples (list): Receives a (waiting backends, ungranted locks) tuple per poll.
+    - interval (float): Seconds between polls. Default is 0.1.
+
+    Returns:
+    None
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        while not stop.wait(interval):
+            waiting = connection.execute(text('''SELECT count(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND wait_event_type = 'Lock';''')).scalar()
+            ungranted = connection.execute(text('SELECT count(*) FROM pg_locks WHERE NOT granted;')).scalar()
+            samples.append((waiting, ungranted))
+
+
+def run_workload(engine, num_workers, duration, victims, erasure='column', vacuum=True, seed=-1, blacklist=None, lock_interval=0.1):
+    """
+    Run num_workers processes of random actions while one more process erases victims, and
+    sample lock waits from the parent.
+
+    Parameters:
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection (used for lock sampling).
+    - num_workers (int): Number of action worker processes, each with its own engine.
+    - duration (float): Seconds the action workers run for.
+    - victims (list of tuple): (index, applicant_id) of the applicants to erase, spread over duration.
+    - erasure (str): 'column' or 'row'. Default is 'column'.
+    - vacuum (bool): Run VACUUM FULL on both tables as part of every erasure. Default is True.
+    - seed (int): Seed for the workers (default is -1, ignored if < 1).
+    - blacklist (list, optional): Account indexes the action workers leave alone.
+    - lock_interval (float): Seconds between lock samples. Default is 0.1.
+
+    Returns:
+    dict: 'throughput' (operation -> ops/sec over all workers), 'total_throughput', 'latency'
+          (operation -> mean seconds), 'errors', 'erasure' (count, mean, p95 and max seconds, errors)
+          and 'locks' (mean and max waiting backends, max ungranted locks).
+    """
+    if erasure not in erasure_kinds:
+        raise ValueError(f"Unknown erasure kind '{erasure}', expected one of {erasure_kinds}")
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    interval = duration / (len(victims) + 1)
+    processes = [context.Process(target=action_worker, args=(i, duration, seed, blacklist or [], start, results))
+                 for i in range(num_workers)]
+    processes.append(context.Process(target=erasure_worker, args=(erasure, victims, interval, vacuum, start, results)))
+    for process in processes:
+        process.start()
+
+    samples = []
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_locks, args=(engine, stop, samples, lock_interval), daemon=True)
+    sampler.start()
+    start.set()
+
+    reports = []
+    while len(reports) < len(processes):
+        try:
+            reports.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+    for process in processes:
+        process.join()
+    stop.set()
+    sampler.join()
+
+    counts = {}
+    latencies = {}
+    errors = {}
+    erasures = {"latencies": [], "errors": {}}
+    for report in reports:
+        if report['worker'] == 'erasure':
+            erasures = report
+            continue
+        for operation, n in report['counts'].items():
+            counts[operation] = counts.get(operation, 0) + n / report['elapsed']
+            latencies.setdefault(operation, []).extend(report['latencies'][operation])
+        for name, n in report['errors'].items():
+            errors[name] = errors.get(name, 0) + n
+
+    erasure_times = np.array(erasures['latencies'])
+    waiting = np.array([s[0] for s in samples]) if samples else np.zeros(1)
+    ungranted = np.array([s[1] for s in samples]) if samples else np.zeros(1)
+    return {"throughput": counts,
+            "total_throughput": sum(counts.values()),
+            "latency": {operation: float(np.mean(times)) for operation, times in latencies.items()},
+            "errors": errors,
+            "erasure": {"count": len(erasure_times),
+                        "mean": float(erasure_times.mean()) if len(erasure_times) else None,
+                        "p95": float(np.percentile(erasure_times, 95)) if len(erasure_times) else None,
+                        "max": float(erasure_times.max()) if len(erasure_times) else None,
+                        "errors": erasures['errors']},
+            "locks": {"mean_waiting": float(waiting.mean()),
+                      "max_waiting": int(waiting.max()),
+                      "max_ungranted": int(ungranted.max())}}
+
+
+def evaluate_concurrency(num_app, hist_size, engine, workers=(1, 2, 4, 8), duration=10.0, num_erasures=10, erasure='column', vacuum=True, seed=-1, indexes=None):
+    """
+    Sweep the number of concurrent workers and plot throughput, erasure latency and lock waits.
+
+    Parameters:
+    - num_app (int): Number of applicants to use in test.
+    - hist_size (float): Number of history records relative to number of applicants.
+    - engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine for database connection.
+    - workers (tuple): Numbers of action workers to run. Default is 1, 2, 4 and 8.
+    - duration (float): Seconds each run lasts. Default is 10.
+    - num_erasures (int): Number of erasures per run. Default is 10.
+    - erasure (str): 'column' or 'row'. Default is 'column'.
+    - vacuum (bool): Run VACUUM FULL on both tables as part of every erasure. Default is True.
+    - seed (int): Seed for random number generation (default is -1, ignored if < 1)
+    - indexes (dict): Index definitions to create (default is None, no extra indexes).
+
+    Returns:
+    list: The run_workload() result for each number of workers.
+    """
+    import test
+    runs = []
+    for k in workers:
+        if seed > 0:
+            random.seed(seed)
+        print(f'Concurrency test [workers={k}, num_app={num_app}, num_hist={hist_size}, erasure={erasure}, vacuum={vacuum}]')
+        test.init(engine, num_app, hist_size, indexes=indexes)
+        with engine.connect() as connection:
+            rows = connection.execute(text('SELECT index, applicant_id FROM applicant_details WHERE is_deleted = false;')).all()
+        victims = [tuple(row) for row in random.sample(rows, min(num_erasures, len(rows)))]
+        # keep the action workers off the applicants being erased
+        result = run_workload(engine, k, duration, victims, erasure=erasure, vacuum=vacuum, seed=seed,
+                              blacklist=[index for index, _ in victims])
+        print(f'\t{round(result["total_throughput"], 1)} ops/sec, erasure mean {round((result["erasure"]["mean"] or 0) * 1000, 3)}ms, '
+              f'max lock waiters {result["locks"]["max_waiting"]}, errors {result["errors"]}')
+        runs.append(result)
+
+    operations = sorted(set(operation for run in runs for operation in run['throughput']))
+    for operation in operations:
+        plt.plot(workers, [run['throughput'].get(operation, 0) for run in runs], marker='o', label=operation)
+    plt.plot(workers, [run['total_throughput'] for run in runs], marker='o', label='total')
+    plt.title(f'Throughput under {erasure} erasure ({int(100 + hist_size * 100)}% History Size)')
+    plt.xlabel('Number of Workers')
+    plt.ylabel('Operations per Second')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+    plt.plot(workers, [(run['erasure']['mean'] or 0) * 1000 for run in runs], marker='o', label='mean')
+    plt.plot(workers, [(run['erasure']['p95'] or 0) * 1000 for run in runs], marker='o', label='p95')
+    plt.title(f'{erasure.capitalize()} erasure latency under load{" (VACUUM FULL)" if vacuum else ""}')
+    plt.xlabel('Number of Workers')
+    plt.ylabel('Erasure Time (ms)')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+    plt.plot(workers, [run['locks']['mean_waiting'] for run in runs], marker='o', label='mean waiting')
+    plt.plot(workers, [run['locks']['max_waiting'] for run in runs], marker='o', label='max waiting')
+    plt.title('Backends waiting on locks')
+    plt.xlabel('Number of Workers')
+    plt.ylabel('Backends')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+    return runs